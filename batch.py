@@ -0,0 +1,196 @@
+import numpy as np
+
+from compiled import compile_model, encode_emissions, transition_cells
+from instrument import phase, stats_enabled, tally
+from viterbi import backpointer_dtype
+
+
+def pack_sequences(sequences, symbol_to_index):
+    sequences = list(sequences)
+    offsets = np.zeros(len(sequences) + 1, dtype=np.intp)
+    np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+    if sequences and all(isinstance(sequence, str) for sequence in sequences):
+        codes = encode_emissions("".join(sequences), symbol_to_index)
+    elif sequences:
+        codes = np.concatenate([encode_emissions(sequence, symbol_to_index) for sequence in sequences])
+    else:
+        codes = np.empty(0, dtype=np.intp)
+    return codes, offsets
+
+def unpack_sequences(codes, offsets, symbol_to_index):
+    index_to_symbol = [None] * len(symbol_to_index)
+    for symbol, index in symbol_to_index.items():
+        index_to_symbol[index] = symbol
+    symbols = [index_to_symbol[i] for i in codes.tolist()]
+    return ["".join(symbols[offsets[i]:offsets[i+1]]) for i in range(len(offsets) - 1)]
+
+def sequence_lengths(offsets):
+    return np.diff(offsets)
+
+def sequence_ids(offsets):
+    lengths = sequence_lengths(offsets)
+    return np.repeat(np.arange(len(lengths)), lengths)
+
+def pad_sequences(codes, offsets):
+    # Longest sequences first, so the rows still running at column t are always a prefix.
+    lengths = sequence_lengths(offsets)
+    order = np.argsort(-lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    max_length = int(sorted_lengths[0]) if len(sorted_lengths) else 0
+    columns = np.arange(max_length)
+    rows, cols = np.nonzero(columns[None, :] < sorted_lengths[:, None])
+    padded = np.zeros((len(order), max_length), dtype=codes.dtype)
+    padded[rows, cols] = codes[offsets[order][rows] + cols]
+    active = len(order) - np.searchsorted(sorted_lengths[::-1], columns, side="right")
+    return order, padded, active
+
+def unpad_sequences(padded, order, offsets):
+    sorted_lengths = sequence_lengths(offsets)[order]
+    rows, cols = np.nonzero(np.arange(padded.shape[1])[None, :] < sorted_lengths[:, None])
+    codes = np.empty(offsets[-1], dtype=padded.dtype)
+    codes[offsets[order][rows] + cols] = padded[rows, cols]
+    return codes
+
+
+def viterbi_batch(codes, offsets, state_matrix, emission_matrix, model=None):
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix)
+    order, padded, active = pad_sequences(codes, offsets)
+    n_seqs, max_length = padded.shape
+    n_states = model.n_states
+    log_emission_cols = model.log_emission_cols
+    symbol_scores = model.symbol_score_array
+    tally("columns", len(codes))
+    tally("cells", len(codes) * n_states * n_states)
+    backtrack_graph = np.zeros((max_length, n_seqs, n_states), dtype=backpointer_dtype(n_states))
+    dp_cols = np.tile(model.log_start, (n_seqs, 1))
+    if max_length:
+        dp_cols += log_emission_cols[padded[:, 0]]
+    with phase("columns"):
+        for i in range(1, max_length):
+            n = active[i]
+            scores = dp_cols[:n, :, None] + symbol_scores[padded[:n, i]]
+            backtrack_graph[i, :n] = scores.argmax(axis=1)
+            dp_cols[:n] = scores.max(axis=1)
+    best_final_states = dp_cols.argmax(axis=1)
+    best_scores = dp_cols[np.arange(n_seqs), best_final_states]
+    best_scores[active[0] if max_length else 0:] = 0.0
+
+    best_paths = np.zeros((n_seqs, max_length), dtype=np.intp)
+    curr_states = np.zeros(n_seqs, dtype=np.intp)
+    rows = np.arange(n_seqs)
+    with phase("traceback"):
+        for i in range(max_length - 1, -1, -1):
+            n_running = active[i+1] if i + 1 < max_length else 0
+            if n_running:
+                curr_states[:n_running] = backtrack_graph[i+1, rows[:n_running], curr_states[:n_running]]
+            curr_states[n_running:active[i]] = best_final_states[n_running:active[i]]
+            best_paths[:active[i], i] = curr_states[:active[i]]
+
+    log_likelihoods = np.empty(n_seqs)
+    log_likelihoods[order] = best_scores
+    return log_likelihoods, unpad_sequences(best_paths, order, offsets)
+
+def compute_path_probability_batch(codes, offsets, state_matrix, emission_matrix, model=None):
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix)
+    order, padded, active = pad_sequences(codes, offsets)
+    n_seqs, max_length = padded.shape
+    state_matrix = model.forward_transitions
+    emission_cols = model.emission_cols
+    tally("columns", len(codes))
+    tally("cells", len(codes) * transition_cells(state_matrix))
+    log_scales = np.zeros(n_seqs)
+    dp_cols = np.tile(model.start, (n_seqs, 1))
+    with phase("columns"):
+        for i in range(max_length):
+            n = active[i]
+            if i == 0:
+                dp_cols[:n] *= emission_cols[padded[:n, 0]]
+            else:
+                dp_cols[:n] = (dp_cols[:n] @ state_matrix) * emission_cols[padded[:n, i]]
+            scales = dp_cols[:n].sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                log_scales[:n] += np.log(scales)
+                dp_cols[:n] /= np.where(scales > 0, scales, 1.0)[:, None]
+    if stats_enabled():
+        tally("underflows", np.count_nonzero(np.isneginf(log_scales)))
+    log_likelihoods = np.empty(n_seqs)
+    log_likelihoods[order] = log_scales
+    return log_likelihoods
+
+def forward_backward_batch(codes, offsets, state_matrix, emission_matrix, model=None):
+    # (log_likelihoods, posteriors), posteriors being (len(codes), K) in packed order. The
+    # padded alpha of the whole batch is kept, max_length x n_seqs x K, so this is meant
+    # for request-sized batches; long sequences go through prob_path.forward_backward.
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix)
+    order, padded, active = pad_sequences(codes, offsets)
+    n_seqs, max_length = padded.shape
+    state_matrix = model.forward_transitions
+    emission_cols = model.emission_cols
+    tally("columns", 2 * len(codes))
+    tally("cells", 2 * len(codes) * transition_cells(state_matrix))
+    alpha = np.zeros((max_length, n_seqs, model.n_states))
+    scales = np.ones((max_length, n_seqs))
+    with phase("columns"):
+        for i in range(max_length):
+            n = active[i]
+            if i == 0:
+                dp_cols = model.start * emission_cols[padded[:n, 0]]
+            else:
+                dp_cols = (alpha[i-1, :n] @ state_matrix) * emission_cols[padded[:n, i]]
+            scales[i, :n] = dp_cols.sum(axis=1)
+            alpha[i, :n] = dp_cols / np.where(scales[i, :n] > 0, scales[i, :n], 1.0)[:, None]
+        # Each row's beta starts at 1 in its last column; rows are longest first, so the
+        # ones still running at column i+1 are a prefix of those running at i.
+        posteriors = np.empty((len(codes), model.n_states))
+        beta = np.ones((n_seqs, model.n_states))
+        starts = offsets[:-1][order]
+        for i in range(max_length - 1, -1, -1):
+            n = active[i]
+            m = active[i+1] if i + 1 < max_length else 0
+            if m:
+                weighted = emission_cols[padded[:m, i+1]] * beta[:m]
+                next_scales = np.where(scales[i+1, :m] > 0, scales[i+1, :m], 1.0)
+                beta[:m] = (state_matrix @ weighted.T).T / next_scales[:, None]
+            beta[m:n] = 1.0
+            posteriors[starts[:n] + i] = alpha[i, :n] * beta[:n]
+    with np.errstate(divide="ignore"):
+        log_scales = np.log(scales).sum(axis=0)
+    if stats_enabled():
+        tally("underflows", np.count_nonzero(np.isneginf(log_scales)))
+    log_likelihoods = np.empty(n_seqs)
+    log_likelihoods[order] = log_scales
+    return log_likelihoods, posteriors
+
+def get_string_probability_batch(state_codes, emission_codes, offsets, emission_matrix, model=None):
+    # emission_matrix is emissions x states, as string_given_path.py reads it; it is
+    # transposed into the compiled model's states x emissions, which every scorer indexes.
+    if model is None:
+        model = compile_model(None, np.asarray(emission_matrix).T)
+    return np.bincount(sequence_ids(offsets), 
+                       weights=model.log_emission_matrix[state_codes, emission_codes], 
+                       minlength=len(offsets) - 1)
+
+def get_hidden_path_probability_batch(state_codes, offsets, state_matrix, start=None, model=None):
+    # start is the initial state distribution, uniform 1/K by default.
+    if model is None:
+        model = compile_model(state_matrix, None, start=start)
+    log_state_matrix = model.log_state_matrix
+    # Drop the pairs that straddle two sequences.
+    within = np.ones(max(len(state_codes) - 1, 0), dtype=bool)
+    starts = offsets[1:-1]
+    within[starts[(starts > 0) & (starts < len(state_codes))] - 1] = False
+    seq_ids = sequence_ids(offsets)
+    log_probs = np.bincount(seq_ids[1:][within], 
+                            weights=log_state_matrix[state_codes[:-1], state_codes[1:]][within], 
+                            minlength=len(offsets) - 1).astype(np.float64)
+    nonempty = sequence_lengths(offsets) > 0
+    log_probs[nonempty] += model.log_start[state_codes[offsets[:-1][nonempty]]]
+    return log_probs
+
+def get_joint_probability_batch(state_codes, emission_codes, offsets, model):
+    # log P(x, pi) per packed (path, string) pair; model holds both matrices, states x emissions.
+    return get_hidden_path_probability_batch(state_codes, offsets, None, model=model) + \
+        get_string_probability_batch(state_codes, emission_codes, offsets, None, model=model)
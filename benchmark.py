@@ -0,0 +1,513 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import string
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def random_model(n_states, n_emissions, rng):
+    states = [f"S{i}" for i in range(n_states)] if n_states > 26 else list(string.ascii_uppercase[:n_states])
+    emissions = list(string.ascii_lowercase[:n_emissions])
+    state_matrix = rng.random((n_states, n_states))
+    state_matrix /= state_matrix.sum(axis=1, keepdims=True)
+    emission_matrix = rng.random((n_states, n_emissions))
+    emission_matrix /= emission_matrix.sum(axis=1, keepdims=True)
+    state_to_index = {state: i for i, state in enumerate(states)}
+    emission_to_index = {emission: i for i, emission in enumerate(emissions)}
+    return states, emissions, state_matrix, emission_matrix, state_to_index, emission_to_index
+
+def random_emission_string(length, emissions, rng):
+    return "".join(rng.choice(emissions, length))
+
+def random_hidden_path(length, states, rng):
+    # Multi-character state labels cannot be packed into one string, so larger models
+    # get the path as state codes, which every scorer also accepts.
+    codes = rng.integers(0, len(states), length)
+    if all(len(state) == 1 for state in states):
+        return "".join(np.array(states)[codes]) if length else ""
+    return codes
+
+def random_records(n_records, length, emissions, rng):
+    for i in range(n_records):
+        yield f"seq{i}", "".join(rng.choice(emissions, length))
+
+
+def random_alignment(n_rows, n_cols, alphabet, max_gap_rate, rng):
+    symbols = np.frombuffer("".join(alphabet).encode("latin-1"), dtype=np.uint8)
+    alignment = symbols[rng.integers(0, len(symbols), (n_rows, n_cols))]
+    alignment[rng.random((n_rows, n_cols)) < rng.random(n_cols) * max_gap_rate] = ord("-")
+    return alignment
+
+
+def bench_parallel(n_records, length, n_states, n_emissions, worker_counts, chunk_size, mode, seed):
+    from parallel import decode_records
+
+    rng = np.random.default_rng(seed)
+    _, emissions, state_matrix, emission_matrix, state_to_index, emission_to_index = \
+        random_model(n_states, n_emissions, rng)
+    records = list(random_records(n_records, length, emissions, rng))
+    results = []
+    for workers in worker_counts:
+        start = time.perf_counter()
+        for _ in decode_records(records, state_matrix, emission_matrix, state_to_index,
+                                emission_to_index, mode=mode, workers=workers, chunk_size=chunk_size):
+            pass
+        elapsed = time.perf_counter() - start
+        results.append({"workers": workers, "seconds": elapsed,
+                        "symbols_per_second": n_records * length / elapsed})
+    for row in results:
+        row["speedup"] = results[0]["seconds"] / row["seconds"]
+    return results
+
+
+def measure_viterbi_memory(length, n_states, n_emissions, checkpointed, seed):
+    from compiled import log_matrix
+    from viterbi import viterbi_log, viterbi_checkpointed
+
+    rng = np.random.default_rng(seed)
+    _, _, state_matrix, emission_matrix, _, _ = random_model(n_states, n_emissions, rng)
+    encoded = rng.integers(0, n_emissions, length, dtype=np.uint8)
+    log_start = np.full(n_states, -np.log(n_states))
+    decoder = viterbi_checkpointed if checkpointed else viterbi_log
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    decoder(encoded, log_start, log_matrix(state_matrix), log_matrix(emission_matrix))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"length": length, "states": n_states, "checkpointed": checkpointed, "seconds": elapsed,
+            "peak_rss_kb": peak, "decode_rss_kb": peak - baseline}
+
+def bench_checkpoint(lengths, n_states, n_emissions, seed):
+    # Every measurement runs in a fresh interpreter so ru_maxrss is not shared between runs.
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for length in lengths:
+        for checkpointed in (False, True):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(measure_viterbi_memory, length, n_states,
+                                               n_emissions, checkpointed, seed).result())
+    return results
+
+def bench_priors(lengths, n_rows, n_components, repeats, seed):
+    from profile_core import ProfileCalculator, NoPrior, PseudocountPrior, DirichletMixturePrior
+
+    rng = np.random.default_rng(seed)
+    alphabet = list("ACDEFGHIKLMNPQRSTVWY")
+    priors = {
+        "none": NoPrior(),
+        "pseudocount": PseudocountPrior(0.01),
+        "dirichlet_mixture": DirichletMixturePrior(np.full(n_components, 1.0 / n_components),
+                                                   rng.gamma(1.0, 1.0, (n_components, len(alphabet)))),
+    }
+    results = []
+    for length in lengths:
+        alignment = random_alignment(n_rows, length, alphabet, 0.6, rng)
+        calculator = ProfileCalculator(alignment, alphabet, 0.35)
+        calculator.count_transitions()
+        for name, prior in priors.items():
+            calculator.prior = prior
+            start = time.perf_counter()
+            for _ in range(repeats):
+                calculator.probabilities()
+            elapsed = (time.perf_counter() - start) / repeats
+            results.append({"columns": length, "match_states": calculator.match_count,
+                            "prior": name, "seconds": elapsed})
+    return results
+
+def bench_profile_scaling(n_rows, n_cols, worker_counts, gap_rate, seed):
+    from profile_core import ProfileCalculator
+    from parallel_profile import sharded_calculator
+
+    rng = np.random.default_rng(seed)
+    alphabet = list("ACDEFGHIKLMNPQRSTVWY")
+    alignment = random_alignment(n_rows, n_cols, alphabet, gap_rate, rng)
+    start = time.perf_counter()
+    serial = ProfileCalculator(alignment, alphabet, 0.35).calculate()
+    serial_seconds = time.perf_counter() - start
+    results = [{"workers": 0, "seconds": serial_seconds, "speedup": 1.0, "identical": True}]
+    for workers in worker_counts:
+        start = time.perf_counter()
+        sharded = sharded_calculator(alignment, alphabet, 0.35, workers=workers).calculate()
+        elapsed = time.perf_counter() - start
+        results.append({"workers": workers, "seconds": elapsed, "speedup": serial_seconds / elapsed,
+                        "identical": sharded == serial})
+    return results
+
+def bench_time_parallel(length, n_states, n_emissions, worker_counts, seed):
+    from compiled import compile_model
+    from viterbi import viterbi_log
+    from prob_path import forward, log_probability
+    from time_parallel import viterbi_scan, forward_scan
+
+    rng = np.random.default_rng(seed)
+    _, _, state_matrix, emission_matrix, _, _ = random_model(n_states, n_emissions, rng)
+    model = compile_model(state_matrix, emission_matrix)
+    encoded = rng.integers(0, n_emissions, length)
+    start = time.perf_counter()
+    serial_path, serial_score = viterbi_log(encoded, model.log_start, model.log_state_matrix,
+                                            model.log_emission_matrix, symbol_scores=model.symbol_scores)
+    viterbi_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    serial_log_prob = log_probability(forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1])
+    forward_seconds = time.perf_counter() - start
+    results = []
+    for workers in worker_counts:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            best_path, score = viterbi_scan(encoded, model.log_start, model.log_emission_matrix,
+                                            model.symbol_score_array, executor, workers)
+            scan_viterbi_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            log_prob = forward_scan(encoded, model.start, model.state_matrix, model.emission_cols, executor, workers)
+            scan_forward_seconds = time.perf_counter() - start
+        results.append({"workers": workers,
+                        "viterbi_seconds": scan_viterbi_seconds, "viterbi_speedup": viterbi_seconds / scan_viterbi_seconds,
+                        "forward_seconds": scan_forward_seconds, "forward_speedup": forward_seconds / scan_forward_seconds,
+                        "path_agreement": float(np.mean(best_path == serial_path)),
+                        "score_difference": abs(score - serial_score),
+                        "log_probability_difference": abs(log_prob - serial_log_prob)})
+    return results
+
+def dict_viterbi(emission_path, state_matrix, emission_matrix, state_to_index, emission_to_index, states):
+    # The dict-of-dicts decoder viterbi.py replaced, kept as the speedup baseline. Same
+    # per-cell Python loop and lookups, in log space so long inputs do not underflow; the
+    # emission is added to each transition first, as in viterbi.get_symbol_scores.
+    dp_array, backtrack_graph = {}, {}
+    log_start = np.log(1.0 / len(states))
+    for i, emission in enumerate(emission_path):
+        e = emission_to_index[emission]
+        for state in states:
+            s = state_to_index[state]
+            log_emission = np.log(emission_matrix[s, e])
+            if i == 0:
+                dp_array[i, state] = log_start + log_emission
+                continue
+            best_prev, best_score = None, -np.inf
+            for prev in states:
+                score = dp_array[i - 1, prev] + (np.log(state_matrix[state_to_index[prev], s]) + log_emission)
+                if score > best_score:
+                    best_prev, best_score = prev, score
+            dp_array[i, state] = best_score
+            backtrack_graph[i, state] = best_prev
+    last = len(emission_path) - 1
+    state = max(states, key=lambda state: dp_array[last, state])
+    path = [state]
+    for i in range(last, 0, -1):
+        state = backtrack_graph[i, state]
+        path.append(state)
+    return "".join(path[::-1])
+
+# Speedup the vectorized decoder is expected to reach over dict_viterbi on long inputs.
+VITERBI_TARGET_SPEEDUP = 100
+
+def bench_viterbi(length, state_counts, n_emissions, reference_length, seed):
+    # The NumPy engine costs one fixed run of array calls per column whatever K is, so
+    # for small K it is barely faster than the dict loop; the target holds for small K
+    # only with HMM_KERNEL_BACKEND=numba. dict_viterbi is linear in the length and runs
+    # on a reference_length prefix, its time scaled up to the full length.
+    from kernels import get_backend
+    from viterbi import viterbi
+
+    results = []
+    for n_states in state_counts:
+        rng = np.random.default_rng([seed, n_states])
+        states, emissions, state_matrix, emission_matrix, state_to_index, emission_to_index = \
+            random_model(n_states, n_emissions, rng)
+        emission_path = random_emission_string(length, emissions, rng)
+        prefix = emission_path[:reference_length]
+        start = time.perf_counter()
+        expected = dict_viterbi(prefix, state_matrix, emission_matrix, state_to_index, emission_to_index, states)
+        reference_seconds = (time.perf_counter() - start) * length / len(prefix)
+        agrees = viterbi(prefix, state_matrix, emission_matrix, state_to_index, emission_to_index,
+                         states, emissions) == expected
+        start = time.perf_counter()
+        viterbi(emission_path, state_matrix, emission_matrix, state_to_index, emission_to_index, states, emissions)
+        seconds = time.perf_counter() - start
+        speedup = reference_seconds / seconds
+        results.append({"states": n_states, "length": length, "backend": get_backend(),
+                        "reference_seconds": reference_seconds, "seconds": seconds, "speedup": speedup,
+                        "meets_target": speedup >= VITERBI_TARGET_SPEEDUP, "paths_agree": agrees})
+    return results
+
+def low_entropy_sequence(kind, length, n_emissions, rng):
+    # "tandem": one short motif repeated with 1% point mutations; "interspersed": copies
+    # of a few longer elements with 5% mutations between stretches of random sequence;
+    # "random": uniform symbols, the worst case for phrase reuse.
+    if kind == "random":
+        return rng.integers(0, n_emissions, length)
+    if kind == "tandem":
+        sequence = np.resize(rng.integers(0, n_emissions, 50), length)
+        mutation_rate = 0.01
+    else:
+        elements = [rng.integers(0, n_emissions, int(rng.integers(300, 3000))) for _ in range(4)]
+        pieces, total = [], 0
+        while total < length:
+            piece = elements[rng.integers(len(elements))] if rng.random() < 0.8 else \
+                rng.integers(0, n_emissions, int(rng.integers(50, 500)))
+            pieces.append(piece)
+            total += len(piece)
+        sequence = np.concatenate(pieces)[:length]
+        mutation_rate = 0.05
+    mutated = rng.random(length) < mutation_rate
+    sequence[mutated] = rng.integers(0, n_emissions, int(mutated.sum()))
+    return sequence
+
+def bench_compressed(length, n_states, n_emissions, kinds, seed):
+    from compiled import compile_model
+    from viterbi import viterbi_log
+    from prob_path import forward, log_probability
+    from compressed import viterbi_lz, forward_lz, lz78_parse, PhraseCache
+
+    rng = np.random.default_rng(seed)
+    _, _, state_matrix, emission_matrix, _, _ = random_model(n_states, n_emissions, rng)
+    model = compile_model(state_matrix, emission_matrix)
+    results = []
+    for kind in kinds:
+        encoded = low_entropy_sequence(kind, length, n_emissions, rng)
+        phrases, _, _ = lz78_parse(encoded[1:])
+        start = time.perf_counter()
+        serial_path, serial_score = viterbi_log(encoded, model.log_start, model.log_state_matrix,
+                                                model.log_emission_matrix, symbol_scores=model.symbol_scores)
+        viterbi_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        serial_log_prob = log_probability(forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1])
+        forward_seconds = time.perf_counter() - start
+        viterbi_cache, forward_cache = PhraseCache(), PhraseCache()
+        row = {"input": kind, "length": length, "phrases": len(phrases), "mean_phrase_length": (length - 1) / max(len(phrases), 1),
+               "viterbi_seconds": viterbi_seconds, "forward_seconds": forward_seconds}
+        # cold: empty phrase caches; warm: the same input again with the caches filled.
+        for run in ("cold", "warm"):
+            start = time.perf_counter()
+            best_path, score = viterbi_lz(encoded, model.log_start, model.log_emission_matrix,
+                                          model.symbol_score_array, viterbi_cache)
+            row[f"compressed_viterbi_{run}_seconds"] = time.perf_counter() - start
+            start = time.perf_counter()
+            log_prob = forward_lz(encoded, model.start, model.state_matrix, model.emission_cols, forward_cache)
+            row[f"compressed_forward_{run}_seconds"] = time.perf_counter() - start
+        row.update(viterbi_speedup=viterbi_seconds / row["compressed_viterbi_cold_seconds"],
+                   forward_speedup=forward_seconds / row["compressed_forward_cold_seconds"],
+                   path_agreement=float(np.mean(best_path == serial_path)),
+                   score_difference=abs(score - serial_score),
+                   log_probability_difference=abs(log_prob - serial_log_prob))
+        results.append(row)
+    return results
+
+
+SWEEP_TARGETS = ("viterbi", "forward", "string", "hidden", "profile")
+# Result fields that identify a configuration, for comparing two sweep files.
+CASE_FIELDS = ("target", "length", "states", "emissions", "rows", "columns")
+
+def hmm_case(target, length, n_states, n_emissions, rng):
+    from viterbi import viterbi
+    from prob_path import compute_path_probability
+    from string_given_path import get_string_probability
+    from hidden_path import get_hidden_path_probability
+
+    states, emissions, state_matrix, emission_matrix, state_to_index, emission_to_index = \
+        random_model(n_states, n_emissions, rng)
+    emission_path = random_emission_string(length, emissions, rng)
+    hidden_path = random_hidden_path(length, states, rng)
+    if target == "viterbi":
+        return lambda: viterbi(emission_path, state_matrix, emission_matrix, state_to_index,
+                               emission_to_index, states, emissions)
+    if target == "forward":
+        return lambda: compute_path_probability(emission_path, state_matrix, emission_matrix, state_to_index,
+                                                emission_to_index, states)
+    if target == "string":
+        # string_given_path.py takes the emission matrix as emissions x states.
+        emission_matrix = emission_matrix.T.copy()
+        return lambda: get_string_probability(hidden_path, state_to_index, emission_to_index,
+                                              emission_path, emission_matrix)
+    return lambda: get_hidden_path_probability(hidden_path, state_to_index, state_matrix)
+
+def profile_case(n_rows, n_cols, gap_rate, rng):
+    from profile_core import ProfileCalculator
+
+    alphabet = list("ACDEFGHIKLMNPQRSTVWY")
+    alignment = random_alignment(n_rows, n_cols, alphabet, gap_rate, rng)
+    return lambda: ProfileCalculator(alignment, alphabet, 0.35).calculate()
+
+def measure(run, repeats):
+    # Best-of-repeats wall time after one warm-up call (which also fills the compiled
+    # model cache), then one more call under tracemalloc for the peak allocation.
+    run()
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(seconds), peak
+
+def bench_sweep(targets, lengths, state_counts, emission_counts, row_counts, column_counts,
+                gap_rate, repeats, seed):
+    results = []
+    for target in targets:
+        if target == "profile":
+            cases = [{"rows": n_rows, "columns": n_cols} for n_rows, n_cols in itertools.product(row_counts, column_counts)]
+        else:
+            cases = [{"length": length, "states": n_states, "emissions": n_emissions}
+                     for length, n_states, n_emissions in itertools.product(lengths, state_counts, emission_counts)]
+        for case in cases:
+            # Each configuration gets its own stream, so adding cases never reshuffles others.
+            rng = np.random.default_rng([seed] + list(case.values()))
+            if target == "profile":
+                run = profile_case(case["rows"], case["columns"], gap_rate, rng)
+                n_symbols = case["rows"] * case["columns"]
+            else:
+                run = hmm_case(target, case["length"], case["states"], case["emissions"], rng)
+                n_symbols = case["length"]
+            seconds, peak = measure(run, repeats)
+            results.append({"target": target, **case, "seconds": seconds,
+                            "symbols_per_second": n_symbols / seconds if seconds > 0 else None,
+                            "peak_bytes": peak})
+    return results
+
+def sweep_meta(seed, repeats):
+    from kernels import get_backend
+
+    return {"seed": seed, "repeats": repeats, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "platform": platform.platform(), "kernel_backend": get_backend(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+def compare_sweeps(baseline, current):
+    # Ratios above 1 mean the current run is slower or larger than the baseline.
+    def key(row):
+        return tuple(row.get(field) for field in CASE_FIELDS)
+
+    baseline_rows = {key(row): row for row in baseline["results"]}
+    comparison = []
+    for row in current["results"]:
+        base = baseline_rows.get(key(row))
+        if base is None:
+            continue
+        comparison.append({**{field: row[field] for field in CASE_FIELDS if field in row},
+                           "seconds_ratio": row["seconds"] / base["seconds"] if base["seconds"] else None,
+                           "peak_bytes_ratio": row["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else None})
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parallel_parser = subparsers.add_parser("parallel")
+    parallel_parser.add_argument("--records", type=int, default=2000)
+    parallel_parser.add_argument("--length", type=int, default=500)
+    parallel_parser.add_argument("--states", type=int, default=4)
+    parallel_parser.add_argument("--emissions", type=int, default=4)
+    parallel_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parallel_parser.add_argument("--chunk-size", type=int, default=64)
+    parallel_parser.add_argument("--mode", choices=["viterbi", "forward"], default="viterbi")
+    parallel_parser.add_argument("--seed", type=int, default=0)
+
+    checkpoint_parser = subparsers.add_parser("checkpoint")
+    checkpoint_parser.add_argument("--lengths", type=int, nargs="+", default=[10**4, 10**5, 10**6])
+    checkpoint_parser.add_argument("--states", type=int, default=4)
+    checkpoint_parser.add_argument("--emissions", type=int, default=4)
+    checkpoint_parser.add_argument("--seed", type=int, default=0)
+
+    priors_parser = subparsers.add_parser("priors")
+    priors_parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1000, 10000])
+    priors_parser.add_argument("--rows", type=int, default=200)
+    priors_parser.add_argument("--components", type=int, default=9)
+    priors_parser.add_argument("--repeats", type=int, default=3)
+    priors_parser.add_argument("--seed", type=int, default=0)
+
+    # workers 0 in the output is the serial ProfileCalculator build.
+    scaling_parser = subparsers.add_parser("profile-scaling")
+    scaling_parser.add_argument("--rows", type=int, default=10**6)
+    scaling_parser.add_argument("--columns", type=int, default=100)
+    scaling_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    scaling_parser.add_argument("--gap-rate", type=float, default=0.6)
+    scaling_parser.add_argument("--seed", type=int, default=0)
+
+    viterbi_parser = subparsers.add_parser("viterbi")
+    viterbi_parser.add_argument("--length", type=int, default=10**6)
+    viterbi_parser.add_argument("--states", type=int, nargs="+", default=[2, 4, 8, 16, 32])
+    viterbi_parser.add_argument("--emissions", type=int, default=4)
+    viterbi_parser.add_argument("--reference-length", type=int, default=2 * 10**4)
+    viterbi_parser.add_argument("--backend", choices=["numpy", "numba", "auto"])
+    viterbi_parser.add_argument("--seed", type=int, default=0)
+
+    time_parallel_parser = subparsers.add_parser("time-parallel")
+    time_parallel_parser.add_argument("--length", type=int, default=10**6)
+    time_parallel_parser.add_argument("--states", type=int, default=2)
+    time_parallel_parser.add_argument("--emissions", type=int, default=4)
+    time_parallel_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    time_parallel_parser.add_argument("--seed", type=int, default=0)
+
+    compressed_parser = subparsers.add_parser("compressed")
+    compressed_parser.add_argument("--length", type=int, default=10**6)
+    compressed_parser.add_argument("--states", type=int, default=2)
+    compressed_parser.add_argument("--emissions", type=int, default=4)
+    compressed_parser.add_argument("--inputs", nargs="+", choices=["tandem", "interspersed", "random"],
+                                   default=["tandem", "interspersed", "random"])
+    compressed_parser.add_argument("--seed", type=int, default=0)
+
+    sweep_parser = subparsers.add_parser("sweep")
+    sweep_parser.add_argument("--targets", nargs="+", choices=SWEEP_TARGETS, default=list(SWEEP_TARGETS))
+    sweep_parser.add_argument("--lengths", type=int, nargs="+", default=[10**3, 10**4, 10**5])
+    sweep_parser.add_argument("--states", type=int, nargs="+", default=[2, 8, 32])
+    sweep_parser.add_argument("--emissions", type=int, nargs="+", default=[4, 20])
+    sweep_parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000])
+    sweep_parser.add_argument("--columns", type=int, nargs="+", default=[100, 1000])
+    sweep_parser.add_argument("--gap-rate", type=float, default=0.6)
+    sweep_parser.add_argument("--repeats", type=int, default=3)
+    sweep_parser.add_argument("--seed", type=int, default=0)
+    sweep_parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    sweep_parser.add_argument("--backend", choices=["numpy", "numba", "auto"], help="kernel backend to sweep with")
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    args = parser.parse_args()
+    if args.command == "parallel":
+        results = bench_parallel(args.records, args.length, args.states, args.emissions,
+                                 args.workers, args.chunk_size, args.mode, args.seed)
+    elif args.command == "checkpoint":
+        results = bench_checkpoint(args.lengths, args.states, args.emissions, args.seed)
+    elif args.command == "priors":
+        results = bench_priors(args.lengths, args.rows, args.components, args.repeats, args.seed)
+    elif args.command == "profile-scaling":
+        results = bench_profile_scaling(args.rows, args.columns, args.workers, args.gap_rate, args.seed)
+    elif args.command == "viterbi":
+        if args.backend:
+            from kernels import set_backend
+            set_backend(args.backend)
+        results = bench_viterbi(args.length, args.states, args.emissions, args.reference_length, args.seed)
+        missed = [row["states"] for row in results if not row["meets_target"]]
+        if missed:
+            print(f"{VITERBI_TARGET_SPEEDUP}x target missed for K={missed} on the {results[0]['backend']} "
+                  f"backend; small K needs HMM_KERNEL_BACKEND=numba", file=sys.stderr)
+    elif args.command == "time-parallel":
+        results = bench_time_parallel(args.length, args.states, args.emissions, args.workers, args.seed)
+    elif args.command == "compressed":
+        results = bench_compressed(args.length, args.states, args.emissions, args.inputs, args.seed)
+    elif args.command == "sweep":
+        if args.backend:
+            from kernels import set_backend
+            set_backend(args.backend)
+        results = {"meta": sweep_meta(args.seed, args.repeats),
+                   "results": bench_sweep(args.targets, args.lengths, args.states, args.emissions,
+                                          args.rows, args.columns, args.gap_rate, args.repeats, args.seed)}
+        if args.output:
+            with open(args.output, "wt") as output_file:
+                json.dump(results, output_file, indent=2)
+    elif args.command == "compare":
+        with open(args.baseline, "rt") as baseline_file, open(args.current, "rt") as current_file:
+            results = compare_sweeps(json.load(baseline_file), json.load(current_file))
+    if args.command != "sweep" or not args.output:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,341 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+from instrument import phased, tally
+
+CACHE_SIZE = 64
+ROW_SUM_TOLERANCE = 1e-6
+# (min states, max fraction of nonzero transitions) from which the sparse kernels beat
+# the dense ones. The dense forward step is a BLAS mat-vec, so it holds out much longer
+# than the dense Viterbi step.
+SPARSE_VITERBI = (128, 0.1)
+SPARSE_FORWARD = (1024, 0.05)
+
+
+class SparseTransitions:
+    # Transition matrix kept as its nonzero edges, in CSR form by source state (indptr,
+    # indices, data as in scipy.sparse.csr_matrix). Edges are stored sorted by target, so
+    # each state's predecessors are one contiguous segment.
+    # Setting __array_ufunc__ to None makes ndarray @ SparseTransitions defer to __rmatmul__,
+    # so the forward/backward recursions run on it unchanged.
+    __array_ufunc__ = None
+
+    def __init__(self, indptr, indices, data, n_states=None):
+        indptr = np.asarray(indptr, dtype=np.intp)
+        self.n_states = len(indptr) - 1 if n_states is None else n_states
+        sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        targets = np.asarray(indices, dtype=np.intp)
+        weights = np.asarray(data, dtype=np.float64)
+        order = np.lexsort((sources, targets))
+        self.sources = sources[order]
+        self.targets = targets[order]
+        self.weights = weights[order]
+        with np.errstate(divide="ignore"):
+            self.log_weights = np.log(self.weights)
+        in_degree = np.bincount(self.targets, minlength=self.n_states)
+        self.reachable = np.flatnonzero(in_degree)
+        self.segment_lengths = in_degree[self.reachable]
+        self.segment_starts = np.concatenate([[0], np.cumsum(self.segment_lengths)[:-1]]).astype(np.intp)
+        # The same edges grouped by source, for T @ v.
+        self.by_source = np.lexsort((self.targets, self.sources))
+        out_degree = np.bincount(self.sources, minlength=self.n_states)
+        self.emitting = np.flatnonzero(out_degree)
+        self.source_starts = np.concatenate([[0], np.cumsum(out_degree[self.emitting])[:-1]]).astype(np.intp)
+
+    @classmethod
+    def from_dense(cls, state_matrix):
+        sources, targets = np.nonzero(state_matrix)
+        indptr = np.zeros(len(state_matrix) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(sources, minlength=len(state_matrix)), out=indptr[1:])
+        return cls(indptr, targets, state_matrix[sources, targets], len(state_matrix))
+
+    @property
+    def nnz(self):
+        return len(self.weights)
+
+    @property
+    def density(self):
+        return self.nnz / max(self.n_states * self.n_states, 1)
+
+    def row_sums(self):
+        return np.bincount(self.sources, weights=self.weights, minlength=self.n_states)
+
+    def to_dense(self):
+        dense = np.zeros((self.n_states, self.n_states))
+        dense[self.sources, self.targets] = self.weights
+        return dense
+
+    def symbol_scores(self, log_emission_matrix):
+        # Per symbol, the log weight of every edge plus its target's log emission: the
+        # sparse counterpart of the dense K x K symbol score matrices.
+        return list(self.log_weights[None, :] + log_emission_matrix[self.targets].T)
+
+    def __rmatmul__(self, vectors):
+        # vectors @ T for a (..., K) array, one segment sum per reachable target state.
+        result = np.zeros(vectors.shape[:-1] + (self.n_states,))
+        if self.nnz:
+            result[..., self.reachable] = np.add.reduceat(vectors[..., self.sources] * self.weights,
+                                                          self.segment_starts, axis=-1)
+        return result
+
+    def __matmul__(self, vectors):
+        # T @ vectors for a (K,) or (K, m) array, one segment sum per source state.
+        result = np.zeros((self.n_states,) + vectors.shape[1:])
+        if self.nnz:
+            edges = self.by_source
+            weights = self.weights[edges].reshape((-1,) + (1,) * (vectors.ndim - 1))
+            result[self.emitting] = np.add.reduceat(weights * vectors[self.targets[edges]],
+                                                    self.source_starts, axis=0)
+        return result
+
+
+class SymbolScores(list):
+    # Per-symbol K x K score matrices, which index faster from a list one column at a
+    # time, that keep their (|Sigma|, K, K) stack for the JIT kernel.
+    def __init__(self, stack):
+        super().__init__(stack)
+        self.stack = stack
+
+
+class CompiledModel:
+    # Everything the evaluators derive from (state_matrix, emission_matrix) before the
+    # first DP column, computed once. state_matrix is K x K, emission_matrix is K x |Sigma|;
+    # either may be None for scorers that only need the other one. state_matrix may also
+    # be a SparseTransitions, which never builds the dense K x K matrix at all.
+    # sparse=None picks the sparse kernels by size and density (see SPARSE_VITERBI and
+    # SPARSE_FORWARD); True/False forces them on or off.
+    def __init__(self, state_matrix, emission_matrix, state_to_index=None, emission_to_index=None, start=None,
+                 sparse=None):
+        if isinstance(state_matrix, SparseTransitions):
+            self.transitions = state_matrix
+            self.state_matrix = None
+        else:
+            self.transitions = None
+            self.state_matrix = as_model_array(state_matrix)
+        self.emission_matrix = as_model_array(emission_matrix)
+        n_states = model_size(self.state_matrix, self.transitions, self.emission_matrix)
+        check_shapes(self.state_matrix, self.emission_matrix, state_to_index, emission_to_index, n_states)
+        self.n_states = n_states
+        self.state_to_index = state_to_index
+        self.emission_to_index = emission_to_index
+        self.state_table = encoding_table(state_to_index) if state_to_index else None
+        self.emission_table = encoding_table(emission_to_index) if emission_to_index else None
+        self.index_to_state = index_labels(state_to_index)
+
+        self.start = np.full(n_states, 1.0 / n_states) if start is None else as_model_array(start)
+        self.log_start = log_matrix(self.start)
+        self._log_state_matrix = None
+        if self.state_matrix is not None:
+            self._log_state_matrix = log_matrix(self.state_matrix)
+            self.log_state_matrix_t = np.ascontiguousarray(self.log_state_matrix.T)
+            density = np.count_nonzero(self.state_matrix) / (n_states * n_states)
+            if sparse is None:
+                self.sparse_viterbi = n_states >= SPARSE_VITERBI[0] and density <= SPARSE_VITERBI[1]
+                self.sparse_forward = n_states >= SPARSE_FORWARD[0] and density <= SPARSE_FORWARD[1]
+            else:
+                self.sparse_viterbi = self.sparse_forward = bool(sparse)
+            if self.sparse_viterbi or self.sparse_forward:
+                self.transitions = SparseTransitions.from_dense(self.state_matrix)
+        else:
+            self.sparse_viterbi = self.sparse_forward = self.transitions is not None
+        # What the DP engines take as their transition argument: a dense matrix, or the
+        # SparseTransitions, which carries both its weights and their logs.
+        if self.state_matrix is not None or self.transitions is not None:
+            self.forward_transitions = self.transitions if self.sparse_forward else self.state_matrix
+            self.viterbi_transitions = self.transitions if self.sparse_viterbi else self.log_state_matrix
+        if self.emission_matrix is not None:
+            # Row s of the *_cols arrays is the emission column of symbol s over all states.
+            self.emission_cols = np.ascontiguousarray(self.emission_matrix.T)
+            self.log_emission_matrix = log_matrix(self.emission_matrix)
+            self.log_emission_cols = np.ascontiguousarray(self.log_emission_matrix.T)
+        self.problems = validate_model(self.state_matrix, self.emission_matrix, self.start)
+        if self.state_matrix is None and self.transitions is not None:
+            self.problems += validate_transitions(self.transitions)
+        self.key = model_hash(self.state_matrix if self.state_matrix is not None else self.transitions,
+                              self.emission_matrix, state_to_index, emission_to_index, self.start)
+        self._symbol_scores = None
+        self._symbol_score_list = None
+
+    @property
+    def log_state_matrix(self):
+        # Dense K x K log transitions. A model built from a SparseTransitions makes them on
+        # first use, for the engines that only have a dense form (N-best, batch, the
+        # time-parallel and LZ78 decoders, path scoring).
+        if self._log_state_matrix is None:
+            if self.transitions is None:
+                raise ValueError("The model has no transition matrix")
+            self._log_state_matrix = log_matrix(self.transitions.to_dense())
+        return self._log_state_matrix
+
+    @property
+    def symbol_score_array(self):
+        # (|Sigma|, K, K): log transition into a state plus that state's log emission of the
+        # symbol. Built on first use since only the Viterbi kernels need it.
+        if self._symbol_scores is None:
+            self._symbol_scores = self.log_state_matrix[None, :, :] + self.log_emission_cols[:, None, :]
+        return self._symbol_scores
+
+    @property
+    def symbol_scores(self):
+        # Per-symbol scores as a list, which is cheaper to index one column at a time; for
+        # sparse models one vector of edge scores per symbol.
+        if self._symbol_score_list is None:
+            if self.sparse_viterbi:
+                self._symbol_score_list = self.transitions.symbol_scores(self.log_emission_matrix)
+            else:
+                self._symbol_score_list = SymbolScores(self.symbol_score_array)
+        return self._symbol_score_list
+
+    @property
+    def is_valid(self):
+        return not self.problems
+
+    def encode(self, emission_path):
+        return encode_symbols(emission_path, self.emission_to_index, self.emission_table)
+
+    def encode_states(self, hidden_path):
+        return encode_symbols(hidden_path, self.state_to_index, self.state_table)
+
+    def decode_states(self, state_indices):
+        return "".join([self.index_to_state[i] for i in state_indices.tolist()])
+
+
+_model_cache = OrderedDict()
+
+@phased("setup")
+def compile_model(state_matrix, emission_matrix, state_to_index=None, emission_to_index=None, start=None, 
+                  strict=False, sparse=None):
+    # Models are looked up by content hash, so an evaluator called again with equal
+    # matrices (or a server seeing the same model in many requests) skips compilation.
+    if not isinstance(state_matrix, SparseTransitions):
+        state_matrix = as_model_array(state_matrix)
+    key = model_hash(state_matrix, as_model_array(emission_matrix),
+                     state_to_index, emission_to_index, as_model_array(start), sparse)
+    model = _model_cache.get(key)
+    if model is None:
+        model = CompiledModel(state_matrix, emission_matrix, state_to_index, emission_to_index, start, sparse)
+        _model_cache[key] = model
+        tally("model_compiles")
+        if len(_model_cache) > CACHE_SIZE:
+            _model_cache.popitem(last=False)
+    else:
+        _model_cache.move_to_end(key)
+        tally("model_cache_hits")
+    if strict and model.problems:
+        raise ValueError("; ".join(model.problems))
+    return model
+
+def clear_model_cache():
+    _model_cache.clear()
+
+def model_hash(state_matrix, emission_matrix, state_to_index, emission_to_index, start, sparse=None):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(sparse).encode("ascii"))
+    if isinstance(state_matrix, SparseTransitions):
+        digest.update(b"sparse")
+        for array in (state_matrix.sources, state_matrix.targets, state_matrix.weights):
+            digest.update(array.tobytes())
+        state_matrix = None
+    for matrix in (state_matrix, emission_matrix, start):
+        if matrix is None:
+            digest.update(b"none")
+        else:
+            digest.update(repr(matrix.shape).encode("ascii"))
+            digest.update(matrix.tobytes())
+    labels = [sorted((state_to_index or {}).items()), sorted((emission_to_index or {}).items())]
+    digest.update(json.dumps(labels).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def as_model_array(matrix):
+    return None if matrix is None else np.ascontiguousarray(matrix, dtype=np.float64)
+
+def model_size(state_matrix, transitions, emission_matrix):
+    if transitions is not None:
+        return transitions.n_states
+    return (state_matrix if state_matrix is not None else emission_matrix).shape[0]
+
+def check_shapes(state_matrix, emission_matrix, state_to_index, emission_to_index, n_states):
+    if state_matrix is not None and state_matrix.shape[0] != state_matrix.shape[1]:
+        raise ValueError(f"state_matrix must be square, got {state_matrix.shape}")
+    if emission_matrix is not None and emission_matrix.shape[0] != n_states:
+        raise ValueError(f"emission_matrix has {emission_matrix.shape[0]} rows for {n_states} states")
+    if state_to_index and len(state_to_index) != n_states:
+        raise ValueError(f"{len(state_to_index)} state labels for {n_states} states")
+    if emission_to_index and emission_matrix is not None and len(emission_to_index) != emission_matrix.shape[1]:
+        raise ValueError(f"{len(emission_to_index)} emission labels for {emission_matrix.shape[1]} columns")
+
+def validate_model(state_matrix, emission_matrix, start):
+    problems = []
+    for name, matrix in (("state_matrix", state_matrix), ("emission_matrix", emission_matrix), ("start", start)):
+        if matrix is None:
+            continue
+        if not np.all(np.isfinite(matrix)):
+            problems.append(f"{name} has non-finite entries")
+        if np.any(matrix < 0):
+            problems.append(f"{name} has negative entries")
+        row_sums = matrix.sum(axis=-1)
+        bad_rows = np.flatnonzero(np.abs(row_sums - 1.0) > ROW_SUM_TOLERANCE).tolist()
+        if bad_rows:
+            problems.append(f"{name} rows {bad_rows} do not sum to 1")
+    return problems
+
+def validate_transitions(transitions):
+    problems = []
+    if not np.all(np.isfinite(transitions.weights)):
+        problems.append("state_matrix has non-finite entries")
+    if np.any(transitions.weights < 0):
+        problems.append("state_matrix has negative entries")
+    bad_rows = np.flatnonzero(np.abs(transitions.row_sums() - 1.0) > ROW_SUM_TOLERANCE).tolist()
+    if bad_rows:
+        problems.append(f"state_matrix rows {bad_rows} do not sum to 1")
+    return problems
+
+def encoding_table(symbol_to_index):
+    # 256-entry byte lookup, or None when some label is not a single latin-1 character.
+    if not all(len(symbol) == 1 and ord(symbol) < 256 for symbol in symbol_to_index):
+        return None
+    table = np.full(256, -1, dtype=np.intp)
+    for symbol, index in symbol_to_index.items():
+        table[ord(symbol)] = index
+    return table
+
+def encode_symbols(path, symbol_to_index, table):
+    if isinstance(path, np.ndarray):
+        return path.astype(np.intp, copy=False)
+    if table is not None:
+        try:
+            raw = np.frombuffer(path.encode("latin-1"), dtype=np.uint8)
+        except UnicodeEncodeError:
+            raw = None
+        if raw is not None:
+            encoded = table[raw]
+            unknown = np.flatnonzero(encoded < 0)
+            if len(unknown):
+                raise KeyError(path[unknown[0]])
+            return encoded
+    return np.fromiter((symbol_to_index[symbol] for symbol in path),
+                       dtype=np.intp, count=len(path))
+
+def encode_emissions(emission_path, emission_to_index):
+    # For callers without a CompiledModel, which keeps its table; built here per call.
+    return encode_symbols(emission_path, emission_to_index, encoding_table(emission_to_index))
+
+def transition_cells(transitions):
+    # DP cells evaluated per column: one per transition the kernel looks at.
+    if isinstance(transitions, SparseTransitions):
+        return transitions.nnz
+    return transitions.shape[0] * transitions.shape[1]
+
+def index_labels(symbol_to_index):
+    labels = [None] * len(symbol_to_index or {})
+    for symbol, index in (symbol_to_index or {}).items():
+        labels[index] = symbol
+    return labels
+
+def log_matrix(matrix):
+    with np.errstate(divide="ignore"):
+        return np.log(np.asarray(matrix, dtype=np.float64))
@@ -0,0 +1,199 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from compiled import CACHE_SIZE, compile_model
+
+# Phrase operators kept per model; a K x K matrix (plus K x K backpointers for Viterbi).
+PHRASE_CACHE_SIZE = 1 << 16
+
+
+# Repetitive emission strings decoded phrase by phrase instead of column by column. The
+# string is split by LZ78, where every phrase is an earlier phrase plus one symbol, so
+# each phrase's transfer operator costs one K x K semiring product with its parent's:
+#   Viterbi: M[p] = M[parent] (x) S[symbol] in (max,+), with the argmax kept for traceback
+#   forward: M[p] = M[parent] T diag(e_symbol), rescaled, with the scale kept in log
+# The DP then advances a whole phrase per vector-matrix product. Operators are also
+# memoized by phrase content in an LRU cache per model, so later sequences on the same
+# model reuse them. Scores agree with the column-by-column engines to rounding; Viterbi
+# paths can differ only between near-tied alternatives.
+
+class PhraseCache:
+    def __init__(self, max_phrases=PHRASE_CACHE_SIZE):
+        self.max_phrases = max_phrases
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        if len(self.entries) > self.max_phrases:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+_phrase_caches = OrderedDict()
+
+def phrase_cache(model, kind):
+    # One cache per (model, "viterbi" | "forward"), as many models as compile_model keeps.
+    key = (model.key, kind)
+    cache = _phrase_caches.get(key)
+    if cache is None:
+        cache = _phrase_caches[key] = PhraseCache()
+        if len(_phrase_caches) > CACHE_SIZE:
+            _phrase_caches.popitem(last=False)
+    else:
+        _phrase_caches.move_to_end(key)
+    return cache
+
+def clear_phrase_caches():
+    _phrase_caches.clear()
+
+
+def lz78_parse(encoded):
+    # Trie node 0 is the empty phrase; node n is parents[n]'s phrase plus symbols[n].
+    # Returns the phrase (node) sequence; only the last phrase may repeat an earlier one.
+    children = {}
+    parents = [-1]
+    symbols = [-1]
+    phrases = []
+    node = 0
+    for symbol in encoded.tolist():
+        child = children.get((node, symbol))
+        if child is None:
+            child = len(parents)
+            children[(node, symbol)] = child
+            parents.append(node)
+            symbols.append(symbol)
+            phrases.append(child)
+            node = 0
+        else:
+            node = child
+    if node:
+        phrases.append(node)
+    return phrases, parents, symbols
+
+def phrase_tables(parents, symbols, cache, extend):
+    # extend(parent_entry or None, symbol) builds a node's entry from its parent's.
+    entries = [None] * len(parents)
+    keys = [()] * len(parents)
+    for node in range(1, len(parents)):
+        parent = parents[node]
+        keys[node] = keys[parent] + (symbols[node],)
+        entry = cache.get(keys[node]) if cache is not None else None
+        if entry is None:
+            entry = extend(entries[parent], symbols[node])
+            if cache is not None:
+                cache.put(keys[node], entry)
+        entries[node] = entry
+    return entries
+
+
+def viterbi_lz(encoded, log_start, log_emission_matrix, symbol_scores, cache=None):
+    # symbol_scores is the dense (|Sigma|, K, K) CompiledModel.symbol_score_array.
+    if len(encoded) == 0:
+        return np.empty(0, dtype=np.intp), 0.0
+
+    def extend(parent, symbol):
+        if parent is None:
+            return symbol_scores[symbol], None
+        scores = parent[0][:, :, None] + symbol_scores[symbol][None, :, :]
+        return scores.max(axis=1), scores.argmax(axis=1)
+
+    phrases, parents, symbols = lz78_parse(encoded[1:])
+    entries = phrase_tables(parents, symbols, cache, extend)
+    dp_col = log_start + log_emission_matrix[:, encoded[0]]
+    entry_states = np.empty((len(phrases), len(log_start)), dtype=np.intp)
+    for n, node in enumerate(phrases):
+        scores = dp_col[:, None] + entries[node][0]
+        entry_states[n] = scores.argmax(axis=0)
+        dp_col = scores.max(axis=0)
+    state = int(np.argmax(dp_col))
+    score = float(dp_col[state])
+
+    # Per-phrase traceback: the phrase's entry state and end state pick one path through
+    # it, read off the argmax tables of the phrase and its prefixes, last symbol first.
+    best_path = np.empty(len(encoded), dtype=np.intp)
+    position = len(encoded)
+    for n in range(len(phrases) - 1, -1, -1):
+        node = phrases[n]
+        entry_state = int(entry_states[n, state])
+        while node:
+            position -= 1
+            best_path[position] = state
+            if parents[node]:
+                state = int(entries[node][1][entry_state, state])
+            node = parents[node]
+        state = entry_state
+    best_path[0] = state
+    return best_path, score
+
+def forward_lz(encoded, start, state_matrix, emission_cols, cache=None):
+    if len(encoded) == 0:
+        return 0.0
+
+    def extend(parent, symbol):
+        if parent is None:
+            transfer, log_scale = state_matrix * emission_cols[symbol], 0.0
+        else:
+            transfer, log_scale = (parent[0] @ state_matrix) * emission_cols[symbol], parent[1]
+        scale = transfer.max()
+        if scale <= 0:
+            return transfer, -np.inf
+        return transfer / scale, log_scale + np.log(scale)
+
+    phrases, parents, symbols = lz78_parse(encoded[1:])
+    entries = phrase_tables(parents, symbols, cache, extend)
+    dp_col = start * emission_cols[encoded[0]]
+    log_prob = 0.0
+    for node in [None] + phrases:
+        log_scale = 0.0
+        if node is not None:
+            transfer, log_scale = entries[node]
+            dp_col = dp_col @ transfer
+        scale = dp_col.sum()
+        if scale <= 0 or not np.isfinite(log_scale):
+            return -np.inf
+        log_prob += np.log(scale) + log_scale
+        dp_col = dp_col / scale
+    return float(log_prob)
+
+
+def viterbi_compressed(emission_path,
+                       state_matrix,
+                       emission_matrix,
+                       state_to_index,
+                       emission_to_index,
+                       states,
+                       model=None,
+                       cache=None) -> str:
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    cache = cache if cache is not None else phrase_cache(model, "viterbi")
+    best_path, _ = viterbi_lz(model.encode(emission_path), model.log_start, model.log_emission_matrix,
+                              model.symbol_score_array, cache)
+    return model.decode_states(best_path)
+
+def compute_log_path_probability_compressed(emission_path,
+                                            state_matrix,
+                                            emission_matrix,
+                                            state_to_index,
+                                            emission_to_index,
+                                            states,
+                                            model=None,
+                                            cache=None) -> float:
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    cache = cache if cache is not None else phrase_cache(model, "forward")
+    return forward_lz(model.encode(emission_path), model.start, model.state_matrix, model.emission_cols, cache)
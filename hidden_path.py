@@ -1,27 +1,56 @@
+import math
+import os
+
 import numpy as np
 
+from compiled import compile_model
+from instrument import capture, phased, stats_enabled, tally
+
 def get_hidden_path_probability(hidden_path: str, 
                                 state_to_index: dict, 
-                                state_transfer_matrix: np.ndarray) -> float:
-    probability = 0.5
-    from_state = None
-    for i in range(len(hidden_path)):
-        if from_state is None:
-            from_state = hidden_path[i]
-            continue
-        to_state = hidden_path[i]
-        from_index = state_to_index[from_state]
-        to_index = state_to_index[to_state]
-        transition_probability = state_transfer_matrix[from_index, to_index]
-        probability *= transition_probability
-        from_state = to_state
-
+                                state_transfer_matrix: np.ndarray,
+                                model=None,
+                                start=None) -> float:
+    # start is the initial state distribution, uniform 1/K by default (0.5 for two states).
+    # Underflows to 0 on long paths; log_hidden_path_probability does not.
+    if model is None:
+        model = compile_model(state_transfer_matrix, None, state_to_index, start=start)
+    state_codes = model.encode_states(hidden_path)
+    if len(state_codes) == 0:
+        return 1.0
+    # Multiplied left to right, in the same order as the per-step loop it replaces.
+    factors = model.state_matrix[state_codes[:-1], state_codes[1:]]
+    probability = math.prod(factors.tolist(), start=float(model.start[state_codes[0]]))
+    if probability == 0.0 and stats_enabled() and model.start[state_codes[0]] > 0 and factors.all():
+        tally("underflows")
     return probability
 
+def log_hidden_path_probability(hidden_path, model) -> float:
+    return float(log_hidden_path_probabilities(encode_paths([hidden_path], model), model)[0])
+
+def log_hidden_path_probabilities(state_codes, model):
+    # state_codes is an (N, T) array of candidate paths of one length, e.g. from encode_paths.
+    state_codes = np.atleast_2d(state_codes)
+    if state_codes.shape[1] == 0:
+        return np.zeros(len(state_codes))
+    log_probs = model.log_start[state_codes[:, 0]]
+    return log_probs + model.log_state_matrix[state_codes[:, :-1], state_codes[:, 1:]].sum(axis=1)
+
+def encode_paths(hidden_paths, model):
+    hidden_paths = list(hidden_paths)
+    length = len(hidden_paths[0]) if hidden_paths else 0
+    if any(len(path) != length for path in hidden_paths):
+        raise ValueError("All candidate paths must have the same length")
+    if all(isinstance(path, str) for path in hidden_paths):
+        return model.encode_states("".join(hidden_paths)).reshape(len(hidden_paths), length)
+    return np.array([model.encode_states(path) for path in hidden_paths], dtype=np.intp).reshape(-1, length)
+
 
+@phased("parse")
 def read_input():
     with open("input.txt", "rt") as f:
         data = iter(f.readlines())
+        tally("bytes_parsed", os.fstat(f.fileno()).st_size)
     hidden_path = next(data).strip()
     assert next(data).startswith("-")
     states = next(data).strip().split()
@@ -40,7 +69,8 @@ def read_input():
     return hidden_path,state_to_index,state_transfer_matrix
 
 if __name__ == "__main__":
-    hidden_path, state_to_index, state_transfer_matrix = read_input()
+    with capture():
+        hidden_path, state_to_index, state_transfer_matrix = read_input()
 
-    prob = get_hidden_path_probability(hidden_path, state_to_index, state_transfer_matrix)
-    print(prob)
\ No newline at end of file
+        prob = get_hidden_path_probability(hidden_path, state_to_index, state_transfer_matrix)
+        print(prob)
\ No newline at end of file
@@ -0,0 +1,104 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# HMM_STATS=1 turns collection on at import; enable_stats() switches it at run time.
+# HMM_CAPTURE=cprofile|tracemalloc makes capture() profile a whole __main__ run.
+STATS_ENV = "HMM_STATS"
+CAPTURE_ENV = "HMM_CAPTURE"
+CAPTURE_MODES = ("cprofile", "tracemalloc")
+CAPTURE_TOP = 25
+
+_state = {"enabled": os.environ.get(STATS_ENV, "") not in ("", "0")}
+_timers = {}
+_counters = {}
+_idle = nullcontext()
+
+
+def enable_stats(enabled=True):
+    _state["enabled"] = enabled
+
+def stats_enabled():
+    return _state["enabled"]
+
+def reset_stats():
+    _timers.clear()
+    _counters.clear()
+
+def stats():
+    return {"timers": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in _timers.items()},
+            "counters": dict(_counters)}
+
+def write_stats(file):
+    json.dump(stats(), file, indent=2)
+    print(file=file)
+
+
+# Phases and counters are recorded once per call, never per DP column, and cost one
+# dict lookup when collection is off. Phases in use: parse, setup, columns, traceback,
+# output. Counters: columns, cells, bytes_parsed, underflows (a column or product that
+# reached 0 in linear space), model_compiles, model_cache_hits.
+
+def phase(name):
+    if not _state["enabled"]:
+        return _idle
+    return timed(name)
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = _timers.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - start
+
+def phased(name):
+    # Decorator form of phase() for functions that are a phase as a whole.
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def tally(name, n=1):
+    if _state["enabled"]:
+        _counters[name] = _counters.get(name, 0) + int(n)
+
+
+@contextmanager
+def capture(mode=None, file=None):
+    # Wraps a __main__ run; reports go to stderr so the script's own output is unchanged.
+    mode = mode if mode is not None else os.environ.get(CAPTURE_ENV) or None
+    file = file if file is not None else sys.stderr
+    if mode is not None and mode not in CAPTURE_MODES:
+        raise ValueError(f"Unknown capture mode: {mode}")
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    if profiler is not None:
+        profiler.enable()
+    elif mode == "tracemalloc":
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            pstats.Stats(profiler, stream=file).sort_stats("cumulative").print_stats(CAPTURE_TOP)
+        elif mode == "tracemalloc":
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"peak traced memory: {peak} bytes", file=file)
+            for statistic in snapshot.statistics("lineno")[:CAPTURE_TOP]:
+                print(statistic, file=file)
+        if _state["enabled"]:
+            write_stats(file)
@@ -0,0 +1,156 @@
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# HMM_KERNEL_BACKEND=numpy|numba|auto picks the backend at import; set_backend() overrides
+# it at run time. "auto" uses numba when it is installed.
+BACKEND_ENV = "HMM_KERNEL_BACKEND"
+BACKENDS = ("numpy", "numba")
+GAP = ord("-")
+
+_backend = {"name": None}
+
+
+def available_backends():
+    return [name for name in BACKENDS if name == "numpy" or numba is not None]
+
+def set_backend(name):
+    if name == "auto":
+        name = "numba" if numba is not None else "numpy"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend: {name}")
+    if name == "numba" and numba is None:
+        raise ImportError("The numba backend needs numba installed")
+    _backend["name"] = name
+
+def get_backend():
+    if _backend["name"] is None:
+        set_backend(os.environ.get(BACKEND_ENV, "auto"))
+    return _backend["name"]
+
+def use_jit():
+    return get_backend() == "numba"
+
+
+# The engines in viterbi.py, prob_path.py and profile_core.py call these when use_jit()
+# is on and otherwise run their own NumPy code. Each kernel repeats the NumPy engine's
+# arithmetic in the same order (Viterbi adds the precomputed symbol scores, ties go to
+# the lowest state), so Viterbi paths and profile counts match exactly; forward and
+# backward sums may differ from BLAS in the last bits.
+
+def viterbi_kernel(encoded, log_start, log_emission_matrix, symbol_scores, backtrack_graph):
+    # symbol_scores is the (|Sigma|, K, K) stack; backtrack_graph is the caller's
+    # (T, K) array in viterbi.backpointer_dtype, filled in place.
+    return _viterbi_jit(np.ascontiguousarray(encoded, dtype=np.intp), log_start,
+                        np.ascontiguousarray(log_emission_matrix), np.ascontiguousarray(symbol_scores), 
+                        backtrack_graph)
+
+def forward_kernel(encoded, start, state_matrix, emission_cols):
+    return _forward_jit(np.ascontiguousarray(encoded, dtype=np.intp), np.asarray(start, dtype=np.float64),
+                        np.ascontiguousarray(state_matrix, dtype=np.float64), emission_cols)
+
+def backward_kernel(encoded, scales, state_matrix, emission_cols, end=None):
+    # end is the last column of beta, all ones unless a later block of the sequence set it.
+    end = np.ones(state_matrix.shape[0]) if end is None else np.asarray(end, dtype=np.float64)
+    return _backward_jit(np.ascontiguousarray(encoded, dtype=np.intp), scales,
+                         np.ascontiguousarray(state_matrix, dtype=np.float64), emission_cols, end)
+
+def profile_count_kernel(block, is_match, symbol_to_index, transfer_counts, emission_counts):
+    _profile_counts_jit(np.ascontiguousarray(block), is_match, np.cumsum(is_match),
+                        symbol_to_index, transfer_counts, emission_counts)
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _viterbi_jit(encoded, log_start, log_emission_matrix, symbol_scores, backtrack_graph):
+        length = len(encoded)
+        n_states = len(log_start)
+        dp_col = log_start + log_emission_matrix[:, encoded[0]]
+        new_col = np.empty(n_states)
+        for i in range(1, length):
+            col_scores = symbol_scores[encoded[i]]
+            for to_state in range(n_states):
+                best_state = 0
+                best = dp_col[0] + col_scores[0, to_state]
+                for from_state in range(1, n_states):
+                    score = dp_col[from_state] + col_scores[from_state, to_state]
+                    if score > best:
+                        best = score
+                        best_state = from_state
+                new_col[to_state] = best
+                backtrack_graph[i, to_state] = best_state
+            dp_col, new_col = new_col, dp_col
+        best_final_state = 0
+        for state in range(1, n_states):
+            if dp_col[state] > dp_col[best_final_state]:
+                best_final_state = state
+        best_path = np.empty(length, dtype=np.intp)
+        best_path[-1] = best_final_state
+        for i in range(length - 1, 0, -1):
+            best_path[i - 1] = backtrack_graph[i, best_path[i]]
+        return best_path, dp_col[best_final_state]
+
+    @numba.njit(cache=True)
+    def _forward_jit(encoded, start, state_matrix, emission_cols):
+        length = len(encoded)
+        n_states = len(start)
+        alpha = np.empty((length, n_states))
+        scales = np.empty(length)
+        dp_col = np.empty(n_states)
+        for i in range(length):
+            emission_col = emission_cols[encoded[i]]
+            for to_state in range(n_states):
+                if i == 0:
+                    total = start[to_state]
+                else:
+                    total = 0.0
+                    for from_state in range(n_states):
+                        total += alpha[i - 1, from_state] * state_matrix[from_state, to_state]
+                dp_col[to_state] = total * emission_col[to_state]
+            scales[i] = dp_col.sum()
+            for state in range(n_states):
+                alpha[i, state] = dp_col[state] / scales[i] if scales[i] > 0 else dp_col[state]
+        return alpha, scales
+
+    @numba.njit(cache=True)
+    def _backward_jit(encoded, scales, state_matrix, emission_cols, end):
+        length = len(encoded)
+        n_states = state_matrix.shape[0]
+        beta = np.empty((length, n_states))
+        beta[-1] = end
+        weighted = np.empty(n_states)
+        for i in range(length - 2, -1, -1):
+            emission_col = emission_cols[encoded[i + 1]]
+            for state in range(n_states):
+                weighted[state] = emission_col[state] * beta[i + 1, state]
+            for from_state in range(n_states):
+                total = 0.0
+                for to_state in range(n_states):
+                    total += state_matrix[from_state, to_state] * weighted[to_state]
+                beta[i, from_state] = total / scales[i + 1] if scales[i + 1] > 0 else total
+        return beta
+
+    @numba.njit(cache=True)
+    def _profile_counts_jit(block, is_match, match_index, symbol_to_index, transfer_counts, emission_counts):
+        # Same walk as profile_core.count_paths: S, one state per non-skipped cell, E.
+        end_state = len(transfer_counts) - 1
+        for row in range(block.shape[0]):
+            prev_state = 0
+            for col in range(block.shape[1]):
+                is_gap = block[row, col] == GAP
+                if is_match[col]:
+                    state = 3 * match_index[col] - 1 + is_gap
+                elif is_gap:
+                    continue
+                else:
+                    state = 3 * match_index[col] + 1
+                transfer_counts[prev_state, state - prev_state] += 1
+                if not is_gap:
+                    emission_counts[state, symbol_to_index[block[row, col]]] += 1
+                prev_state = state
+            transfer_counts[prev_state, end_state - prev_state] += 1
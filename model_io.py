@@ -0,0 +1,189 @@
+import json
+import struct
+import sys
+
+import numpy as np
+
+from instrument import capture
+from profile_core import TRANSFER_SPAN, state_names
+from streaming import read_matrix_rows
+
+# Layout: 8-byte magic, little-endian uint64 header length, JSON header, then every
+# array stored contiguously at a 64-byte aligned offset recorded in the header.
+MAGIC = b"HMMBIN\x00\x01"
+ALIGNMENT = 64
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def save_model(path, arrays, labels, meta=None):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    header = {"labels": labels, "meta": meta or {}, "arrays": layout}
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": 0}
+    # The header holds the data offsets, which depend on the header's own length; lay the
+    # arrays out again until that length stops changing (offsets only grow, so it does).
+    header_size = None
+    while True:
+        encoded = json.dumps(header).encode("utf-8")
+        data_start = align(len(MAGIC) + 8 + len(encoded))
+        if data_start == header_size:
+            break
+        header_size = offset = data_start
+        for name, array in arrays.items():
+            layout[name]["offset"] = offset
+            offset = align(offset + array.nbytes)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            assert f.tell() <= layout[name]["offset"]
+            f.write(b"\0" * (layout[name]["offset"] - f.tell()))
+            f.write(array.tobytes())
+
+def load_model(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a binary model file")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if np.prod(shape, dtype=np.int64) == 0:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+        else:
+            arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+    return arrays, header["labels"], header["meta"]
+
+
+def save_hmm(path, states, emissions, state_matrix, emission_matrix):
+    save_model(path, {"state_matrix": np.asarray(state_matrix, dtype=np.float64),
+                      "emission_matrix": np.asarray(emission_matrix, dtype=np.float64)},
+               {"states": list(states), "emissions": list(emissions)}, {"kind": "hmm"})
+
+def load_hmm(path):
+    arrays, labels, meta = load_model(path)
+    if meta.get("kind") != "hmm":
+        raise ValueError(f"{path} does not hold an HMM")
+    states, emissions = labels["states"], labels["emissions"]
+    state_to_index = {state: i for i, state in enumerate(states)}
+    emission_to_index = {emission: i for i, emission in enumerate(emissions)}
+    return states, emissions, arrays["state_matrix"], arrays["emission_matrix"], state_to_index, emission_to_index
+
+def save_profile(path, transfer_probs, emission_probs, match_count, alphabet):
+    save_model(path, {"transfer_probs": np.asarray(transfer_probs, dtype=np.float64),
+                      "emission_probs": np.asarray(emission_probs, dtype=np.float64)},
+               {"alphabet": list(alphabet)}, {"kind": "profile", "match_count": int(match_count)})
+
+def load_profile(path):
+    arrays, labels, meta = load_model(path)
+    if meta.get("kind") != "profile":
+        raise ValueError(f"{path} does not hold a profile HMM")
+    return arrays["transfer_probs"], arrays["emission_probs"], meta["match_count"], labels["alphabet"]
+
+def save_profile_sweep(path, profiles, alphabet):
+    # profiles: (threshold, pseudo_factor, transfer_probs, emission_probs, match_count)
+    # tuples, stored as numbered arrays in one file; pseudo_factor is None without a prior.
+    arrays, entries = {}, []
+    for i, (threshold, pseudo_factor, transfer_probs, emission_probs, match_count) in enumerate(profiles):
+        arrays[f"transfer_probs_{i}"] = np.asarray(transfer_probs, dtype=np.float64)
+        arrays[f"emission_probs_{i}"] = np.asarray(emission_probs, dtype=np.float64)
+        entries.append({"threshold": float(threshold), "match_count": int(match_count),
+                        "pseudo_factor": None if pseudo_factor is None else float(pseudo_factor)})
+    save_model(path, arrays, {"alphabet": list(alphabet)}, {"kind": "profile_sweep", "profiles": entries})
+
+def load_profile_sweep(path):
+    arrays, labels, meta = load_model(path)
+    if meta.get("kind") != "profile_sweep":
+        raise ValueError(f"{path} does not hold a profile sweep")
+    profiles = [(entry["threshold"], entry["pseudo_factor"], arrays[f"transfer_probs_{i}"],
+                 arrays[f"emission_probs_{i}"], entry["match_count"]) for i, entry in enumerate(meta["profiles"])]
+    return profiles, labels["alphabet"]
+
+
+def write_matrix(matrix, row_labels, headers, file):
+    print("\t".join([""] + list(headers)), file=file)
+    for label, row in zip(row_labels, matrix.tolist()):
+        print("\t".join([label] + [format_value(value) for value in row]), file=file)
+
+def format_value(value):
+    return f"{value}" if value else "0"
+
+def hmm_text_to_binary(text_path, binary_path):
+    # Reads the input.txt layout used by viterbi.py and prob_path.py; the emission
+    # string at the top is data rather than model and is not stored.
+    with open(text_path, "rt") as f:
+        lines = iter(f)
+        next(lines)
+        assert next(lines).startswith("-")
+        emissions = next(lines).split()
+        assert next(lines).startswith("-")
+        states = next(lines).split()
+        assert next(lines).startswith("-")
+        state_matrix = read_matrix_rows(lines, states, states)
+        assert next(lines).startswith("-")
+        emission_matrix = read_matrix_rows(lines, states, emissions)
+    save_hmm(binary_path, states, emissions, state_matrix, emission_matrix)
+
+def hmm_binary_to_text(binary_path, file, emission_path=""):
+    states, emissions, state_matrix, emission_matrix, _, _ = load_hmm(binary_path)
+    print(emission_path, file=file)
+    print("--------", file=file)
+    print("\t".join(emissions), file=file)
+    print("--------", file=file)
+    print("\t".join(states), file=file)
+    print("--------", file=file)
+    write_matrix(np.asarray(state_matrix), states, states, file)
+    print("--------", file=file)
+    write_matrix(np.asarray(emission_matrix), states, emissions, file)
+
+def profile_text_to_binary(text_path, binary_path):
+    # Reads the output.txt layout written by profile_hmm.py / profile_hmm_pseudocounts.py.
+    with open(text_path, "rt") as f:
+        lines = iter(f)
+        headers = next(lines).split()
+        match_count = (len(headers) - 3) // 3
+        assert headers == state_names(match_count)
+        n_states = len(headers)
+        transfer_probs = np.zeros((n_states, TRANSFER_SPAN))
+        for state in range(n_states):
+            row = next(lines).split()
+            values = np.array(row[1:], dtype=np.float64)
+            span = values[state:state + TRANSFER_SPAN]
+            transfer_probs[state, :len(span)] = span
+        assert next(lines).startswith("-")
+        alphabet = next(lines).split()
+        emission_probs = np.array([next(lines).split()[1:] for _ in range(n_states)], dtype=np.float64)
+    save_profile(binary_path, transfer_probs, emission_probs, match_count, alphabet)
+
+def profile_binary_to_text(binary_path, file):
+    transfer_probs, emission_probs, match_count, alphabet = load_profile(binary_path)
+    names = state_names(match_count)
+    n_states = len(names)
+    print("\t".join([""] + names), file=file)
+    for state, band in enumerate(np.asarray(transfer_probs).tolist()):
+        row = ["0"] * n_states
+        for offset, value in enumerate(band):
+            if value and state + offset < n_states:
+                row[state + offset] = f"{value}"
+        print("\t".join([names[state]] + row), file=file)
+    print("--------", file=file)
+    write_matrix(np.asarray(emission_probs)[:, :len(alphabet)], names, alphabet, file)
+
+
+if __name__ == "__main__":
+    with capture():
+        # Usage: python model_io.py {hmm|profile} {to-binary|to-text} SOURCE DESTINATION
+        kind, direction, source, destination = sys.argv[1:5]
+        if direction == "to-binary":
+            (hmm_text_to_binary if kind == "hmm" else profile_text_to_binary)(source, destination)
+        else:
+            with open(destination, "wt") as output_file:
+                if kind == "hmm":
+                    hmm_binary_to_text(source, output_file)
+                else:
+                    profile_binary_to_text(source, output_file)
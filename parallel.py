@@ -0,0 +1,157 @@
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from compiled import CompiledModel
+from instrument import capture
+from viterbi import viterbi_log, read_input
+from prob_path import forward, log_probability
+
+
+class SharedModel:
+    def __init__(self, state_matrix, emission_matrix, state_to_index, emission_to_index):
+        self.state_to_index = state_to_index
+        self.emission_to_index = emission_to_index
+        self.blocks = []
+        self.arrays = {}
+        for name, matrix in (("state_matrix", state_matrix), ("emission_matrix", emission_matrix)):
+            matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+            block = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+            shared = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=block.buf)
+            shared[...] = matrix
+            self.blocks.append(block)
+            self.arrays[name] = (block.name, matrix.shape)
+
+    def spec(self):
+        return self.arrays, self.state_to_index, self.emission_to_index
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_worker_state = {}
+
+def attach_model(spec):
+    arrays, state_to_index, emission_to_index = spec
+    blocks = []
+    matrices = {}
+    for name, (block_name, shape) in arrays.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        matrices[name] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+    # Compiled once per worker; the shared matrices themselves are not copied.
+    _worker_state.update(
+        blocks=blocks,
+        model=CompiledModel(matrices["state_matrix"], matrices["emission_matrix"],
+                            state_to_index, emission_to_index),
+    )
+
+def decode_chunk(task):
+    mode, sequences = task
+    model = _worker_state["model"]
+    results = []
+    for sequence in sequences:
+        encoded = model.encode(sequence)
+        if mode == "viterbi":
+            best_path, score = viterbi_log(encoded, model.log_start,
+                                           model.viterbi_transitions,
+                                           model.log_emission_matrix,
+                                           symbol_scores=model.symbol_scores)
+            results.append((model.decode_states(best_path), score))
+        elif mode == "forward":
+            _, scales = forward(encoded, model.start, model.forward_transitions, model.emission_matrix, 
+                                model.emission_cols)
+            results.append(log_probability(scales))
+        else:
+            raise ValueError(f"Unknown decoding mode: {mode}")
+    return results
+
+
+def chunked(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def decode_records(records,
+                   state_matrix,
+                   emission_matrix,
+                   state_to_index,
+                   emission_to_index,
+                   mode="viterbi",
+                   workers=None,
+                   chunk_size=64):
+    workers = workers or os.cpu_count()
+    with SharedModel(state_matrix, emission_matrix, state_to_index, emission_to_index) as model:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=attach_model,
+                                 initargs=(model.spec(),)) as executor:
+            # Keep a bounded window of chunks in flight and yield them back in submission order.
+            pending = deque()
+            for chunk in chunked(records, chunk_size):
+                headers = [header for header, _ in chunk]
+                sequences = [sequence for _, sequence in chunk]
+                pending.append((headers, executor.submit(decode_chunk, (mode, sequences))))
+                if len(pending) >= 2 * workers:
+                    headers, future = pending.popleft()
+                    yield from zip(headers, future.result())
+            while pending:
+                headers, future = pending.popleft()
+                yield from zip(headers, future.result())
+
+
+def read_fasta(path):
+    header = None
+    sequence = []
+    with open(path, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(sequence)
+                header = line[1:]
+                sequence = []
+            elif line:
+                sequence.append(line)
+    if header is not None:
+        yield header, "".join(sequence)
+
+def read_model():
+    _, emissions, states, state_matrix, emission_matrix, state_to_index, emission_to_index = read_input()
+    return state_matrix, emission_matrix, state_to_index, emission_to_index
+
+
+if __name__ == "__main__":
+    with capture():
+        # Usage: python parallel.py records.fasta [viterbi|forward] [workers] [chunk_size]
+        # The model is read from input.txt in the same layout viterbi.py uses.
+        fasta_path = sys.argv[1]
+        mode = sys.argv[2] if len(sys.argv) > 2 else "viterbi"
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        chunk_size = int(sys.argv[4]) if len(sys.argv) > 4 else 64
+        state_matrix, emission_matrix, state_to_index, emission_to_index = read_model()
+        for header, result in decode_records(read_fasta(fasta_path), state_matrix, emission_matrix,
+                                             state_to_index, emission_to_index,
+                                             mode=mode, workers=workers, chunk_size=chunk_size):
+            if mode == "viterbi":
+                best_path, score = result
+                print(f">{header}\t{score}\n{best_path}")
+            else:
+                print(f">{header}\t{result}")
@@ -0,0 +1,119 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instrument import capture
+from profile_core import ProfileCalculator, PseudocountPrior, TRANSFER_SPAN, count_paths, encode_alignment, scan_alignment
+from profile_core import read_alignment_input, print_transfer_fractions, print_emission_fractions
+
+
+class SharedAlignment:
+    def __init__(self, alignment):
+        self.shape = alignment.shape
+        self.block = shared_memory.SharedMemory(create=True, size=max(alignment.nbytes, 1))
+        shared = np.ndarray(self.shape, dtype=np.uint8, buffer=self.block.buf)
+        shared[...] = alignment
+
+    def spec(self):
+        return self.block.name, self.shape
+
+    def close(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_worker_state = {}
+
+def attach_alignment(spec):
+    block_name, shape = spec
+    block = shared_memory.SharedMemory(name=block_name)
+    _worker_state.update(block=block, alignment=np.ndarray(shape, dtype=np.uint8, buffer=block.buf))
+
+def shard_blocks(start, stop, block_rows):
+    alignment = _worker_state["alignment"]
+    for row in range(start, stop, block_rows):
+        yield alignment[row:min(row + block_rows, stop)]
+
+def scan_shard(task):
+    start, stop, block_rows = task
+    return scan_alignment(shard_blocks(start, stop, block_rows))
+
+def count_shard(task):
+    start, stop, block_rows, is_match, symbol_to_index, n_symbols = task
+    n_states = 3 * int(is_match.sum()) + 3
+    transfer_counts = np.zeros((n_states, TRANSFER_SPAN), dtype=np.int64)
+    emission_counts = np.zeros((n_states, n_symbols), dtype=np.int64)
+    for block in shard_blocks(start, stop, block_rows):
+        count_paths(block, is_match, symbol_to_index, transfer_counts, emission_counts)
+    return transfer_counts, emission_counts
+
+
+def shard_ranges(n_rows, shard_rows):
+    return [(start, min(start + shard_rows, n_rows)) for start in range(0, n_rows, shard_rows)]
+
+def merge_scans(scans):
+    if not scans:
+        raise ValueError("The alignment has no rows")
+    count = sum(scan[0] for scan in scans)
+    gap_counts = sum(scan[2] for scan in scans)
+    symbol_counts = sum(scan[3] for scan in scans)
+    return count, scans[0][1], gap_counts, symbol_counts
+
+def sharded_calculator(alignment, alphabet, threshold, prior=None, workers=None, shard_rows=None, 
+                       block_rows=4096):
+    # Map: every worker scans, then counts, its own row range of the shared alignment.
+    # Reduce: the integer gap, symbol and path counts are summed, so the ProfileCalculator
+    # they are handed to normalizes exactly the numbers a serial build would.
+    alignment = encode_alignment(alignment)
+    if hasattr(alignment, "blocks"):
+        alignment = alignment.to_array()
+    workers = workers or os.cpu_count()
+    # A few shards per worker keeps the pool busy when rows differ in cost.
+    shard_rows = shard_rows or max(-(-len(alignment) // (4 * workers)), 1)
+    shards = shard_ranges(len(alignment), shard_rows)
+    with SharedAlignment(alignment) as shared:
+        with ProcessPoolExecutor(max_workers=workers, 
+                                 initializer=attach_alignment, 
+                                 initargs=(shared.spec(),)) as executor:
+            scan = merge_scans(list(executor.map(scan_shard, [(start, stop, block_rows) for start, stop in shards])))
+            calculator = ProfileCalculator(alignment, alphabet, threshold, prior, block_rows, scan=scan)
+            is_match = calculator.match_columns()
+            tasks = [(start, stop, block_rows, is_match, calculator.symbol_to_index, len(calculator.symbols)) 
+                     for start, stop in shards]
+            counts = list(executor.map(count_shard, tasks))
+    calculator.match_count = int(is_match.sum())
+    calculator.transfer_counts = sum(transfer_counts for transfer_counts, _ in counts)
+    calculator.emission_counts = sum(emission_counts for _, emission_counts in counts)
+    return calculator
+
+def compute_profile_hmm(alignment, alphabet, threshold, pseudo_factor=None, workers=None):
+    prior = PseudocountPrior(pseudo_factor) if pseudo_factor is not None else None
+    return sharded_calculator(alignment, alphabet, threshold, prior, workers).calculate()
+
+
+if __name__ == "__main__":
+    # Usage: python parallel_profile.py [workers]
+    # Reads the profile_hmm.py input.txt layout (a second parameter is the pseudo_factor
+    # of profile_hmm_pseudocounts.py) and writes output.txt the same way.
+    with capture():
+        workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+        alignment, alphabet, parameters = read_alignment_input()
+        threshold = parameters[0]
+        pseudo_factor = parameters[1] if len(parameters) > 1 else None
+        transfer_fractions, emission_fractions, match_count = compute_profile_hmm(alignment, alphabet, threshold, 
+                                                                                  pseudo_factor, workers)
+        with open("output.txt", "wt") as output_file:
+            print_transfer_fractions(transfer_fractions, match_count, file=output_file)
+            print("--------", file=output_file)
+            print_emission_fractions(emission_fractions, alphabet, match_count, file=output_file)
@@ -1,5 +1,11 @@
+import os
+
 import numpy as np
 
+from compiled import compile_model, transition_cells, SparseTransitions
+from instrument import capture, phase, phased, stats_enabled, tally
+from kernels import use_jit, forward_kernel, backward_kernel
+
 
 
 def compute_path_probability(emission_path, 
@@ -7,41 +13,161 @@ def compute_path_probability(emission_path,
             emission_matrix, 
             state_to_index, 
             emission_to_index,
-            states) -> str:
-    dp_array = {}
-    equal_prob = 1.0 / len(states)
-    for i, emission in enumerate(emission_path):
-        process_dp_col(state_matrix, emission_matrix, state_to_index, 
-                       emission_to_index, states, dp_array, 
-                       equal_prob, i, emission)
-
-    last_col = dp_array[len(emission_path) - 1]
-    total_prob = sum(last_col[state] for state in states)
-    return total_prob
-
-
-def process_dp_col(state_matrix, emission_matrix, state_to_index, emission_to_index, states, dp_array, equal_prob, i, emission):
-    dp_array[i] = {}
-    for state in states:
-        if i == 0:
-            dp_array[i][state] = equal_prob * \
-                emission_matrix[state_to_index[state], emission_to_index[emission]]
-        else:
-            total_prob = 0
-            for prev_state in states:
-                prob = dp_array[i-1][prev_state] * \
-                    state_matrix[state_to_index[prev_state], state_to_index[state]] * \
-                    emission_matrix[state_to_index[state], emission_to_index[emission]]
-                total_prob += prob
-            dp_array[i][state] = total_prob
-
-
-
-
-
+            states,
+            model=None) -> float:
+    log_prob = compute_log_path_probability(emission_path, state_matrix, emission_matrix, 
+                                            state_to_index, emission_to_index, states, model)
+    probability = float(np.exp(log_prob))
+    if probability == 0.0 and np.isfinite(log_prob):
+        tally("underflows")
+    return probability
+
+def compute_log_path_probability(emission_path, 
+            state_matrix, 
+            emission_matrix, 
+            state_to_index, 
+            emission_to_index,
+            states,
+            model=None) -> float:
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    encoded = model.encode(emission_path)
+    _, scales = forward(encoded, model.start, model.forward_transitions, model.emission_matrix, model.emission_cols)
+    return log_probability(scales)
+
+def compute_posteriors(emission_path, 
+            state_matrix, 
+            emission_matrix, 
+            state_to_index, 
+            emission_to_index,
+            states,
+            model=None):
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    encoded = model.encode(emission_path)
+    return forward_backward(encoded, model.start, model.forward_transitions, model.emission_matrix, 
+                            model.emission_cols)
+
+def compute_posterior_path(emission_path, 
+            state_matrix, 
+            emission_matrix, 
+            state_to_index, 
+            emission_to_index,
+            states,
+            model=None):
+    # Posterior (MPM) decoding: the most probable state at each position on its own, with
+    # that posterior as a per-position confidence. Unlike Viterbi, the path as a whole may
+    # use a transition of probability 0.
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    _, posteriors = compute_posteriors(emission_path, None, None, None, None, None, model)
+    best_states = posteriors.argmax(axis=1)
+    confidence = posteriors[np.arange(len(best_states)), best_states]
+    return model.decode_states(best_states), confidence
+
+
+def forward(encoded, start, state_matrix, emission_matrix, emission_cols=None):
+    # Each column is normalized to sum to 1; the normalizers multiply to P(x).
+    # emission_cols is emission_matrix.T, passed in when a compiled model already has it.
+    if emission_cols is None:
+        emission_cols = emission_columns(emission_matrix)
+    state_matrix = transition_matrix(state_matrix)
+    tally("columns", len(encoded))
+    tally("cells", max(len(encoded) - 1, 0) * transition_cells(state_matrix))
+    if use_jit() and len(encoded) and isinstance(state_matrix, np.ndarray):
+        with phase("columns"):
+            alpha, scales = forward_kernel(encoded, start, state_matrix, emission_cols)
+    else:
+        alpha = np.empty((len(encoded), len(start)))
+        scales = np.empty(len(encoded))
+        dp_col = start * emission_cols[encoded[0]] if len(encoded) else None
+        with phase("columns"):
+            for i, symbol in enumerate(encoded.tolist()):
+                if i > 0:
+                    dp_col = process_dp_col(alpha[i-1], state_matrix, emission_cols[symbol])
+                scales[i] = dp_col.sum()
+                alpha[i] = dp_col / scales[i] if scales[i] > 0 else dp_col
+    if stats_enabled():
+        tally("underflows", np.count_nonzero(scales == 0))
+    return alpha, scales
+
+def backward(encoded, scales, state_matrix, emission_matrix, emission_cols=None, end=None):
+    # end is beta at the last position, 1 by default. A block of a longer sequence that
+    # runs one position into the next block passes that block's first beta column.
+    if emission_cols is None:
+        emission_cols = emission_columns(emission_matrix)
+    state_matrix = transition_matrix(state_matrix)
+    beta = np.empty((len(encoded), emission_cols.shape[1]))
+    if len(encoded) == 0:
+        return beta
+    tally("columns", len(encoded))
+    tally("cells", (len(encoded) - 1) * transition_cells(state_matrix))
+    if use_jit() and isinstance(state_matrix, np.ndarray):
+        with phase("columns"):
+            return backward_kernel(encoded, scales, state_matrix, emission_cols, end)
+    beta[-1] = 1.0 if end is None else end
+    with phase("columns"):
+        for i in range(len(encoded) - 2, -1, -1):
+            dp_col = state_matrix @ (emission_cols[encoded[i+1]] * beta[i+1])
+            beta[i] = dp_col / scales[i+1] if scales[i+1] > 0 else dp_col
+    return beta
+
+def forward_backward(encoded, start, state_matrix, emission_matrix, emission_cols=None):
+    if emission_cols is None:
+        emission_cols = emission_columns(emission_matrix)
+    alpha, scales = forward(encoded, start, state_matrix, emission_matrix, emission_cols)
+    beta = backward(encoded, scales, state_matrix, emission_matrix, emission_cols)
+    return log_probability(scales), alpha * beta
+
+def forward_stream(encoded_chunks, start, state_matrix, emission_matrix, emission_cols=None):
+    # forward() for input that does not fit in memory: only the current column is kept
+    # and the log normalizers are summed as the chunks go by.
+    if emission_cols is None:
+        emission_cols = emission_columns(emission_matrix)
+    state_matrix = transition_matrix(state_matrix)
+    log_prob = 0.0
+    dp_col = None
+    for encoded in encoded_chunks:
+        tally("columns", len(encoded))
+        tally("cells", len(encoded) * transition_cells(state_matrix))
+        for symbol in encoded.tolist():
+            if dp_col is None:
+                dp_col = start * emission_cols[symbol]
+            else:
+                dp_col = process_dp_col(dp_col, state_matrix, emission_cols[symbol])
+            scale = dp_col.sum()
+            if scale <= 0:
+                tally("underflows")
+                return -np.inf
+            log_prob += np.log(scale)
+            dp_col = dp_col / scale
+    return float(log_prob)
+
+def log_probability(scales):
+    with np.errstate(divide="ignore"):
+        return float(np.log(scales).sum())
+
+def process_dp_col(prev_col, state_matrix, emission_col):
+    return (prev_col @ state_matrix) * emission_col
+
+def transition_matrix(state_matrix):
+    # A SparseTransitions supports the same v @ T and T @ v products as a dense matrix.
+    if isinstance(state_matrix, SparseTransitions):
+        return state_matrix
+    return np.asarray(state_matrix, dtype=np.float64)
+
+def emission_columns(emission_matrix):
+    return np.ascontiguousarray(np.asarray(emission_matrix, dtype=np.float64).T)
+
+
+
+
+
+@phased("parse")
 def read_input():
     with open("input.txt", "rt") as f:
         data = iter(f.readlines())
+        tally("bytes_parsed", os.fstat(f.fileno()).st_size)
 
     emission_path = next(data).strip()
     assert next(data).startswith("-")
@@ -93,13 +219,14 @@ def debug_input_read(read_input):
     print("Emission to Index Mapping:", emission_to_index)
 
 if __name__ == "__main__":
-    emission_path, emissions, states, state_matrix,\
-    emission_matrix, state_to_index, emission_to_index = read_input()
-    probability = compute_path_probability(emission_path, 
-            state_matrix, 
-            emission_matrix, 
-            state_to_index, 
-            emission_to_index,
-            states)
+    with capture():
+        emission_path, emissions, states, state_matrix,\
+        emission_matrix, state_to_index, emission_to_index = read_input()
+        probability = compute_path_probability(emission_path, 
+                state_matrix, 
+                emission_matrix, 
+                state_to_index, 
+                emission_to_index,
+                states)
     
-    print(probability)
\ No newline at end of file
+        print(probability)
\ No newline at end of file
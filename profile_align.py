@@ -0,0 +1,188 @@
+import numpy as np
+
+from instrument import phase, tally
+from profile_core import state_names
+from batch import pack_sequences, pad_sequences, sequence_lengths
+from compiled import encode_emissions, log_matrix
+
+MATCH, INSERT, DELETE = 0, 1, 2
+
+
+class ProfileModel:
+    # Log-space profile HMM in the S, I0, M1, D1, I1, ..., E layout. Block j holds M_j,
+    # D_j and I_j; S plays the role of M_0 and E the role of M_L+1, so every transition
+    # vector below is indexed by the block it leaves.
+    def __init__(self, transfer_fractions, emission_fractions, match_count, alphabet):
+        self.match_count = match_count
+        self.alphabet = list(alphabet)
+        self.symbol_to_index = {symbol: i for i, symbol in enumerate(self.alphabet)}
+        names = state_names(match_count)
+        match_names = ["S"] + names[2:-1:3] + ["E"]
+        delete_names = [None] + names[3:-1:3]
+        insert_names = names[1:-1:3]
+
+        def transfer(from_names, to_names):
+            probs = [transfer_fractions.get(a, {}).get(b, 0.0) if a and b else 0.0
+                     for a, b in zip(from_names, to_names)]
+            return log_matrix(probs)
+
+        next_match = match_names[1:]
+        next_delete = delete_names[1:] + [None]
+        self.mm = transfer(match_names[:-1], next_match)
+        self.mi = transfer(match_names[:-1], insert_names)
+        self.md = transfer(match_names[:-1], next_delete)
+        self.im = transfer(insert_names, next_match)
+        self.ii = transfer(insert_names, insert_names)
+        self.id = transfer(insert_names, next_delete)
+        self.dm = transfer(delete_names, next_match)
+        self.di = transfer(delete_names, insert_names)
+        self.dd = transfer(delete_names, next_delete)
+
+        def emission(state_names_):
+            return log_matrix([[emission_fractions.get(name, {}).get(symbol, 0.0) if name else 0.0
+                                for name in state_names_] for symbol in self.alphabet])
+
+        # Emission columns are indexed [symbol, block]; block 0 of the match row is S.
+        self.match_emissions = emission([None] + names[2:-1:3])
+        self.insert_emissions = emission(insert_names)
+
+    def encode(self, sequence):
+        return encode_emissions(sequence, self.symbol_to_index)
+
+
+def chain_scan(a, d, combine):
+    # Solves D[j] = combine(a[j], D[j-1] + d[j]) along the last axis with log2(L) shifted
+    # combines; only additions are used, so -inf transitions never produce NaN.
+    a = a.copy()
+    d = np.broadcast_to(d, a.shape).copy()
+    shift = 1
+    while shift < a.shape[-1]:
+        a[..., shift:] = combine(a[..., shift:], a[..., :-shift] + d[..., shift:])
+        d[..., shift:] = d[..., shift:] + d[..., :-shift]
+        shift *= 2
+    return a
+
+def band_limits(i, lengths, match_count, band):
+    if band is None:
+        return np.zeros(len(lengths), dtype=np.intp), np.full(len(lengths), match_count)
+    center = i * match_count / np.maximum(lengths, 1)
+    lo = np.maximum(0, np.floor(center - band)).astype(np.intp)
+    hi = np.minimum(match_count, np.ceil(center + band)).astype(np.intp)
+    return lo, hi
+
+def run_profile_dp(model, encoded, band, combine, keep_backtrack):
+    # All sequences advance together, longest first, over (B, L+1) score columns; a
+    # row's final column is read off as soon as its sequence runs out.
+    codes, offsets = pack_sequences(encoded, model.symbol_to_index)
+    order, padded, active = pad_sequences(codes, offsets)
+    lengths = sequence_lengths(offsets)[order]
+    n_seqs, max_length = padded.shape
+    width = model.match_count + 1
+    last = model.match_count
+    columns = np.arange(width)
+    tally("columns", len(codes))
+    tally("cells", 3 * len(codes) * width)
+    backtrack = np.zeros((3, max_length + 1, n_seqs, width), dtype=np.int8) if keep_backtrack else None
+
+    match_col = np.full((n_seqs, width), -np.inf)
+    insert_col = np.full((n_seqs, width), -np.inf)
+    match_col[:, 0] = 0.0
+    delete_col = delete_column(model, match_col, insert_col, 
+                               backtrack[DELETE, 0] if keep_backtrack else None, 0, last, combine)
+    final = np.full((n_seqs, 3), -np.inf)
+    finish_columns(model, final, match_col, insert_col, delete_col, lengths == 0)
+
+    with phase("columns"):
+        for i in range(1, max_length + 1):
+            n = active[i-1]
+            symbols = padded[:n, i-1]
+            lo, hi = band_limits(i, lengths[:n], model.match_count, band)
+            outside = (columns < lo[:, None]) | (columns > hi[:, None])
+            col_lo, col_hi = int(lo.min()), int(hi.max())
+            prev = (match_col[:n].copy(), insert_col[:n].copy(), delete_col[:n])
+            match_col[:n] = -np.inf
+            insert_col[:n] = -np.inf
+
+            j = slice(max(col_lo, 1), col_hi + 1)
+            k = slice(max(col_lo, 1) - 1, col_hi)
+            scores = np.stack([prev[MATCH][:, k] + model.mm[k], prev[INSERT][:, k] + model.im[k],
+                               prev[DELETE][:, k] + model.dm[k]])
+            if keep_backtrack:
+                backtrack[MATCH, i, :n, j] = scores.argmax(axis=0)
+            match_col[:n, j] = combine.reduce(scores, axis=0) + model.match_emissions[symbols[:, None], columns[j]]
+
+            j = slice(col_lo, col_hi + 1)
+            scores = np.stack([prev[MATCH][:, j] + model.mi[j], prev[INSERT][:, j] + model.ii[j],
+                               prev[DELETE][:, j] + model.di[j]])
+            if keep_backtrack:
+                backtrack[INSERT, i, :n, j] = scores.argmax(axis=0)
+            insert_col[:n, j] = combine.reduce(scores, axis=0) + model.insert_emissions[symbols[:, None], columns[j]]
+
+            match_col[:n][outside] = -np.inf
+            insert_col[:n][outside] = -np.inf
+            delete_col = np.full((n_seqs, width), -np.inf)
+            delete_col[:n] = delete_column(model, match_col[:n], insert_col[:n], 
+                                           backtrack[DELETE, i, :n] if keep_backtrack else None, 
+                                           col_lo, col_hi, combine)
+            delete_col[:n][outside] = -np.inf
+            finish_columns(model, final, match_col, insert_col, delete_col, lengths == i)
+
+    return order, lengths, final, backtrack
+
+def finish_columns(model, final, match_col, insert_col, delete_col, finished):
+    last = model.match_count
+    final[finished] = np.stack([match_col[finished, last] + model.mm[last], 
+                                insert_col[finished, last] + model.im[last],
+                                delete_col[finished, last] + model.dm[last]], axis=1)
+
+def delete_column(model, match_col, insert_col, backpointers, lo, hi, combine):
+    delete_col = np.full(match_col.shape, -np.inf)
+    j = slice(max(lo, 1), hi + 1)
+    k = slice(max(lo, 1) - 1, hi)
+    entry = combine(match_col[:, k] + model.md[k], insert_col[:, k] + model.id[k])
+    delete_col[:, j] = chain_scan(entry, np.concatenate([[-np.inf], model.dd[k][1:]]), combine)
+    if backpointers is not None:
+        scores = np.stack([match_col[:, k] + model.md[k], insert_col[:, k] + model.id[k],
+                           delete_col[:, k] + model.dd[k]])
+        backpointers[:, j] = scores.argmax(axis=0)
+    return delete_col
+
+def traceback_path(backtrack, row, i, j, state_type):
+    path = []
+    while not (state_type == MATCH and j == 0):
+        if state_type == MATCH:
+            path.append(f"M{j}")
+            state_type, i, j = backtrack[MATCH, i, row, j], i - 1, j - 1
+        elif state_type == INSERT:
+            path.append(f"I{j}")
+            state_type, i = backtrack[INSERT, i, row, j], i - 1
+        else:
+            path.append(f"D{j}")
+            state_type, j = backtrack[DELETE, i, row, j], j - 1
+    return path[::-1]
+
+
+def align_batch(model, sequences, band=None):
+    order, lengths, final, backtrack = run_profile_dp(model, sequences, band, np.maximum, True)
+    results = [None] * len(order)
+    for row, seq in enumerate(order.tolist()):
+        state_type = int(final[row].argmax())
+        score = float(final[row, state_type])
+        if not np.isfinite(score):
+            results[seq] = (-np.inf, [])
+        else:
+            with phase("traceback"):
+                results[seq] = (score, traceback_path(backtrack, row, lengths[row], model.match_count, state_type))
+    return results
+
+def score_batch(model, sequences, band=None):
+    order, _, final, _ = run_profile_dp(model, sequences, band, np.logaddexp, False)
+    scores = np.empty(len(order))
+    scores[order] = np.logaddexp.reduce(final, axis=1)
+    return scores
+
+def viterbi_align(model, sequence, band=None):
+    return align_batch(model, [sequence], band)[0]
+
+def forward_score(model, sequence, band=None):
+    return float(score_batch(model, [sequence], band)[0])
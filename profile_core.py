@@ -0,0 +1,455 @@
+from math import lgamma
+from typing import Dict, Set
+
+import numpy as np
+
+from instrument import phase, phased, tally
+from kernels import use_jit, profile_count_kernel
+from streaming import read_alignment_rows
+
+GAP = ord("-")
+# Every profile transition moves 0-4 states forward in the S, I0, M1, D1, I1, ..., E
+# layout (M_k -> D_k+1 is the longest jump), so counts are stored as a band.
+TRANSFER_SPAN = 5
+
+class ProfileCalculator:
+    def __init__(self, alignment, alphabet, threshold, prior=None, block_rows=4096, scan=None):
+        # Either an in-memory (rows, columns) uint8 array or a lazy row source such as
+        # streaming.AlignmentRows, which is read block by block on each pass.
+        self.alignment = encode_alignment(alignment)
+        self.alphabet = alphabet
+        self.threshold = threshold
+        self.prior = prior if prior is not None else NoPrior()
+        self.block_rows = block_rows
+        # add_sequences keeps the rows in a buffer with spare capacity; see append_rows.
+        self.row_buffer = None
+        # scan is a scan_alignment result computed elsewhere, e.g. merged from shards.
+        with phase("parse"):
+            self.count, self.len, self.gap_counts, self.symbol_counts = \
+                scan if scan is not None else scan_alignment(self.iter_blocks())
+        # Symbols outside the alphabet are still counted, as extra emission columns.
+        self.symbols = list(alphabet) + extra_symbols(self.symbol_counts, alphabet)
+        self.symbol_to_index = symbol_table(self.symbols)
+        self.ignore_cols: Set[int] = self.get_ignored_columns()
+        self.match_count: int = None
+        self.transfer_counts: np.ndarray = None
+        self.emission_counts: np.ndarray = None
+
+    def get_ignored_columns(self):
+        return set(np.flatnonzero(self.gap_counts / self.count >= self.threshold).tolist())
+
+    def calculate(self):
+        # The counts are kept after the first call and updated in place by
+        # add_sequences / remove_sequences.
+        if self.transfer_counts is None:
+            with phase("columns"):
+                self.count_transitions()
+        with phase("setup"):
+            transfer_probs, emission_probs = self.probabilities()
+        allowed = allowed_transfers(self.match_count)
+        emitting = emitting_states(self.match_count)
+        transfer_support = self.transfer_counts > 0
+        emission_support = self.emission_counts > 0
+        if self.prior.fills_support:
+            transfer_support |= allowed
+            emission_support[emitting, :len(self.alphabet)] = True
+        transfer_fractions = band_to_fractions(transfer_probs, transfer_support, self.match_count)
+        emission_fractions = emission_to_fractions(emission_probs, emission_support, 
+                                                   self.symbols, self.match_count)
+        return transfer_fractions, emission_fractions, self.match_count
+
+    def probabilities(self):
+        transfer_probs = self.prior.transfer_probabilities(
+            self.transfer_counts, allowed_transfers(self.match_count))
+        emission_probs = self.prior.emission_probabilities(
+            self.emission_counts, emitting_states(self.match_count), len(self.alphabet))
+        return transfer_probs, emission_probs
+
+    def count_transitions(self):
+        is_match = self.match_columns()
+        self.match_count = int(is_match.sum())
+        self.transfer_counts, self.emission_counts = self.count_rows(self.iter_blocks(), is_match)
+
+    def match_columns(self):
+        is_match = np.ones(self.len, dtype=bool)
+        is_match[list(self.ignore_cols)] = False
+        return is_match
+
+    def count_rows(self, blocks, is_match):
+        n_states = 3 * int(is_match.sum()) + 3
+        transfer_counts = np.zeros((n_states, TRANSFER_SPAN), dtype=np.int64)
+        emission_counts = np.zeros((n_states, len(self.symbols)), dtype=np.int64)
+        tally("columns", len(is_match))
+        for block in blocks:
+            tally("cells", block.size)
+            count_paths(block, is_match, self.symbol_to_index, transfer_counts, emission_counts)
+        return transfer_counts, emission_counts
+
+    def add_sequences(self, sequences):
+        rows = encode_alignment(sequences)
+        if rows.shape[1] != self.len:
+            raise ValueError("All aligned sequences must have the same length")
+        self.append_rows(rows)
+        self.update_counts(rows, 1)
+
+    def remove_sequences(self, indices):
+        # indices are row positions in the current alignment, added rows included;
+        # negative positions count from the end and repeats are removed once.
+        alignment = self.in_memory_alignment()
+        indices = np.asarray(indices, dtype=np.intp).ravel()
+        if np.any((indices < -len(alignment)) | (indices >= len(alignment))):
+            raise IndexError("Row index out of range")
+        indices = np.unique(indices % len(alignment))
+        if len(indices) == self.count:
+            raise ValueError("The alignment has no rows")
+        rows = alignment[indices]
+        keep = np.ones(len(alignment), dtype=bool)
+        keep[indices] = False
+        remaining = alignment[keep]
+        if self.row_buffer is not None:
+            self.row_buffer[:len(remaining)] = remaining
+            remaining = self.row_buffer[:len(remaining)]
+        self.alignment = remaining
+        self.update_counts(rows, -1)
+
+    def append_rows(self, rows):
+        # Capacity doubles when it runs out, so a run of adds copies the alignment
+        # O(log N) times instead of once per call.
+        alignment = self.in_memory_alignment()
+        n_rows = len(alignment) + len(rows)
+        if self.row_buffer is None or len(self.row_buffer) < n_rows:
+            row_buffer = np.empty((max(2 * n_rows, 16), self.len), dtype=np.uint8)
+            row_buffer[:len(alignment)] = alignment
+            self.row_buffer = row_buffer
+        self.row_buffer[len(alignment):n_rows] = rows
+        self.alignment = self.row_buffer[:n_rows]
+
+    def in_memory_alignment(self):
+        # Updates need random access to the rows, so a streamed source is read in once.
+        if hasattr(self.alignment, "blocks"):
+            self.alignment = self.alignment.to_array()
+        return self.alignment
+
+    def update_counts(self, rows, sign):
+        # The rows are counted on their own under the current match columns and added to
+        # (or taken off) the kept counts. Columns that cross the threshold as a result
+        # only change the count rows of the segments around them; see recount_segments.
+        row_symbols = np.bincount(rows.ravel(), minlength=256)
+        old_is_match, old_ignore_cols = self.match_columns(), self.ignore_cols
+        self.count += sign * len(rows)
+        self.gap_counts += sign * (rows == GAP).sum(axis=0)
+        if sign > 0:
+            self.symbol_counts += row_symbols
+            self.update_symbols()
+        if self.transfer_counts is not None:
+            blocks = (rows[row:row + self.block_rows] for row in range(0, len(rows), self.block_rows))
+            transfer_counts, emission_counts = self.count_rows(blocks, old_is_match)
+            self.transfer_counts += sign * transfer_counts
+            self.emission_counts += sign * emission_counts
+        if sign < 0:
+            self.symbol_counts -= row_symbols
+            self.update_symbols()
+        self.ignore_cols = self.get_ignored_columns()
+        if self.transfer_counts is not None and self.ignore_cols != old_ignore_cols:
+            self.recount_segments(old_is_match, self.match_columns())
+
+    def update_symbols(self):
+        symbols = list(self.alphabet) + extra_symbols(self.symbol_counts, self.alphabet)
+        if symbols == self.symbols:
+            return
+        if self.emission_counts is not None:
+            emission_counts = np.zeros((len(self.emission_counts), len(symbols)), dtype=np.int64)
+            for i, symbol in enumerate(self.symbols):
+                if symbol in symbols:
+                    emission_counts[:, symbols.index(symbol)] = self.emission_counts[:, i]
+            self.emission_counts = emission_counts
+        self.symbols = symbols
+        self.symbol_to_index = symbol_table(symbols)
+
+    def recount_segments(self, old_is_match, is_match):
+        # Count rows come in segments, one per match column plus one for S/I0: the
+        # segment from match column m_k to m_k+1 holds the M_k, D_k and I_k rows, and
+        # they depend on nothing but the cells in those columns. Segments whose column
+        # span is unchanged are copied over; only the spans around a flipped column are
+        # walked again, in one pass over all rows but only their own columns.
+        old_segments = {span: k for k, span in enumerate(segment_spans(old_is_match))}
+        spans = segment_spans(is_match)
+        self.match_count = int(is_match.sum())
+        n_states = 3 * self.match_count + 3
+        transfer_counts = np.zeros((n_states, TRANSFER_SPAN), dtype=np.int64)
+        emission_counts = np.zeros((n_states, len(self.symbols)), dtype=np.int64)
+        new_segments = [k for k, span in enumerate(spans) if span not in old_segments]
+        counted = self.count_segments([spans[k] for k in new_segments])
+        for k, (transfer_rows, emission_rows) in zip(new_segments, counted):
+            transfer_counts[segment_rows(k)] = transfer_rows
+            emission_counts[segment_rows(k)] = emission_rows
+        for k, span in enumerate(spans):
+            if span in old_segments:
+                old_rows = segment_rows(old_segments[span])
+                transfer_counts[segment_rows(k)] = self.transfer_counts[old_rows]
+                emission_counts[segment_rows(k)] = self.emission_counts[old_rows]
+        self.transfer_counts, self.emission_counts = transfer_counts, emission_counts
+
+    def count_segments(self, spans):
+        # The spans' columns, side by side in column order, form a profile of their own in
+        # which every span starts a segment (the first span may be S's, the last may end
+        # at E) and the band offsets agree with the full profile's. Where one span ends
+        # and the next begins the path crosses a segment that is not kept.
+        if not spans:
+            return []
+        pieces, firsts = [], []
+        for start, stop in spans:
+            first, last = max(start, 0), min(stop, self.len - 1)
+            piece = np.zeros(last - first + 1, dtype=bool)
+            piece[0] |= start >= 0
+            piece[-1] |= stop < self.len
+            firsts.append(sum(len(piece) for piece in pieces))
+            pieces.append(piece)
+        is_match = np.concatenate(pieces)
+        columns = np.concatenate([np.arange(max(start, 0), max(start, 0) + len(piece)) 
+                                  for (start, _), piece in zip(spans, pieces)])
+        match_index = np.cumsum(is_match)
+        blocks = (block[:, columns] for block in self.iter_blocks())
+        transfer_counts, emission_counts = self.count_rows(blocks, is_match)
+        rows = [segment_rows(int(match_index[first]) if start >= 0 else 0) 
+                for first, (start, _) in zip(firsts, spans)]
+        return [(transfer_counts[row], emission_counts[row]) for row in rows]
+
+    def iter_blocks(self):
+        if hasattr(self.alignment, "blocks"):
+            yield from self.alignment.blocks(self.block_rows)
+        else:
+            for row in range(0, len(self.alignment), self.block_rows):
+                yield self.alignment[row:row + self.block_rows]
+
+
+class NoPrior:
+    fills_support = False
+
+    def transfer_probabilities(self, counts, allowed):
+        return normalize_rows(counts)
+
+    def emission_probabilities(self, counts, emitting, n_alphabet):
+        return normalize_rows(counts)
+
+class PseudocountPrior:
+    # Adds pseudo_factor to every allowed transition and every alphabet symbol of the
+    # M/I states after the observed counts are normalized, then renormalizes.
+    fills_support = True
+
+    def __init__(self, pseudo_factor):
+        self.pseudo_factor = pseudo_factor
+
+    def transfer_probabilities(self, counts, allowed):
+        return normalize_rows(normalize_rows(counts) + self.pseudo_factor * allowed)
+
+    def emission_probabilities(self, counts, emitting, n_alphabet):
+        fractions = normalize_rows(counts)
+        fractions[emitting, :n_alphabet] += self.pseudo_factor
+        return normalize_rows(fractions)
+
+class DirichletMixturePrior:
+    # Emission rows get the posterior mean under a mixture of Dirichlet components
+    # (weights: J, alphas: J x |alphabet|); transitions get a flat Dirichlet over the
+    # allowed moves with concentration transition_alpha.
+    fills_support = True
+
+    def __init__(self, weights, alphas, transition_alpha=1.0):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.alphas = np.atleast_2d(np.asarray(alphas, dtype=np.float64))
+        self.transition_alpha = transition_alpha
+        if len(self.weights) != len(self.alphas):
+            raise ValueError("Need one weight per Dirichlet component")
+
+    def transfer_probabilities(self, counts, allowed):
+        return normalize_rows(counts + self.transition_alpha * allowed)
+
+    def emission_probabilities(self, counts, emitting, n_alphabet):
+        if self.alphas.shape[1] != n_alphabet:
+            raise ValueError("Dirichlet components must cover the alphabet")
+        probs = normalize_rows(counts.astype(np.float64))
+        observed = counts[emitting].astype(np.float64)
+        alphas = np.zeros((len(self.alphas), counts.shape[1]))
+        alphas[:, :n_alphabet] = self.alphas
+        # log P(n | component j) up to a term shared by every component.
+        log_beta_prior = log_beta(self.alphas)
+        log_beta_post = log_beta(observed[:, None, :n_alphabet] + self.alphas[None, :, :])
+        log_posterior = np.log(self.weights) + log_beta_post - log_beta_prior
+        log_posterior -= log_posterior.max(axis=1, keepdims=True)
+        posterior = np.exp(log_posterior)
+        posterior /= posterior.sum(axis=1, keepdims=True)
+        component_means = (observed[:, None, :] + alphas[None, :, :]) / \
+            (observed.sum(axis=1)[:, None, None] + alphas.sum(axis=1)[None, :, None])
+        probs[emitting] = (posterior[:, :, None] * component_means).sum(axis=1)
+        return probs
+
+_lgamma = np.frompyfunc(lgamma, 1, 1)
+
+def log_beta(alphas):
+    return _lgamma(alphas).astype(np.float64).sum(axis=-1) - \
+        _lgamma(alphas.sum(axis=-1)).astype(np.float64)
+
+
+def encode_alignment(alignment):
+    if isinstance(alignment, np.ndarray):
+        return alignment.astype(np.uint8, copy=False)
+    if hasattr(alignment, "blocks"):
+        return alignment
+    alignment = list(alignment)
+    width = len(alignment[0])
+    if any(len(seq) != width for seq in alignment):
+        raise ValueError("All aligned sequences must have the same length")
+    raw = np.frombuffer("".join(alignment).encode("latin-1"), dtype=np.uint8)
+    return raw.reshape(len(alignment), width)
+
+def scan_alignment(blocks):
+    count, width = 0, None
+    gap_counts = None
+    symbol_counts = np.zeros(256, dtype=np.int64)
+    for block in blocks:
+        if width is None:
+            width = block.shape[1]
+            gap_counts = np.zeros(width, dtype=np.int64)
+        elif block.shape[1] != width:
+            raise ValueError("All aligned sequences must have the same length")
+        count += len(block)
+        gap_counts += (block == GAP).sum(axis=0)
+        symbol_counts += np.bincount(block.ravel(), minlength=256)
+    if width is None:
+        raise ValueError("The alignment has no rows")
+    return count, width, gap_counts, symbol_counts
+
+def extra_symbols(symbol_counts, alphabet):
+    present = np.flatnonzero(symbol_counts)
+    known = {ord(symbol) for symbol in alphabet} | {GAP}
+    return [chr(code) for code in present.tolist() if code not in known]
+
+def count_paths(block, is_match, symbol_to_index, transfer_counts, emission_counts):
+    if use_jit():
+        profile_count_kernel(block, is_match, symbol_to_index, transfer_counts, emission_counts)
+        return
+    n_states = len(transfer_counts)
+    end_state = n_states - 1
+    is_gap = block == GAP
+    states = cell_states(is_gap, is_match)
+    # Bracket every row with S and E; in row-major order the only pair that crosses
+    # from one row to the next is E -> S, which is dropped.
+    path = np.empty((len(block), block.shape[1] + 2), dtype=np.int64)
+    path[:, 0] = 0
+    path[:, 1:-1] = states
+    path[:, -1] = end_state
+    visited = np.ones(path.shape, dtype=bool)
+    visited[:, 1:-1] = states >= 0
+    path = path[visited]
+    from_states = path[:-1]
+    to_states = path[1:]
+    within_row = from_states != end_state
+    from_states = from_states[within_row]
+    offsets = to_states[within_row] - from_states
+    transfer_counts += np.bincount(from_states * TRANSFER_SPAN + offsets, 
+                                   minlength=n_states * TRANSFER_SPAN).reshape(n_states, TRANSFER_SPAN)
+
+    emitted = ~is_gap
+    symbols = symbol_to_index[block[emitted]]
+    n_symbols = emission_counts.shape[1]
+    emission_counts += np.bincount(states[emitted] * n_symbols + symbols, 
+                                   minlength=n_states * n_symbols).reshape(n_states, n_symbols)
+
+def segment_spans(is_match):
+    # (first, last) column of every segment, with -1 standing for S and len(is_match) for E.
+    bounds = [-1] + np.flatnonzero(is_match).tolist() + [len(is_match)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def segment_rows(k):
+    # Count rows of segment k: S and I0 for the first, M_k, D_k and I_k after that.
+    return slice(0, 2) if k == 0 else slice(3 * k - 1, 3 * k + 2)
+
+def symbol_table(alphabet):
+    table = np.full(256, -1, dtype=np.int64)
+    for i, symbol in enumerate(alphabet):
+        table[ord(symbol)] = i
+    return table
+
+def cell_states(is_gap, is_match):
+    # M_k = 3k-1, D_k = 3k, I_k = 3k+1, where k counts the match columns up to this one.
+    # Gaps in insert columns are skipped and get -1.
+    match_index = np.cumsum(is_match)
+    states = np.where(is_match, 3 * match_index - 1 + is_gap, 3 * match_index + 1)
+    states[is_gap & ~is_match] = -1
+    return states
+
+def state_names(match_count):
+    names = ["S", "I0"]
+    for i in range(match_count):
+        names.append(f"M{i+1}")
+        names.append(f"D{i+1}")
+        names.append(f"I{i+1}")
+    names.append("E")
+    return names
+
+def normalize_rows(counts):
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, counts / totals, 0.0)
+
+def allowed_transfers(match_count):
+    # S -> I0, M1, D1; M_k -> I_k, M_k+1, D_k+1; D_k -> I_k, M_k+1, D_k+1;
+    # I_k -> I_k, M_k+1, D_k+1. Past the last match state M_L+1 lands on E.
+    n_states = 3 * match_count + 3
+    allowed = np.zeros((n_states, TRANSFER_SPAN), dtype=bool)
+    kind = np.arange(n_states) % 3
+    allowed[kind == 2, 2:5] = True
+    allowed[kind == 0, 1:4] = True
+    allowed[kind == 1, 0:3] = True
+    allowed[n_states - 1] = False
+    targets = np.arange(n_states)[:, None] + np.arange(TRANSFER_SPAN)[None, :]
+    allowed &= targets < n_states
+    return allowed
+
+def emitting_states(match_count):
+    n_states = 3 * match_count + 3
+    states = np.arange(n_states)
+    return np.flatnonzero((states % 3 != 0) & (states != n_states - 1))
+
+def band_to_fractions(transfer_band, transfer_support, match_count):
+    names = state_names(match_count)
+    fractions = {}
+    for state, offset in zip(*np.nonzero(transfer_support)):
+        fractions.setdefault(names[state], {})[names[state + offset]] = float(transfer_band[state, offset])
+    return fractions
+
+def emission_to_fractions(emission_matrix, emission_support, alphabet, match_count):
+    names = state_names(match_count)
+    fractions = {}
+    for state, symbol in zip(*np.nonzero(emission_support)):
+        fractions.setdefault(names[state], {})[alphabet[symbol]] = float(emission_matrix[state, symbol])
+    return fractions
+
+
+def read_alignment_input():
+    # The rows are left in input.txt and streamed into ProfileCalculator block by block.
+    return read_alignment_rows("input.txt")
+
+@phased("output")
+def print_transfer_fractions(transfer_fractions: Dict[str, Dict[str, float]], match_count: int, file):
+    matrix_headers = state_names(match_count)
+    header_print = "\t".join([""] + matrix_headers)
+    print(header_print, file=file)
+    for state in matrix_headers:
+        row = [state]
+        for next_state in matrix_headers:
+            value = transfer_fractions.get(state, {}).get(next_state, 0)
+            row.append(f"{value}")
+        print("\t".join(row), file=file)
+
+@phased("output")
+def print_emission_fractions(emission_fractions: Dict[str, Dict[str, float]], alphabet: list, match_count: int, file):
+    matrix_headers = list(alphabet)
+    header_print = "\t".join([""] + matrix_headers)
+    print(header_print, file=file)
+    for state in state_names(match_count):
+        row = [state]
+        for symbol in matrix_headers:
+            value = emission_fractions.get(state, {}).get(symbol, 0)
+            row.append(f"{value}")
+        print("\t".join(row), file=file)
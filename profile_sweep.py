@@ -0,0 +1,87 @@
+import sys
+
+import numpy as np
+
+from instrument import capture, phase
+from model_io import save_profile_sweep
+from profile_core import ProfileCalculator, PseudocountPrior, NoPrior
+from profile_core import read_alignment_input, print_transfer_fractions, print_emission_fractions
+
+
+# Several thresholds over one alignment. The alignment is scanned once and the columns
+# are sorted by gap fraction, so the match columns of any threshold are a prefix of that
+# order. Thresholds are visited in increasing order, each adding the columns whose
+# fraction falls below it, and the counts of the previous threshold are carried over:
+# recount_segments only walks the segments around the added columns. The pseudo_factor
+# values share the counts of their threshold and only renormalize.
+
+def columns_by_gap_fraction(calculator):
+    gap_fractions = calculator.gap_counts / calculator.count
+    order = np.argsort(gap_fractions, kind="stable")
+    return order, gap_fractions[order]
+
+def set_threshold(calculator, threshold, order, sorted_fractions):
+    # Same test as get_ignored_columns (gap fraction >= threshold), read off the sort.
+    old_is_match = calculator.match_columns()
+    calculator.threshold = threshold
+    calculator.ignore_cols = set(order[np.searchsorted(sorted_fractions, threshold, side="left"):].tolist())
+    if calculator.transfer_counts is None:
+        calculator.count_transitions()
+    else:
+        calculator.recount_segments(old_is_match, calculator.match_columns())
+
+def sweep_profiles(alignment, alphabet, thresholds, pseudo_factors=None, block_rows=4096, binary=False):
+    # Returns (threshold, pseudo_factor, profile) in the order of thresholds, then of
+    # pseudo_factors. profile is calculate()'s (transfer_fractions, emission_fractions,
+    # match_count), or with binary=True the probability band, emission matrix and
+    # match count that model_io.save_profile stores.
+    priors = [NoPrior()] if pseudo_factors is None else [PseudocountPrior(factor) for factor in pseudo_factors]
+    calculator = ProfileCalculator(alignment, alphabet, min(thresholds), block_rows=block_rows)
+    order, sorted_fractions = columns_by_gap_fraction(calculator)
+    profiles = {}
+    for threshold in sorted(set(thresholds)):
+        with phase("columns"):
+            set_threshold(calculator, threshold, order, sorted_fractions)
+        for prior in priors:
+            calculator.prior = prior
+            if binary:
+                with phase("setup"):
+                    transfer_probs, emission_probs = calculator.probabilities()
+                profile = transfer_probs, emission_probs[:, :len(alphabet)], calculator.match_count
+            else:
+                profile = calculator.calculate()
+            profiles[threshold, getattr(prior, "pseudo_factor", None)] = profile
+    factors = [None] if pseudo_factors is None else pseudo_factors
+    return [(threshold, factor, profiles[threshold, factor]) for threshold in thresholds for factor in factors]
+
+def compute_profile_hmms(alignment, alphabet, thresholds, pseudo_factors=None, binary_path=None):
+    if binary_path is None:
+        return sweep_profiles(alignment, alphabet, thresholds, pseudo_factors)
+    profiles = sweep_profiles(alignment, alphabet, thresholds, pseudo_factors, binary=True)
+    save_profile_sweep(binary_path, [(threshold, factor) + profile for threshold, factor, profile in profiles],
+                       alphabet)
+    return profiles
+
+def parse_values(argument):
+    return [float(value) for value in argument.split(",")]
+
+
+if __name__ == "__main__":
+    # Usage: python profile_sweep.py THRESHOLDS [PSEUDO_FACTORS] [BINARY_PATH]
+    # THRESHOLDS and PSEUDO_FACTORS are comma-separated ("-" for no pseudocounts). The
+    # alignment comes from input.txt, whose own parameters are ignored; every profile is
+    # written to output.txt after a "threshold pseudo_factor" line, or to BINARY_PATH.
+    with capture():
+        thresholds = parse_values(sys.argv[1])
+        pseudo_factors = parse_values(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] != "-" else None
+        binary_path = sys.argv[3] if len(sys.argv) > 3 else None
+        alignment, alphabet, _ = read_alignment_input()
+        profiles = compute_profile_hmms(alignment, alphabet, thresholds, pseudo_factors, binary_path)
+        if binary_path is None:
+            with open("output.txt", "wt") as output_file:
+                for threshold, pseudo_factor, (transfer_fractions, emission_fractions, match_count) in profiles:
+                    print(f"{threshold} {'-' if pseudo_factor is None else pseudo_factor}", file=output_file)
+                    print_transfer_fractions(transfer_fractions, match_count, file=output_file)
+                    print("--------", file=output_file)
+                    print_emission_fractions(emission_fractions, alphabet, match_count, file=output_file)
+                    print("========", file=output_file)
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from batch import pack_sequences, viterbi_batch, compute_path_probability_batch, forward_backward_batch
+from compiled import compile_model
+from instrument import capture
+from model_io import load_hmm
+from streaming import read_hmm_input
+from viterbi import viterbi_log
+
+# One JSON object per line each way. A request names an operation and either a model
+# loaded at start-up or an inline model, which goes through the compiled-model cache:
+#   {"id": 1, "op": "decode", "model": "cpg", "sequence": "xyzzx"}
+#   {"id": 2, "op": "score", "model": {"states": [...], "emissions": [...],
+#                                      "state_matrix": [[...]], "emission_matrix": [[...]]}, "sequence": "..."}
+#   {"id": 3, "op": "stats"}
+# decode answers {"id", "path", "log_probability"}, score {"id", "log_probability"},
+# posterior {"id", "path", "confidence"}; failures answer {"id", "error"}.
+OPERATIONS = ("decode", "score", "posterior")
+MAX_BATCH_SIZE = 64
+MAX_WAIT = 0.002
+LATENCY_WINDOW = 10000
+# A batcher with no request for this long stops, so inline models that are no longer
+# used do not keep a task (and the model) alive.
+IDLE_TIMEOUT = 60.0
+
+
+def load_model_file(path):
+    # Binary files written by model_io.save_hmm, otherwise the viterbi.py input.txt layout.
+    try:
+        states, emissions, state_matrix, emission_matrix, state_to_index, emission_to_index = load_hmm(path)
+    except ValueError:
+        _, emissions, states, state_matrix, emission_matrix, state_to_index, emission_to_index = \
+            read_hmm_input(path)
+    return compile_model(np.asarray(state_matrix), np.asarray(emission_matrix), state_to_index, emission_to_index)
+
+def inline_model(spec):
+    states, emissions = spec["states"], spec["emissions"]
+    return compile_model(np.array(spec["state_matrix"], dtype=np.float64),
+                         np.array(spec["emission_matrix"], dtype=np.float64),
+                         {state: i for i, state in enumerate(states)},
+                         {emission: i for i, emission in enumerate(emissions)})
+
+
+# Batch kernels, run on a worker thread. Each takes the model and a list of encoded
+# sequences and returns one response body per sequence.
+
+def decode_batch(model, sequences):
+    if model.sparse_viterbi:
+        # viterbi_batch needs the dense per-symbol score matrices.
+        results = []
+        for encoded in sequences:
+            best_path, score = viterbi_log(encoded, model.log_start, model.viterbi_transitions,
+                                           model.log_emission_matrix, symbol_scores=model.symbol_scores)
+            results.append({"path": model.decode_states(best_path), "log_probability": score})
+        return results
+    codes, offsets = pack_sequences(sequences, model.emission_to_index)
+    log_likelihoods, paths = viterbi_batch(codes, offsets, None, None, model)
+    return [{"path": model.decode_states(paths[offsets[i]:offsets[i+1]]), "log_probability": float(score)}
+            for i, score in enumerate(log_likelihoods.tolist())]
+
+def score_batch(model, sequences):
+    codes, offsets = pack_sequences(sequences, model.emission_to_index)
+    log_likelihoods = compute_path_probability_batch(codes, offsets, None, None, model)
+    return [{"log_probability": float(score)} for score in log_likelihoods.tolist()]
+
+def posterior_batch(model, sequences):
+    # Same answer as prob_path.compute_posterior_path, one padded forward-backward per batch.
+    codes, offsets = pack_sequences(sequences, model.emission_to_index)
+    _, posteriors = forward_backward_batch(codes, offsets, None, None, model)
+    best_states = posteriors.argmax(axis=1)
+    confidence = posteriors[np.arange(len(best_states)), best_states]
+    return [{"path": model.decode_states(best_states[start:stop]), "confidence": confidence[start:stop].tolist()}
+            for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+BATCH_KERNELS = {"decode": decode_batch, "score": score_batch, "posterior": posterior_batch}
+
+
+class Metrics:
+    def __init__(self):
+        # Throughput is measured from the first request, not from start-up.
+        self.started = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_requests += size
+
+    def record_request(self, latency, failed=False):
+        if self.started is None:
+            self.started = time.perf_counter() - latency
+        self.requests += 1
+        self.errors += failed
+        self.latencies.append(latency)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        latencies = np.array(self.latencies)
+        return {"requests": self.requests, "errors": self.errors, "batches": self.batches,
+                "mean_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+                "throughput": self.requests / elapsed if elapsed > 0 else 0.0,
+                **latency_summary(latencies)}
+
+def latency_summary(latencies):
+    if len(latencies) == 0:
+        return {"p50_ms": None, "p99_ms": None}
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return {"p50_ms": float(p50), "p99_ms": float(p99)}
+
+
+class MicroBatcher:
+    # Collects requests for one (model, operation) pair until max_batch_size of them are
+    # waiting or max_wait has passed since the first, then runs them as one batch. After
+    # idle_timeout without requests it calls on_idle and stops.
+    def __init__(self, model, kernel, executor, metrics, max_batch_size, max_wait, 
+                 idle_timeout=IDLE_TIMEOUT, on_idle=None):
+        self.model = model
+        self.kernel = kernel
+        self.executor = executor
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def submit(self, encoded):
+        # put_nowait does not yield, so a batcher handed out by DecodeServer.batcher
+        # always gets the request before it can go idle.
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((encoded, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                batch = [await asyncio.wait_for(self.queue.get(), self.idle_timeout)]
+            except asyncio.TimeoutError:
+                if self.queue.empty():
+                    if self.on_idle is not None:
+                        self.on_idle(self)
+                    return
+                continue
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.metrics.record_batch(len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.kernel, self.model,
+                                                     [encoded for encoded, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def close(self):
+        self.task.cancel()
+
+
+class DecodeServer:
+    def __init__(self, models=None, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT, threads=1, 
+                 idle_timeout=IDLE_TIMEOUT):
+        self.models = dict(models or {})
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.idle_timeout = idle_timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.metrics = Metrics()
+        self.batchers = {}
+
+    def batcher(self, model, op):
+        key = (model.key, op)
+        if key not in self.batchers:
+            self.batchers[key] = MicroBatcher(model, BATCH_KERNELS[op], self.executor, self.metrics,
+                                              self.max_batch_size, self.max_wait, self.idle_timeout, 
+                                              partial(self.drop_batcher, key))
+        return self.batchers[key]
+
+    def drop_batcher(self, key, batcher):
+        if self.batchers.get(key) is batcher:
+            del self.batchers[key]
+
+    async def handle_request(self, request):
+        op = request.get("op")
+        if op == "stats":
+            return self.metrics.snapshot()
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {op}")
+        spec = request.get("model")
+        if isinstance(spec, dict):
+            model = inline_model(spec)
+        elif spec in self.models:
+            model = self.models[spec]
+        else:
+            raise KeyError(f"Unknown model: {spec}")
+        # Encoded here so a bad symbol fails its own request rather than the whole batch.
+        encoded = model.encode("".join(request["sequence"].split()))
+        if len(encoded) == 0:
+            raise ValueError("Empty sequence")
+        return await self.batcher(model, op).submit(encoded)
+
+    async def respond(self, line, writer, lock):
+        start = time.perf_counter()
+        request_id, is_stats, failed = None, False, False
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object")
+            request_id, is_stats = request.get("id"), request.get("op") == "stats"
+            response = await self.handle_request(request)
+        except Exception as error:
+            response = {"error": f"{type(error).__name__}: {error}"}
+            failed = True
+        response = {"id": request_id, **response}
+        if not is_stats:
+            self.metrics.record_request(time.perf_counter() - start, failed)
+        async with lock:
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        # Requests on one connection are answered as they finish, not in order; the id
+        # ties a response to its request.
+        lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self.respond(line, writer, lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            await close_writer(writer)
+
+    async def serve(self, unix_path=None, host="127.0.0.1", port=8765):
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+        self.executor.shutdown(wait=False)
+
+
+async def close_writer(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+
+async def open_connection(unix_path=None, host="127.0.0.1", port=8765):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+async def request(unix_path, host, port, message):
+    reader, writer = await open_connection(unix_path, host, port)
+    writer.write(json.dumps(message).encode("utf-8") + b"\n")
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    await close_writer(writer)
+    return response
+
+async def run_load(unix_path, host, port, model, op, alphabet, n_requests, concurrency, length, seed):
+    # concurrency connections, each keeping one request in flight, n_requests in total.
+    rng = np.random.default_rng(seed)
+    sequences = ["".join(rng.choice(alphabet, length)) for _ in range(min(n_requests, 256))]
+    latencies = []
+    errors = 0
+    counter = iter(range(n_requests))
+
+    async def client():
+        nonlocal errors
+        reader, writer = await open_connection(unix_path, host, port)
+        for i in counter:
+            message = {"id": i, "op": op, "model": model, "sequence": sequences[i % len(sequences)]}
+            start = time.perf_counter()
+            writer.write(json.dumps(message).encode("utf-8") + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            errors += "error" in response
+        await close_writer(writer)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {"requests": n_requests, "errors": errors, "concurrency": concurrency, "seconds": elapsed,
+            "throughput": n_requests / elapsed if elapsed > 0 else 0.0, "symbols_per_second": n_requests * length / elapsed,
+            **latency_summary(np.array(latencies)),
+            "server": await request(unix_path, host, port, {"op": "stats"})}
+
+
+if __name__ == "__main__":
+    with capture():
+        # python server.py serve --model NAME=PATH [--unix PATH | --host H --port P]
+        # python server.py load --model NAME --alphabet xyz [--requests N --concurrency C]
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        for name in ("serve", "load"):
+            subparser = subparsers.add_parser(name)
+            subparser.add_argument("--unix", help="Unix socket path; TCP on --host/--port otherwise")
+            subparser.add_argument("--host", default="127.0.0.1")
+            subparser.add_argument("--port", type=int, default=8765)
+
+        serve_parser = subparsers.choices["serve"]
+        serve_parser.add_argument("--model", action="append", default=[], help="NAME=PATH, repeatable")
+        serve_parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+        serve_parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000)
+        serve_parser.add_argument("--threads", type=int, default=1)
+        serve_parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                                  help="seconds before an unused batcher stops")
+
+        load_parser = subparsers.choices["load"]
+        load_parser.add_argument("--model", required=True)
+        load_parser.add_argument("--op", choices=OPERATIONS, default="decode")
+        load_parser.add_argument("--alphabet", required=True, help="emission symbols, one character each")
+        load_parser.add_argument("--requests", type=int, default=1000)
+        load_parser.add_argument("--concurrency", type=int, default=32)
+        load_parser.add_argument("--length", type=int, default=200)
+        load_parser.add_argument("--seed", type=int, default=0)
+
+        args = parser.parse_args()
+        if args.command == "serve":
+            models = {}
+            for entry in args.model:
+                name, path = entry.split("=", 1)
+                models[name] = load_model_file(path)
+            server = DecodeServer(models, args.max_batch_size, args.max_wait_ms / 1000, args.threads, 
+                                  args.idle_timeout)
+            try:
+                asyncio.run(server.serve(args.unix, args.host, args.port))
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.close()
+        else:
+            print(json.dumps(asyncio.run(run_load(args.unix, args.host, args.port, args.model, args.op,
+                                                  list(args.alphabet), args.requests, args.concurrency,
+                                                  args.length, args.seed)), indent=2))
@@ -0,0 +1,213 @@
+import mmap
+import sys
+from contextlib import contextmanager
+
+import numpy as np
+
+from instrument import capture, phased, tally
+
+WHITESPACE = b" \t\r\n\v\f"
+NEWLINE = ord("\n")
+# Translation table markers; real symbol indices are 0..253 so chunks fit in uint8.
+SKIP = -1
+UNKNOWN = -2
+CHUNK_SIZE = 1 << 20
+
+
+@contextmanager
+def mapped_file(path):
+    # Slicing the map copies only the requested bytes, so no array ever pins the mapping.
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+def translation_table(symbol_to_index):
+    if len(symbol_to_index) > 254:
+        raise ValueError("At most 254 symbols can be encoded into uint8 chunks")
+    table = np.full(256, UNKNOWN, dtype=np.int16)
+    table[list(WHITESPACE)] = SKIP
+    for symbol, index in symbol_to_index.items():
+        table[ord(symbol)] = index
+    return table
+
+def translate(raw, table):
+    # Whitespace (line breaks in wrapped sequences) is dropped, anything else that is not
+    # in the alphabet is an error, as it is for compiled.encode_emissions.
+    codes = table[raw]
+    unknown = np.flatnonzero(codes == UNKNOWN)
+    if len(unknown):
+        raise KeyError(chr(raw[unknown[0]]))
+    return codes[codes != SKIP].astype(np.uint8)
+
+def find_line_end(mapped, start):
+    end = mapped.find(b"\n", start)
+    return end if end >= 0 else len(mapped)
+
+def read_bytes(mapped, start, stop):
+    return np.frombuffer(mapped[start:stop], dtype=np.uint8)
+
+
+class EncodedText:
+    # A byte range of a file, re-read through mmap on every pass and yielded as uint8
+    # symbol indices in chunks of at most chunk_size bytes. viterbi_stream, forward_stream
+    # and baum_welch (as a callable) all take it in place of a string.
+    def __init__(self, path, symbol_to_index, start=0, stop=None, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.table = translation_table(symbol_to_index)
+        self.start = start
+        self.stop = stop
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        with mapped_file(self.path) as mapped:
+            stop = len(mapped) if self.stop is None else self.stop
+            for offset in range(self.start, stop, self.chunk_size):
+                tally("bytes_parsed", min(offset + self.chunk_size, stop) - offset)
+                chunk = translate(read_bytes(mapped, offset, min(offset + self.chunk_size, stop)), self.table)
+                if len(chunk):
+                    yield chunk
+
+    def __call__(self):
+        return iter(self)
+
+    def to_array(self):
+        chunks = list(self)
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint8)
+
+
+class AlignmentRows:
+    # Aligned rows of a file from byte offset start on, one row per non-blank line,
+    # yielded as (rows, width) uint8 blocks of raw bytes without ever holding a str.
+    def __init__(self, path, start=0, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.start = start
+        self.chunk_size = chunk_size
+
+    def blocks(self, block_rows=4096):
+        pending = []
+        n_pending = 0
+        for rows in self.iter_rows():
+            pending.append(rows)
+            n_pending += len(rows)
+            while n_pending >= block_rows:
+                rows = np.concatenate(pending) if len(pending) > 1 else pending[0]
+                yield rows[:block_rows]
+                pending = [rows[block_rows:]]
+                n_pending -= block_rows
+        if n_pending:
+            yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+    def __iter__(self):
+        for rows in self.iter_rows():
+            for row in rows:
+                yield row.tobytes().decode("latin-1")
+
+    def iter_rows(self):
+        is_content = np.ones(256, dtype=bool)
+        is_content[list(WHITESPACE)] = False
+        width = None
+        with mapped_file(self.path) as mapped:
+            offset = self.start
+            while offset < len(mapped):
+                stop = min(offset + self.chunk_size, len(mapped))
+                if stop < len(mapped):
+                    # Only whole lines; a line longer than the chunk extends it.
+                    newline = mapped.rfind(b"\n", offset, stop)
+                    stop = (newline if newline >= 0 else find_line_end(mapped, stop)) + 1
+                raw = read_bytes(mapped, offset, stop)
+                tally("bytes_parsed", len(raw))
+                offset = stop
+                line_ids = np.cumsum(raw == NEWLINE) - (raw == NEWLINE)
+                keep = is_content[raw]
+                line_lengths = np.bincount(line_ids[keep], minlength=int(line_ids[-1]) + 1)
+                line_lengths = line_lengths[line_lengths > 0]
+                if len(line_lengths) == 0:
+                    continue
+                if width is None:
+                    width = int(line_lengths[0])
+                if np.any(line_lengths != width):
+                    raise ValueError("All aligned sequences must have the same length")
+                yield raw[keep].reshape(len(line_lengths), width)
+
+    def to_array(self):
+        blocks = list(self.blocks())
+        return np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.uint8)
+
+
+def read_separator(mapped, start):
+    end = find_line_end(mapped, start)
+    assert mapped[start:end].strip().startswith(b"-")
+    return end + 1
+
+def read_line(mapped, start):
+    end = find_line_end(mapped, start)
+    return mapped[start:end].decode("latin-1").strip(), end + 1
+
+@phased("parse")
+def read_hmm_input(path="input.txt", chunk_size=CHUNK_SIZE):
+    # Same layout as viterbi.read_input, but the emission path on the first line is left
+    # in the file and returned as an EncodedText over its byte range.
+    with mapped_file(path) as mapped:
+        path_end = find_line_end(mapped, 0)
+        offset = read_separator(mapped, path_end + 1)
+        line, offset = read_line(mapped, offset)
+        emissions = line.split()
+        offset = read_separator(mapped, offset)
+        line, offset = read_line(mapped, offset)
+        states = line.split()
+        offset = read_separator(mapped, offset)
+        model = mapped[offset:].decode("latin-1").splitlines()
+    state_to_index = {state: i for i, state in enumerate(states)}
+    emission_to_index = {emission: i for i, emission in enumerate(emissions)}
+    lines = iter(model)
+    state_matrix = read_matrix_rows(lines, states, states)
+    assert next(lines).startswith("-")
+    emission_matrix = read_matrix_rows(lines, states, emissions)
+    emission_path = EncodedText(path, emission_to_index, 0, path_end, chunk_size)
+    return emission_path, emissions, states, state_matrix, emission_matrix, state_to_index, emission_to_index
+
+def read_matrix_rows(lines, row_labels, headers):
+    assert next(lines).strip().split() == headers
+    matrix = np.empty((len(row_labels), len(headers)))
+    for i in range(len(row_labels)):
+        row = next(lines).strip().split()
+        assert len(row) - 1 == len(headers)
+        matrix[i] = np.array(row[1:], dtype=np.float64)
+    return matrix
+
+@phased("parse")
+def read_alignment_rows(path="input.txt", chunk_size=CHUNK_SIZE):
+    # Same layout as profile_core.read_alignment_input; the rows stay in the file.
+    with mapped_file(path) as mapped:
+        line, offset = read_line(mapped, 0)
+        parameters = [float(x) for x in line.split()]
+        offset = read_separator(mapped, offset)
+        line, offset = read_line(mapped, offset)
+        alphabet = line.split()
+        offset = read_separator(mapped, offset)
+    return AlignmentRows(path, offset, chunk_size), alphabet, parameters
+
+
+if __name__ == "__main__":
+    with capture():
+        # Usage: python streaming.py [viterbi|forward] [input.txt] [max_lag]
+        # Decodes the emission path of a viterbi.py-style input file without loading it.
+        from viterbi import viterbi_stream
+        from prob_path import forward_stream
+
+        mode = sys.argv[1] if len(sys.argv) > 1 else "viterbi"
+        path = sys.argv[2] if len(sys.argv) > 2 else "input.txt"
+        max_lag = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        emission_path, emissions, states, state_matrix, emission_matrix, state_to_index, emission_to_index = \
+            read_hmm_input(path)
+        if mode == "viterbi":
+            for piece in viterbi_stream(emission_path, state_matrix, emission_matrix,
+                                        state_to_index, emission_to_index, states, max_lag=max_lag):
+                sys.stdout.write(piece)
+            sys.stdout.write("\n")
+        else:
+            start = np.full(len(states), 1.0 / len(states))
+            print(forward_stream(emission_path, start, state_matrix, emission_matrix))
@@ -1,18 +1,48 @@
+import math
+import os
+
 import numpy as np
 
-def get_string_probability(hidden_path, state_to_index, emission_to_index, emission_path, emission_matrix):
-    prob = 1.0
-    for i in range(len(hidden_path)):
-        state = hidden_path[i]
-        emission = emission_path[i]
-        state_idx = state_to_index[state]
-        emission_idx = emission_to_index[emission]
-        prob *= emission_matrix[emission_idx, state_idx]
-    return prob
+from compiled import compile_model
+from instrument import capture, phased, stats_enabled, tally
+from hidden_path import encode_paths, log_hidden_path_probabilities
+
+def get_string_probability(hidden_path, state_to_index, emission_to_index, emission_path, emission_matrix, model=None):
+    # emission_matrix here is emissions x states; the compiled model stores it states x emissions.
+    # Underflows to 0 on long paths; log_string_probability does not.
+    if model is None:
+        model = compile_model(None, np.asarray(emission_matrix).T, state_to_index, emission_to_index)
+    state_codes = model.encode_states(hidden_path)
+    emission_codes = model.encode(emission_path)[:len(state_codes)]
+    factors = model.emission_matrix[state_codes, emission_codes]
+    probability = math.prod(factors.tolist(), start=1.0)
+    if probability == 0.0 and stats_enabled() and factors.all():
+        tally("underflows")
+    return probability
+
+def log_string_probability(hidden_path, emission_path, model) -> float:
+    return float(log_string_probabilities(encode_paths([hidden_path], model), model.encode(emission_path), model)[0])
+
+def log_joint_probability(hidden_path, emission_path, model) -> float:
+    # log P(x, pi) = log P(pi) + log P(x | pi); needs both matrices in the compiled model.
+    return float(log_joint_probabilities(encode_paths([hidden_path], model), model.encode(emission_path), model)[0])
+
+def log_string_probabilities(state_codes, emission_codes, model):
+    # Scores (N, T) candidate paths against one emission string, encoded once.
+    state_codes = np.atleast_2d(state_codes)
+    if state_codes.shape[1] != len(emission_codes):
+        raise ValueError("Hidden paths and the emission string must have the same length")
+    return model.log_emission_matrix[state_codes, emission_codes[None, :]].sum(axis=1)
+
+def log_joint_probabilities(state_codes, emission_codes, model):
+    return log_hidden_path_probabilities(state_codes, model) + \
+        log_string_probabilities(state_codes, emission_codes, model)
 
+@phased("parse")
 def read_input():
     with open("input.txt", "rt") as f:
         data = iter(f.readlines())
+        tally("bytes_parsed", os.fstat(f.fileno()).st_size)
     hidden_path = next(data).strip()
     assert next(data).startswith("-")
     states = next(data).strip().split()
@@ -41,7 +71,8 @@ def read_input():
     return hidden_path, state_to_index, emission_to_index, emission_path, emission_matrix
 
 if __name__ == "__main__":
-    hidden_path, state_to_index, emission_to_index, emission_path, output_matrix = read_input()
+    with capture():
+        hidden_path, state_to_index, emission_to_index, emission_path, output_matrix = read_input()
 
-    prob = get_string_probability(hidden_path, state_to_index, emission_to_index, emission_path, output_matrix)
-    print(prob)
\ No newline at end of file
+        prob = get_string_probability(hidden_path, state_to_index, emission_to_index, emission_path, output_matrix)
+        print(prob)
\ No newline at end of file
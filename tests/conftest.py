@@ -0,0 +1,33 @@
+import os
+import sys
+
+# The modules live flat at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def path_score():
+    # Log score of one state path under a CompiledModel, to check that a path another
+    # engine returned is as good as the sequential Viterbi path even when the two differ.
+    def score(model, encoded, path):
+        total = model.log_start[path[0]] + model.log_emission_matrix[path[0], encoded[0]]
+        for i in range(1, len(encoded)):
+            total += model.symbol_score_array[encoded[i]][path[i - 1], path[i]]
+        return total
+    return score
+
+@pytest.fixture
+def random_hmm():
+    # (compiled model, encoded emissions) with some transitions removed.
+    def make(rng, n_states, n_emissions, length):
+        from compiled import compile_model
+        state_matrix = rng.dirichlet(np.ones(n_states), n_states)
+        state_matrix[rng.random((n_states, n_states)) < 0.2] = 0
+        state_matrix[np.arange(n_states), rng.integers(0, n_states, n_states)] += 0.1
+        state_matrix /= state_matrix.sum(axis=1, keepdims=True)
+        emission_matrix = rng.dirichlet(np.ones(n_emissions), n_states)
+        return compile_model(state_matrix, emission_matrix), rng.integers(0, n_emissions, length)
+    return make
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from batch import viterbi_batch, compute_path_probability_batch, forward_backward_batch
+from compiled import SparseTransitions, compile_model
+from prob_path import forward, forward_backward, log_probability
+from viterbi import viterbi_log
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_batch_matches_one_at_a_time(sparse, random_hmm, path_score):
+    rng = np.random.default_rng(0)
+    model, _ = random_hmm(rng, 4, 3, 0)
+    if sparse:
+        model = compile_model(SparseTransitions.from_dense(model.state_matrix), model.emission_matrix)
+    sequences = [rng.integers(0, 3, int(rng.integers(1, 80))) for _ in range(25)]
+    offsets = np.zeros(len(sequences) + 1, dtype=np.intp)
+    np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+    codes = np.concatenate(sequences)
+    scores, paths = viterbi_batch(codes, offsets, None, None, model)
+    log_likelihoods = compute_path_probability_batch(codes, offsets, None, None, model)
+    for i, encoded in enumerate(sequences):
+        _, score = viterbi_log(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix)
+        assert scores[i] == pytest.approx(score, rel=1e-12)
+        assert path_score(model, encoded, paths[offsets[i]:offsets[i + 1]]) == pytest.approx(score, rel=1e-12)
+        scales = forward(encoded, model.start, model.forward_transitions, None, model.emission_cols)[1]
+        assert log_likelihoods[i] == pytest.approx(log_probability(scales), rel=1e-12)
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_forward_backward_batch_matches_one_at_a_time(sparse, random_hmm):
+    rng = np.random.default_rng(1)
+    model, _ = random_hmm(rng, 5, 3, 0)
+    if sparse:
+        model = compile_model(SparseTransitions.from_dense(model.state_matrix), model.emission_matrix)
+    sequences = [rng.integers(0, 3, int(rng.integers(0, 60))) for _ in range(15)]
+    offsets = np.zeros(len(sequences) + 1, dtype=np.intp)
+    np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+    log_likelihoods, posteriors = forward_backward_batch(np.concatenate(sequences), offsets, None, None, model)
+    for i, encoded in enumerate(sequences):
+        if len(encoded) == 0:
+            assert log_likelihoods[i] == 0.0
+            continue
+        log_prob, expected = forward_backward(encoded, model.start, model.forward_transitions, None,
+                                              model.emission_cols)
+        assert log_likelihoods[i] == pytest.approx(log_prob, rel=1e-12)
+        assert np.allclose(posteriors[offsets[i]:offsets[i + 1]], expected, rtol=1e-10, atol=1e-300)
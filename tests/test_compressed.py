@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from compressed import viterbi_lz, forward_lz, lz78_parse, PhraseCache
+from prob_path import forward, log_probability
+from viterbi import viterbi_log
+
+
+def repetitive_sequence(rng, n_emissions, length):
+    sequence = np.resize(rng.integers(0, n_emissions, int(rng.integers(1, 12))), length)
+    mutated = rng.random(length) < 0.05
+    sequence[mutated] = rng.integers(0, n_emissions, int(mutated.sum()))
+    return sequence
+
+
+def test_lz78_phrases_spell_the_input():
+    encoded = np.array([0, 1, 0, 1, 1, 0, 1, 0, 0, 1, 1])
+    phrases, parents, symbols = lz78_parse(encoded)
+    spelled = []
+    for node in phrases:
+        phrase = []
+        while node:
+            phrase.append(symbols[node])
+            node = parents[node]
+        spelled += phrase[::-1]
+    assert spelled == encoded.tolist()
+
+@pytest.mark.parametrize("seed", range(12))
+def test_compressed_matches_sequential(seed, random_hmm, path_score):
+    rng = np.random.default_rng(seed)
+    n_emissions = int(rng.integers(1, 4))
+    model, _ = random_hmm(rng, int(rng.integers(1, 5)), n_emissions, 0)
+    encoded = repetitive_sequence(rng, n_emissions, int(rng.integers(1, 500)))
+    best_path, score = viterbi_log(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix)
+    log_prob = log_probability(forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1])
+    viterbi_cache, forward_cache = PhraseCache(), PhraseCache()
+    # The second run takes its phrase operators from the warm caches.
+    for _ in range(2):
+        lz_path, lz_score = viterbi_lz(encoded, model.log_start, model.log_emission_matrix,
+                                       model.symbol_score_array, viterbi_cache)
+        assert lz_score == pytest.approx(score, rel=1e-9)
+        assert path_score(model, encoded, lz_path) == pytest.approx(score, rel=1e-9)
+        lz_log_prob = forward_lz(encoded, model.start, model.state_matrix, model.emission_cols, forward_cache)
+        assert lz_log_prob == pytest.approx(log_prob, rel=1e-9)
+    if len(encoded) > 1:
+        assert viterbi_cache.hits > 0 and forward_cache.hits > 0
@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from compiled import compile_model, encode_emissions
+
+
+EMISSION_TO_INDEX = {"a": 0, "b": 1, "c": 2}
+
+
+def test_model_and_plain_encoding_agree():
+    model = compile_model(np.full((2, 2), 0.5), np.full((2, 3), 1 / 3), {"x": 0, "y": 1}, EMISSION_TO_INDEX)
+    assert model.encode("abcca").tolist() == encode_emissions("abcca", EMISSION_TO_INDEX).tolist() == [0, 1, 2, 2, 0]
+
+@pytest.mark.parametrize("emission_to_index", [EMISSION_TO_INDEX, {"aa": 0, "b": 1}])
+def test_unknown_symbol_raises_key_error(emission_to_index):
+    with pytest.raises(KeyError):
+        encode_emissions("abz", emission_to_index)
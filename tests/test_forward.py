@@ -0,0 +1,22 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+from prob_path import forward, forward_backward, log_probability
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_forward_matches_sum_over_paths(seed, random_hmm, path_score):
+    rng = np.random.default_rng(seed)
+    model, encoded = random_hmm(rng, int(rng.integers(1, 4)), 3, int(rng.integers(1, 7)))
+    n_states = len(model.log_start)
+    total = sum(np.exp(path_score(model, encoded, path)) for path in product(range(n_states), repeat=len(encoded)))
+    _, scales = forward(encoded, model.start, model.state_matrix, None, model.emission_cols)
+    assert log_probability(scales) == pytest.approx(np.log(total), rel=1e-12)
+
+def test_posteriors_are_distributions(random_hmm):
+    model, encoded = random_hmm(np.random.default_rng(1), 4, 3, 300)
+    log_prob, posteriors = forward_backward(encoded, model.start, model.state_matrix, None, model.emission_cols)
+    assert np.allclose(posteriors.sum(axis=1), 1.0)
+    assert log_prob == log_probability(forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1])
@@ -0,0 +1,90 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import instrument
+from instrument import capture, enable_stats, phase, reset_stats, stats, stats_enabled, tally
+from viterbi import viterbi_log
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VITERBI_INPUT = """xyxzzxyxyy
+--------
+x y z
+--------
+A B
+--------
+	A	B
+A	0.641	0.359
+B	0.729	0.271
+--------
+	x	y	z
+A	0.117	0.691	0.192
+B	0.097	0.42	0.483
+"""
+
+
+@pytest.fixture
+def collecting():
+    previous = stats_enabled()
+    reset_stats()
+    enable_stats()
+    yield
+    enable_stats(previous)
+    reset_stats()
+
+
+def test_counters_and_phases(collecting, random_hmm):
+    model, encoded = random_hmm(np.random.default_rng(0), 3, 2, 100)
+    viterbi_log(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix)
+    viterbi_log(encoded[:10], model.log_start, model.log_state_matrix, model.log_emission_matrix)
+    report = stats()
+    assert report["counters"]["columns"] == 110
+    assert report["counters"]["cells"] == (99 + 9) * 9
+    for name in ("columns", "traceback"):
+        assert report["timers"][name]["calls"] == 2
+        assert report["timers"][name]["seconds"] >= 0.0
+
+def test_nothing_is_recorded_when_off(collecting):
+    enable_stats(False)
+    tally("columns", 5)
+    with phase("setup"):
+        pass
+    assert stats() == {"timers": {}, "counters": {}}
+
+def test_capture_reports_to_stderr(collecting, capsys):
+    with capture("tracemalloc"):
+        tally("cells", 3)
+        print("result")
+    out, err = capsys.readouterr()
+    assert out == "result\n"
+    assert "peak traced memory" in err
+    assert json.loads(err[err.index("{"):])["counters"] == {"cells": 3}
+
+def test_capture_mode_from_environment(monkeypatch):
+    monkeypatch.setenv(instrument.CAPTURE_ENV, "cprofile")
+    report = io.StringIO()
+    with capture(file=report):
+        sum(range(10))
+    assert "function calls" in report.getvalue()
+    with pytest.raises(ValueError):
+        with capture("perf"):
+            pass
+
+def test_environment_switches_on_a_script_run(tmp_path):
+    # HMM_STATS is read at import, so it is checked on a fresh interpreter.
+    (tmp_path / "input.txt").write_text(VITERBI_INPUT)
+    env = dict(os.environ, HMM_STATS="1", HMM_CAPTURE="tracemalloc")
+    result = subprocess.run([sys.executable, os.path.join(REPO, "viterbi.py")], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "AAABBAAAAA"
+    assert "peak traced memory" in result.stderr
+    report = json.loads(result.stderr[result.stderr.index("{"):])
+    assert report["counters"]["columns"] == 10
+    assert report["counters"]["bytes_parsed"] == len(VITERBI_INPUT)
+    assert {"parse", "columns", "traceback", "output"} <= set(report["timers"])
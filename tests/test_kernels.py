@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+from kernels import get_backend, set_backend
+from prob_path import backward, forward
+from profile_core import ProfileCalculator
+from viterbi import viterbi_log
+
+
+@pytest.fixture
+def backend():
+    # Runs a callable once per backend, putting the previous backend back afterwards.
+    previous = get_backend()
+
+    def run(name, compute):
+        set_backend(name)
+        try:
+            return compute()
+        finally:
+            set_backend(previous)
+    return run
+
+def random_rows(rng, n_rows, width):
+    symbols = np.array(list("ACGTN-"))
+    gap_rates = rng.random(width) * 0.8
+    rows = rng.choice(symbols[:5], (n_rows, width))
+    rows[rng.random((n_rows, width)) < gap_rates] = "-"
+    return ["".join(row) for row in rows]
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_numba_engines_match_numpy(seed, random_hmm, backend):
+    rng = np.random.default_rng(seed)
+    model, encoded = random_hmm(rng, int(rng.integers(1, 9)), 4, int(rng.integers(1, 500)))
+
+    def run():
+        best_path, score = viterbi_log(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix,
+                                       symbol_scores=model.symbol_scores)
+        alpha, scales = forward(encoded, model.start, model.state_matrix, None, model.emission_cols)
+        beta = backward(encoded, scales, model.state_matrix, None, model.emission_cols)
+        return best_path, score, alpha, scales, beta
+
+    expected = backend("numpy", run)
+    actual = backend("numba", run)
+    # Viterbi adds the same terms in the same order; sums may differ from BLAS in the last bits.
+    assert np.array_equal(actual[0], expected[0])
+    assert actual[1] == expected[1]
+    for value, reference in zip(actual[2:], expected[2:]):
+        assert np.allclose(value, reference, rtol=1e-12, atol=0)
+
+@pytest.mark.parametrize("seed", range(6))
+def test_numba_profile_counts_match_numpy(seed, backend):
+    rng = np.random.default_rng(seed)
+    rows = random_rows(rng, int(rng.integers(1, 40)), int(rng.integers(1, 30)))
+
+    def run():
+        calculator = ProfileCalculator(rows, list("ACGT"), 0.35, block_rows=7)
+        calculator.count_transitions()
+        return calculator.transfer_counts, calculator.emission_counts
+
+    expected = backend("numpy", run)
+    actual = backend("numba", run)
+    assert np.array_equal(actual[0], expected[0])
+    assert np.array_equal(actual[1], expected[1])
+
+def test_backend_is_restored(backend):
+    previous = get_backend()
+    assert backend("numba", get_backend) == "numba"
+    assert get_backend() == previous
@@ -0,0 +1,64 @@
+import numpy as np
+
+from compiled import compile_model
+from model_io import save_model, load_model, save_hmm, load_hmm, save_profile_sweep, load_profile_sweep
+from model_io import ALIGNMENT, hmm_binary_to_text, hmm_text_to_binary
+from profile_sweep import sweep_profiles
+from streaming import read_hmm_input
+from viterbi import viterbi_log
+
+
+def test_arrays_round_trip_at_aligned_offsets(tmp_path):
+    rng = np.random.default_rng(0)
+    arrays = {f"array_{i}": rng.random((i % 7, 3)).astype(dtype)
+              for i, dtype in enumerate([np.float64, np.int8, np.int64, np.float32] * 50)}
+    path = tmp_path / "arrays.bin"
+    save_model(path, arrays, {"names": [f"label {i}" * 20 for i in range(100)]}, {"kind": "test"})
+    loaded, labels, meta = load_model(path)
+    assert meta == {"kind": "test"} and len(labels["names"]) == 100
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        assert np.array_equal(loaded[name], array)
+        if array.size:
+            assert loaded[name].offset % ALIGNMENT == 0
+
+def test_loaded_hmm_decodes_like_the_original(tmp_path):
+    rng = np.random.default_rng(1)
+    state_matrix = rng.dirichlet(np.ones(3), 3)
+    emission_matrix = rng.dirichlet(np.ones(4), 3)
+    path = tmp_path / "model.bin"
+    save_hmm(path, ["A", "B", "C"], list("wxyz"), state_matrix, emission_matrix)
+    states, emissions, loaded_states, loaded_emissions, _, _ = load_hmm(path)
+    assert states == ["A", "B", "C"] and emissions == list("wxyz")
+    encoded = rng.integers(0, 4, 200)
+    original, loaded = compile_model(state_matrix, emission_matrix), compile_model(loaded_states, loaded_emissions)
+    expected = viterbi_log(encoded, original.log_start, original.log_state_matrix, original.log_emission_matrix)
+    actual = viterbi_log(encoded, loaded.log_start, loaded.log_state_matrix, loaded.log_emission_matrix)
+    assert np.array_equal(expected[0], actual[0]) and expected[1] == actual[1]
+
+def test_profile_sweep_round_trip(tmp_path):
+    alignment = ["AC-GT", "A--GT", "ACAGT", "-CAG-"]
+    profiles = sweep_profiles(alignment, list("ACGT"), [0.3, 0.6], [0.01, 0.1], binary=True)
+    path = tmp_path / "sweep.bin"
+    save_profile_sweep(path, [(threshold, factor) + profile for threshold, factor, profile in profiles], "ACGT")
+    loaded, alphabet = load_profile_sweep(path)
+    assert alphabet == list("ACGT")
+    for (threshold, factor, transfer_probs, emission_probs, match_count), (t, f, profile) in zip(loaded, profiles):
+        assert (threshold, factor, match_count) == (t, f, profile[2])
+        assert np.array_equal(transfer_probs, profile[0]) and np.array_equal(emission_probs, profile[1])
+
+def test_hmm_text_round_trip(tmp_path):
+    # The text converters share streaming.read_matrix_rows with read_hmm_input.
+    rng = np.random.default_rng(2)
+    state_matrix = rng.dirichlet(np.ones(3), 3)
+    emission_matrix = rng.dirichlet(np.ones(4), 3)
+    save_hmm(tmp_path / "model.bin", ["A", "B", "C"], list("wxyz"), state_matrix, emission_matrix)
+    with open(tmp_path / "input.txt", "wt") as text_file:
+        hmm_binary_to_text(tmp_path / "model.bin", text_file, "wxyzzyxw")
+    hmm_text_to_binary(tmp_path / "input.txt", tmp_path / "copy.bin")
+    states, emissions, loaded_states, loaded_emissions, _, _ = load_hmm(tmp_path / "copy.bin")
+    assert states == ["A", "B", "C"] and emissions == list("wxyz")
+    assert np.array_equal(loaded_states, state_matrix) and np.array_equal(loaded_emissions, emission_matrix)
+    emission_path, _, _, text_states, text_emissions, _, _ = read_hmm_input(str(tmp_path / "input.txt"))
+    assert np.array_equal(text_states, state_matrix) and np.array_equal(text_emissions, emission_matrix)
+    assert emission_path.to_array().tolist() == [0, 1, 2, 3, 3, 2, 1, 0]
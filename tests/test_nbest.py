@@ -0,0 +1,31 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+from compiled import SparseTransitions, compile_model
+from string_given_path import log_joint_probabilities
+from viterbi import viterbi_nbest_log
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_nbest_matches_exhaustive_ranking(seed, random_hmm, path_score):
+    rng = np.random.default_rng(seed)
+    model, encoded = random_hmm(rng, int(rng.integers(1, 4)), 3, int(rng.integers(1, 6)))
+    candidates = np.array(list(product(range(len(model.log_start)), repeat=len(encoded))))
+    # The vectorized joint scorer ranks every path, and agrees with scoring them one by one.
+    joint = log_joint_probabilities(candidates, encoded, model)
+    assert np.allclose(joint, [path_score(model, encoded, path) for path in candidates])
+    expected = np.sort(joint[np.isfinite(joint)])[::-1][:5]
+    paths, scores = viterbi_nbest_log(encoded, model.log_start, model.log_emission_matrix,
+                                      model.symbol_score_array, 5)
+    assert np.allclose(scores, expected)
+    assert np.allclose([path_score(model, encoded, path) for path in paths], scores)
+
+def test_nbest_on_a_model_built_from_sparse_transitions(random_hmm):
+    dense, encoded = random_hmm(np.random.default_rng(0), 4, 3, 30)
+    sparse = compile_model(SparseTransitions.from_dense(dense.state_matrix), dense.emission_matrix)
+    expected = viterbi_nbest_log(encoded, dense.log_start, dense.log_emission_matrix, dense.symbol_score_array, 4)
+    actual = viterbi_nbest_log(encoded, sparse.log_start, sparse.log_emission_matrix, sparse.symbol_score_array, 4)
+    assert all(np.array_equal(a, b) for a, b in zip(expected[0], actual[0]))
+    assert np.array_equal(expected[1], actual[1])
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from compiled import compile_model
+from parallel import decode_records
+from prob_path import forward, log_probability
+from viterbi import viterbi_log
+
+STATE_TO_INDEX = {"x": 0, "y": 1, "z": 2}
+EMISSION_TO_INDEX = {"a": 0, "b": 1}
+
+
+def test_parallel_records_match_sequential():
+    rng = np.random.default_rng(0)
+    state_matrix = rng.dirichlet(np.ones(3), 3)
+    emission_matrix = rng.dirichlet(np.ones(2), 3)
+    records = [(f"r{i}", "".join(rng.choice(list("ab"), int(rng.integers(1, 60))))) for i in range(30)]
+    model = compile_model(state_matrix, emission_matrix, STATE_TO_INDEX, EMISSION_TO_INDEX)
+    decoded = list(decode_records(records, state_matrix, emission_matrix, STATE_TO_INDEX, EMISSION_TO_INDEX,
+                                  workers=2, chunk_size=4))
+    scored = list(decode_records(records, state_matrix, emission_matrix, STATE_TO_INDEX, EMISSION_TO_INDEX,
+                                 mode="forward", workers=2, chunk_size=4))
+    for (header, sequence), (decoded_header, (path, score)), (_, log_prob) in zip(records, decoded, scored):
+        encoded = model.encode(sequence)
+        best_path, best_score = viterbi_log(encoded, model.log_start, model.log_state_matrix,
+                                            model.log_emission_matrix)
+        assert decoded_header == header
+        assert path == model.decode_states(best_path) and score == pytest.approx(best_score, rel=1e-12)
+        scales = forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1]
+        assert log_prob == pytest.approx(log_probability(scales), rel=1e-12)
@@ -0,0 +1,15 @@
+import numpy as np
+
+from parallel_profile import sharded_calculator
+from profile_core import ProfileCalculator, PseudocountPrior
+
+
+def test_sharded_build_matches_serial():
+    rng = np.random.default_rng(0)
+    alignment = ["".join(row) for row in rng.choice(list("ACGT--"), (200, 15))]
+    for prior in (None, PseudocountPrior(0.01)):
+        serial = ProfileCalculator(alignment, list("ACGT"), 0.35, prior)
+        sharded = sharded_calculator(alignment, list("ACGT"), 0.35, prior, workers=2, shard_rows=37, block_rows=16)
+        assert sharded.calculate() == serial.calculate()
+        assert np.array_equal(sharded.transfer_counts, serial.transfer_counts)
+        assert np.array_equal(sharded.emission_counts, serial.emission_counts)
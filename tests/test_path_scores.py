@@ -0,0 +1,108 @@
+import math
+
+import numpy as np
+import pytest
+
+from batch import get_hidden_path_probability_batch, get_joint_probability_batch, get_string_probability_batch
+from compiled import compile_model
+from hidden_path import get_hidden_path_probability, log_hidden_path_probabilities, log_hidden_path_probability
+from string_given_path import get_string_probability, log_joint_probabilities, log_joint_probability
+from string_given_path import log_string_probabilities, log_string_probability
+
+STATES = "ABC"
+EMISSIONS = "xyz"
+
+
+def random_matrices(rng):
+    state_matrix = rng.dirichlet(np.ones(len(STATES)), len(STATES))
+    state_matrix[0, 2] = 0.0
+    state_matrix[0] /= state_matrix[0].sum()
+    emission_matrix = rng.dirichlet(np.ones(len(EMISSIONS)), len(STATES))
+    return state_matrix, emission_matrix
+
+def direct_scores(state_matrix, emission_matrix, start, path, emissions):
+    # log P(pi) and log P(x | pi) summed one factor at a time, emission_matrix states x emissions.
+    with np.errstate(divide="ignore"):
+        hidden = 0.0 if not path else math.log(start[path[0]]) if start[path[0]] > 0 else -math.inf
+        for a, b in zip(path, path[1:]):
+            hidden += np.log(state_matrix[a, b])
+        string = sum(np.log(emission_matrix[s, e]) for s, e in zip(path, emissions))
+    return hidden, string
+
+def random_pairs(rng, n_pairs, max_length):
+    lengths = rng.integers(0, max_length + 1, n_pairs)
+    return [(rng.integers(0, len(STATES), n).tolist(), rng.integers(0, len(EMISSIONS), n).tolist())
+            for n in lengths]
+
+
+def test_log_scorers_match_direct_sums():
+    rng = np.random.default_rng(0)
+    state_matrix, emission_matrix = random_matrices(rng)
+    model = compile_model(state_matrix, emission_matrix, {s: i for i, s in enumerate(STATES)},
+                          {e: i for i, e in enumerate(EMISSIONS)})
+    start = np.full(len(STATES), 1.0 / len(STATES))
+    for _ in range(30):
+        length = int(rng.integers(1, 12))
+        path = rng.integers(0, len(STATES), length)
+        emissions = rng.integers(0, len(EMISSIONS), length)
+        hidden, string = direct_scores(state_matrix, emission_matrix, start, path.tolist(), emissions.tolist())
+        hidden_path = "".join(STATES[s] for s in path)
+        emission_path = "".join(EMISSIONS[e] for e in emissions)
+        assert log_hidden_path_probability(hidden_path, model) == pytest.approx(hidden, rel=1e-12)
+        assert log_string_probability(hidden_path, emission_path, model) == pytest.approx(string, rel=1e-12)
+        assert log_joint_probability(hidden_path, emission_path, model) == pytest.approx(hidden + string, rel=1e-12)
+        if np.isfinite(hidden):
+            assert get_hidden_path_probability(hidden_path, model.state_to_index, state_matrix) == \
+                pytest.approx(math.exp(hidden), rel=1e-12)
+        # string_given_path.py takes its matrix as emissions x states.
+        assert get_string_probability(hidden_path, model.state_to_index, model.emission_to_index, emission_path,
+                                      emission_matrix.T) == pytest.approx(math.exp(string), rel=1e-12)
+
+def test_candidate_paths_are_scored_row_by_row():
+    rng = np.random.default_rng(1)
+    state_matrix, emission_matrix = random_matrices(rng)
+    model = compile_model(state_matrix, emission_matrix)
+    emissions = rng.integers(0, len(EMISSIONS), 9)
+    paths = rng.integers(0, len(STATES), (6, 9))
+    expected = [direct_scores(state_matrix, emission_matrix, model.start, path.tolist(), emissions.tolist())
+                for path in paths]
+    assert np.allclose(log_hidden_path_probabilities(paths, model), [h for h, _ in expected], rtol=1e-12)
+    assert np.allclose(log_string_probabilities(paths, emissions, model), [s for _, s in expected], rtol=1e-12)
+    assert np.allclose(log_joint_probabilities(paths, emissions, model), [h + s for h, s in expected], rtol=1e-12)
+
+def test_batch_scorers_match_direct_sums():
+    rng = np.random.default_rng(2)
+    state_matrix, emission_matrix = random_matrices(rng)
+    start = rng.dirichlet(np.ones(len(STATES)))
+    model = compile_model(state_matrix, emission_matrix, start=start)
+    pairs = random_pairs(rng, 25, 15)
+    offsets = np.zeros(len(pairs) + 1, dtype=np.intp)
+    np.cumsum([len(path) for path, _ in pairs], out=offsets[1:])
+    state_codes = np.array([s for path, _ in pairs for s in path], dtype=np.intp)
+    emission_codes = np.array([e for _, emissions in pairs for e in emissions], dtype=np.intp)
+    expected = [direct_scores(state_matrix, emission_matrix, start, path, emissions) for path, emissions in pairs]
+    hidden = [h for h, _ in expected]
+    string = [s for _, s in expected]
+
+    assert np.allclose(get_hidden_path_probability_batch(state_codes, offsets, state_matrix, start=start),
+                       hidden, rtol=1e-12)
+    assert np.allclose(get_hidden_path_probability_batch(state_codes, offsets, None, model=model), hidden, rtol=1e-12)
+    # Emissions x states, as string_given_path.py reads it, or the model's own states x emissions.
+    assert np.allclose(get_string_probability_batch(state_codes, emission_codes, offsets, emission_matrix.T),
+                       string, rtol=1e-12)
+    assert np.allclose(get_string_probability_batch(state_codes, emission_codes, offsets, None, model=model),
+                       string, rtol=1e-12)
+    assert np.allclose(get_joint_probability_batch(state_codes, emission_codes, offsets, model),
+                       np.add(hidden, string), rtol=1e-12)
+
+def test_batch_string_probability_with_fewer_emissions_than_states():
+    # A non-square matrix makes a swapped layout fail instead of silently reading wrong cells.
+    rng = np.random.default_rng(3)
+    emission_matrix = rng.dirichlet(np.ones(2), 4)
+    state_codes = np.array([0, 3, 2, 1, 3], dtype=np.intp)
+    emission_codes = np.array([1, 0, 1, 1, 0], dtype=np.intp)
+    offsets = np.array([0, 2, 5])
+    expected = [np.log(emission_matrix[state_codes[a:b], emission_codes[a:b]]).sum()
+                for a, b in zip(offsets[:-1], offsets[1:])]
+    assert np.allclose(get_string_probability_batch(state_codes, emission_codes, offsets, emission_matrix.T),
+                       expected, rtol=1e-12)
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from profile_align import ProfileModel, align_batch, forward_score, score_batch, viterbi_align
+
+ALPHABET = "ABC"
+
+
+def random_profile(rng, match_count, zero_fraction=0.0):
+    # transfer_fractions/emission_fractions dicts as profile_core builds them, with random
+    # rows; every state may move to I of its block and to M and D of the next one.
+    def successors(j):
+        names = [f"I{j}", f"M{j+1}" if j < match_count else "E"]
+        if j < match_count:
+            names.append(f"D{j+1}")
+        return names
+
+    transfer_fractions = {}
+    emission_fractions = {}
+    for j in range(match_count + 1):
+        sources = ["S", "I0"] if j == 0 else [f"M{j}", f"D{j}", f"I{j}"]
+        for name in sources:
+            probs = rng.dirichlet(np.ones(len(successors(j))))
+            probs[rng.random(len(probs)) < zero_fraction] = 0.0
+            transfer_fractions[name] = dict(zip(successors(j), probs / max(probs.sum(), 1e-300)))
+            if name[0] in "MI":
+                emission_fractions[name] = dict(zip(ALPHABET, rng.dirichlet(np.ones(len(ALPHABET)))))
+    return transfer_fractions, emission_fractions
+
+def enumerate_paths(transfer_fractions, emission_fractions, match_count, sequence):
+    # Every S -> E path emitting the whole sequence, as (log probability, states).
+    paths = []
+
+    def walk(name, j, i, log_p, states):
+        for target, prob in transfer_fractions.get(name, {}).items():
+            if prob == 0.0:
+                continue
+            step = log_p + np.log(prob)
+            if target == "E":
+                if i == len(sequence):
+                    paths.append((step, states))
+                continue
+            kind, block = target[0], int(target[1:])
+            if kind in "MI":
+                if i == len(sequence):
+                    continue
+                emission = emission_fractions[target].get(sequence[i], 0.0)
+                if emission == 0.0:
+                    continue
+                walk(target, block, i + 1, step + np.log(emission), states + [target])
+            else:
+                walk(target, block, i, step, states + [target])
+
+    walk("S", 0, 0, 0.0, [])
+    return paths
+
+def expected_scores(profile, match_count, sequence):
+    paths = enumerate_paths(*profile, match_count, sequence)
+    if not paths:
+        return -np.inf, [], -np.inf
+    best_score, best_path = max(paths, key=lambda path: path[0])
+    return best_score, best_path, float(np.logaddexp.reduce([score for score, _ in paths]))
+
+
+@pytest.mark.parametrize("zero_fraction", [0.0, 0.3])
+def test_align_and_score_match_enumeration(zero_fraction):
+    rng = np.random.default_rng(7)
+    for match_count in (1, 2, 3):
+        profile = random_profile(rng, match_count, zero_fraction)
+        model = ProfileModel(*profile, match_count, ALPHABET)
+        for length in range(0, 5):
+            sequence = "".join(rng.choice(list(ALPHABET), length))
+            best_score, best_path, total = expected_scores(profile, match_count, sequence)
+            score, path = viterbi_align(model, sequence)
+            assert score == pytest.approx(best_score, rel=1e-12)
+            assert path == best_path
+            assert forward_score(model, sequence) == pytest.approx(total, rel=1e-12)
+
+def test_empty_sequence_goes_through_deletes():
+    rng = np.random.default_rng(1)
+    profile = random_profile(rng, 3)
+    model = ProfileModel(*profile, 3, ALPHABET)
+    best_score, best_path, total = expected_scores(profile, 3, "")
+    assert best_path == ["D1", "D2", "D3"]
+    assert viterbi_align(model, "") == (pytest.approx(best_score, rel=1e-12), best_path)
+    assert forward_score(model, "") == pytest.approx(total, rel=1e-12)
+
+def test_wide_band_matches_no_band():
+    rng = np.random.default_rng(2)
+    profile = random_profile(rng, 4)
+    model = ProfileModel(*profile, 4, ALPHABET)
+    sequences = ["".join(rng.choice(list(ALPHABET), int(rng.integers(0, 9)))) for _ in range(12)]
+    assert align_batch(model, sequences, band=20) == align_batch(model, sequences)
+    assert np.array_equal(score_batch(model, sequences, band=20), score_batch(model, sequences))
+
+def test_narrow_band_never_beats_no_band():
+    rng = np.random.default_rng(3)
+    profile = random_profile(rng, 5)
+    model = ProfileModel(*profile, 5, ALPHABET)
+    sequences = ["".join(rng.choice(list(ALPHABET), int(rng.integers(1, 12)))) for _ in range(12)]
+    for banded, full in zip(align_batch(model, sequences, band=1), align_batch(model, sequences)):
+        assert banded[0] <= full[0]
+    assert np.all(score_batch(model, sequences, band=1) <= score_batch(model, sequences) + 1e-12)
+
+def test_batch_matches_single_queries():
+    rng = np.random.default_rng(4)
+    profile = random_profile(rng, 4, 0.2)
+    model = ProfileModel(*profile, 4, ALPHABET)
+    sequences = ["".join(rng.choice(list(ALPHABET), int(rng.integers(0, 10)))) for _ in range(20)]
+    alignments = align_batch(model, sequences)
+    scores = score_batch(model, sequences)
+    for sequence, alignment, score in zip(sequences, alignments, scores):
+        assert alignment == viterbi_align(model, sequence)
+        assert score == forward_score(model, sequence)
@@ -0,0 +1,208 @@
+import numpy as np
+import pytest
+
+from profile_core import ProfileCalculator, PseudocountPrior
+
+ALPHABET = list("ACGT")
+
+
+class DictProfileBuilder:
+    # Frozen copy of the dict-of-dicts builder ProfileCalculator replaced
+    # (process_sequence / record_transition, then apply_pseudocounts when pseudo_factor
+    # is given), kept as the reference the array counts must reproduce.
+    def __init__(self, alignment, alphabet, threshold, pseudo_factor=None):
+        self.alignment = alignment
+        self.count = len(alignment)
+        self.len = len(alignment[0])
+        self.alphabet = alphabet
+        self.threshold = threshold
+        self.pseudo_factor = pseudo_factor
+        self.transfer_frequencies = {}
+        self.emission_frequencies = {}
+        self.ignore_cols = self.get_ignored_columns()
+        self.match_count = None
+
+    def get_ignored_columns(self):
+        ig_cols = set()
+        for col in range(self.len):
+            gap_total = 0
+            for seq in self.alignment:
+                if seq[col] == '-':
+                    gap_total += 1
+            if gap_total / self.count >= self.threshold:
+                ig_cols.add(col)
+        return ig_cols
+
+    def calculate(self):
+        for sequence in self.alignment:
+            self.process_sequence(sequence)
+        transfer_fractions = {}
+        emission_fractions = {}
+        for state in self.transfer_frequencies:
+            transfer_fractions[state] = {}
+            total = sum(self.transfer_frequencies[state].values())
+            for next_state in self.transfer_frequencies[state]:
+                transfer_fractions[state][next_state] = self.transfer_frequencies[state][next_state] / total
+        for state in self.emission_frequencies:
+            emission_fractions[state] = {}
+            total = sum(self.emission_frequencies[state].values())
+            for symbol in self.emission_frequencies[state]:
+                emission_fractions[state][symbol] = self.emission_frequencies[state][symbol] / total
+        if self.pseudo_factor is not None:
+            self.apply_pseudocounts(transfer_fractions, emission_fractions)
+        return transfer_fractions, emission_fractions, self.match_count
+
+    def process_sequence(self, sequence):
+        curr_state = 'S'
+        for i, symbol in enumerate(sequence):
+            if i in self.ignore_cols:
+                if symbol == '-':
+                    continue
+                if curr_state == "S":
+                    next_state = "I0"
+                elif curr_state.startswith("I"):
+                    next_state = curr_state
+                elif curr_state.startswith("D") or curr_state.startswith("M"):
+                    next_state = f"I{curr_state[1:]}"
+                self.record_transition(curr_state, next_state, symbol)
+            else:
+                if symbol == "-":
+                    if curr_state == "S":
+                        next_state = "D1"
+                    else:
+                        state_count = int(curr_state[1:]) + 1
+                        next_state = f"D{state_count}"
+                else:
+                    if curr_state == "S":
+                        next_state = "M1"
+                    else:
+                        state_count = int(curr_state[1:]) + 1
+                        next_state = f"M{state_count}"
+                self.record_transition(curr_state, next_state, symbol)
+            curr_state = next_state
+        if curr_state not in self.transfer_frequencies:
+            self.transfer_frequencies[curr_state] = {}
+        if "E" not in self.transfer_frequencies[curr_state]:
+            self.transfer_frequencies[curr_state]["E"] = 0
+        self.transfer_frequencies[curr_state]["E"] += 1
+        self.match_count = int(curr_state[1:])
+
+    def record_transition(self, curr_state, next_state, symbol):
+        if curr_state not in self.transfer_frequencies:
+            self.transfer_frequencies[curr_state] = {}
+        if next_state not in self.transfer_frequencies[curr_state]:
+            self.transfer_frequencies[curr_state][next_state] = 0
+        self.transfer_frequencies[curr_state][next_state] += 1
+        if next_state.startswith("I") or next_state.startswith("M"):
+            if next_state not in self.emission_frequencies:
+                self.emission_frequencies[next_state] = {}
+            if symbol not in self.emission_frequencies[next_state]:
+                self.emission_frequencies[next_state][symbol] = 0
+            self.emission_frequencies[next_state][symbol] += 1
+
+    def apply_pseudocounts(self, transfer_fractions, emission_fractions):
+        states = ["S", "I0"]
+        for i in range(self.match_count):
+            states += [f"M{i+1}", f"D{i+1}", f"I{i+1}"]
+        states.append("E")
+        for state in states:
+            self.pseudocount_transfers(transfer_fractions, state)
+            self.pseudocount_emissions(emission_fractions, state)
+
+    def pseudocount_emissions(self, emission_fractions, state):
+        if state.startswith("M") or state.startswith("I"):
+            if state not in emission_fractions:
+                emission_fractions[state] = {}
+            for symbol in self.alphabet:
+                if symbol not in emission_fractions[state]:
+                    emission_fractions[state][symbol] = 0.0
+                emission_fractions[state][symbol] += self.pseudo_factor
+            normalization_total = sum(emission_fractions[state].values())
+            for symbol in emission_fractions[state]:
+                emission_fractions[state][symbol] /= normalization_total
+
+    def pseudocount_transfers(self, transfer_fractions, state):
+        if state not in transfer_fractions:
+            transfer_fractions[state] = {}
+        if state == "S":
+            possible_next_states = ["M1", "D1", "I0"]
+        elif state == "E":
+            possible_next_states = []
+        else:
+            state_ct = int(state[1:])
+            if state_ct != self.match_count:
+                possible_next_states = [f"M{state_ct+1}", f"D{state_ct+1}", f"I{state_ct}"]
+            else:
+                possible_next_states = ["E", f"I{state_ct}"]
+        for possible_next in possible_next_states:
+            if possible_next not in transfer_fractions[state]:
+                transfer_fractions[state][possible_next] = 0.0
+            transfer_fractions[state][possible_next] += self.pseudo_factor
+        normalization_total = sum(transfer_fractions[state].values())
+        for next_state in transfer_fractions[state]:
+            transfer_fractions[state][next_state] /= normalization_total
+
+
+def random_alignment(rng, n_rows, width):
+    # Each column gets a whole number of gaps, so gap fractions land exactly on k / n_rows
+    # thresholds; a few residues fall outside the alphabet.
+    columns = []
+    for _ in range(width):
+        column = rng.choice(list("ACGT"), n_rows)
+        column[rng.random(n_rows) < 0.05] = "N"
+        column[rng.permutation(n_rows)[:int(rng.integers(0, n_rows + 1))]] = "-"
+        columns.append(column)
+    return ["".join(row) for row in np.array(columns).T]
+
+def insert_only_row(alignment, threshold):
+    # A row with residues only in columns that stay insert columns once it is added, so
+    # its path is S, D and I states only.
+    n_rows = len(alignment) + 1
+    return "".join("C" if sum(seq[col] == "-" for seq in alignment) / n_rows >= threshold else "-"
+                   for col in range(len(alignment[0])))
+
+def non_empty(fractions):
+    return {state: row for state, row in fractions.items() if row}
+
+def assert_same_fractions(actual, expected):
+    assert set(non_empty(actual)) == set(non_empty(expected))
+    for state, row in non_empty(expected).items():
+        assert set(actual[state]) == set(row)
+        for key, value in row.items():
+            assert actual[state][key] == pytest.approx(value, rel=1e-12)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_calculator_matches_dict_builder(seed):
+    rng = np.random.default_rng(seed)
+    n_rows = int(rng.choice([4, 5, 8]))
+    alignment = random_alignment(rng, n_rows, int(rng.integers(1, 9)))
+    if seed % 3 == 0:
+        alignment[int(rng.integers(n_rows))] = "-" * len(alignment[0])
+    gap_fractions = sorted({sum(seq[col] == "-" for seq in alignment) / n_rows for col in range(len(alignment[0]))})
+    # The lowest fraction is never a threshold, so some column is a match column (the
+    # dict builder reads match_count off the last row's final state); the rest are hit
+    # exactly, which ignores those columns.
+    candidates = gap_fractions[1:] + [1.0] if seed % 2 else [gap_fractions[0] + 0.5 / n_rows]
+    threshold = float(rng.choice(candidates))
+    if seed % 4 == 1:
+        alignment.insert(int(rng.integers(n_rows)), insert_only_row(alignment, threshold))
+    pseudo_factor = 0.01 if seed % 5 in (1, 3) else None
+    expected = DictProfileBuilder(alignment, ALPHABET, threshold, pseudo_factor).calculate()
+    prior = PseudocountPrior(pseudo_factor) if pseudo_factor is not None else None
+    transfer_fractions, emission_fractions, match_count = \
+        ProfileCalculator(alignment, ALPHABET, threshold, prior).calculate()
+    assert match_count == expected[2]
+    assert_same_fractions(transfer_fractions, expected[0])
+    assert_same_fractions(emission_fractions, expected[1])
+
+def test_calculator_matches_dict_builder_on_insert_only_rows():
+    # At 0.5 columns 1 and 2 are insert columns and the last row is D1 I1 I1 D2; at 0.25
+    # every column is one and match_count is 0.
+    alignment = ["A--G", "A-CG", "C--T", "-GT-"]
+    for threshold in (0.25, 0.5, 0.75):
+        expected = DictProfileBuilder(alignment, ALPHABET, threshold).calculate()
+        actual = ProfileCalculator(alignment, ALPHABET, threshold).calculate()
+        assert actual[2] == expected[2]
+        assert_same_fractions(actual[0], expected[0])
+        assert_same_fractions(actual[1], expected[1])
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from profile_core import ProfileCalculator, PseudocountPrior
+from profile_sweep import sweep_profiles
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_sweep_matches_separate_builds(seed):
+    rng = np.random.default_rng(seed)
+    width = int(rng.integers(1, 25))
+    gap_rates = rng.random(width)
+    alignment = ["".join("-" if rng.random() < gap_rates[col] else "ACGT"[rng.integers(4)] for col in range(width))
+                 for _ in range(int(rng.integers(1, 30)))]
+    thresholds = [float(value) for value in rng.choice([0.0, 0.2, 0.35, 0.5, 0.8, 1.0, 1.1], 4)]
+    pseudo_factors = None if seed % 2 else [0.01, 0.1]
+    profiles = sweep_profiles(alignment, list("ACGT"), thresholds, pseudo_factors, block_rows=4)
+    assert [(threshold, factor) for threshold, factor, _ in profiles] == \
+        [(threshold, factor) for threshold in thresholds for factor in (pseudo_factors or [None])]
+    for threshold, factor, profile in profiles:
+        prior = PseudocountPrior(factor) if factor is not None else None
+        assert profile == ProfileCalculator(alignment, list("ACGT"), threshold, prior).calculate()
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from profile_core import ProfileCalculator, PseudocountPrior
+
+ALPHABET = list("ACGT")
+
+
+def random_rows(rng, n_rows, width, gap_rate):
+    symbols = np.array(list("ACGT-"))
+    p = np.array([1, 1, 1, 1, 0], dtype=np.float64) * (1 - gap_rate) / 4
+    p[4] = gap_rate
+    return ["".join(row) for row in rng.choice(symbols, (n_rows, width), p=p)]
+
+def assert_same_profile(calculator, rows, threshold, prior):
+    rebuilt = ProfileCalculator(rows, ALPHABET, threshold, prior)
+    assert calculator.calculate() == rebuilt.calculate()
+    assert calculator.count == len(rows) == len(calculator.alignment)
+    assert np.array_equal(calculator.transfer_counts, rebuilt.transfer_counts)
+    assert np.array_equal(calculator.emission_counts, rebuilt.emission_counts)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_updates_match_rebuild(seed):
+    rng = np.random.default_rng(seed)
+    width, threshold = int(rng.integers(1, 10)), float(rng.choice([0.2, 0.35, 0.5]))
+    prior = PseudocountPrior(0.01) if seed % 2 else None
+    rows = random_rows(rng, 4, width, rng.uniform(0, 0.8))
+    calculator = ProfileCalculator(rows, ALPHABET, threshold, prior)
+    calculator.calculate()
+    for step in range(6):
+        if step % 2 == 0 or len(rows) < 2:
+            added = random_rows(rng, int(rng.integers(1, 4)), width, rng.uniform(0, 1))
+            calculator.add_sequences(added)
+            rows += added
+        else:
+            indices = rng.integers(0, len(rows), int(rng.integers(1, len(rows))))
+            calculator.remove_sequences(indices)
+            rows = [row for i, row in enumerate(rows) if i not in set(indices.tolist())]
+        assert_same_profile(calculator, rows, threshold, prior)
+
+def test_remove_duplicate_and_negative_indices():
+    rows = ["AC-T", "A-GT", "ACGT", "--GT"]
+    calculator = ProfileCalculator(rows, ALPHABET, 0.5)
+    calculator.calculate()
+    calculator.remove_sequences([0, 0, -4])
+    assert_same_profile(calculator, rows[1:], 0.5, None)
+
+def test_remove_all_rows_raises():
+    calculator = ProfileCalculator(["AC", "AG"], ALPHABET, 0.5)
+    with pytest.raises(ValueError):
+        calculator.remove_sequences([0, 1, 1])
+    with pytest.raises(IndexError):
+        calculator.remove_sequences([2])
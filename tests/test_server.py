@@ -0,0 +1,79 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from prob_path import compute_posterior_path, forward, log_probability
+from server import DecodeServer, inline_model, request
+from viterbi import viterbi_log
+
+MODEL = {"states": ["x", "y"], "emissions": ["a", "b", "c"],
+         "state_matrix": [[0.9, 0.1], [0.2, 0.8]],
+         "emission_matrix": [[0.6, 0.3, 0.1], [0.1, 0.3, 0.6]]}
+
+
+def run_server(tmp_path, requests, **options):
+    # Sends the requests concurrently, one connection each, and returns the responses
+    # and the server's batchers once they are answered.
+    socket_path = str(tmp_path / "server.sock")
+
+    async def session():
+        server = DecodeServer(**options)
+        serving = asyncio.create_task(server.serve(socket_path))
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if (tmp_path / "server.sock").exists():
+                    break
+            responses = await asyncio.gather(*[request(socket_path, None, None, message) for message in requests])
+            await asyncio.sleep(options.get("idle_timeout", 0) * 4)
+            return responses, dict(server.batchers)
+        finally:
+            serving.cancel()
+            server.close()
+
+    return asyncio.run(session())
+
+
+def test_decode_and_score_match_sequential(tmp_path):
+    rng = np.random.default_rng(0)
+    sequences = ["".join(rng.choice(list("abc"), int(rng.integers(1, 60)))) for _ in range(20)]
+    messages = [{"id": i, "op": op, "model": MODEL, "sequence": sequence}
+                for i, sequence in enumerate(sequences) for op in ("decode", "score")]
+    responses, _ = run_server(tmp_path, messages)
+    model = inline_model(MODEL)
+    for message, response in zip(messages, responses):
+        assert response["id"] == message["id"]
+        encoded = model.encode(message["sequence"])
+        if message["op"] == "decode":
+            best_path, score = viterbi_log(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix)
+            assert response["path"] == model.decode_states(best_path)
+            assert response["log_probability"] == pytest.approx(score, rel=1e-12)
+        else:
+            scales = forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1]
+            assert response["log_probability"] == pytest.approx(log_probability(scales), rel=1e-9)
+
+def test_posterior_matches_sequential(tmp_path):
+    rng = np.random.default_rng(1)
+    sequences = ["".join(rng.choice(list("abc"), int(rng.integers(1, 60)))) for _ in range(20)]
+    messages = [{"id": i, "op": "posterior", "model": MODEL, "sequence": sequence}
+                for i, sequence in enumerate(sequences)]
+    responses, _ = run_server(tmp_path, messages)
+    model = inline_model(MODEL)
+    for message, response in zip(messages, responses):
+        path, confidence = compute_posterior_path(message["sequence"], None, None, None, None, None, model)
+        assert response["path"] == path
+        assert np.allclose(response["confidence"], confidence, rtol=1e-12)
+
+def test_bad_requests_answer_errors(tmp_path):
+    messages = [{"id": 1, "op": "decode", "model": MODEL, "sequence": "abz"},
+                {"id": 2, "op": "decode", "model": "missing", "sequence": "ab"},
+                {"id": 3, "op": "unknown"}]
+    responses, _ = run_server(tmp_path, messages)
+    assert all("error" in response for response in responses)
+
+def test_idle_batchers_are_dropped(tmp_path):
+    messages = [{"id": 1, "op": "decode", "model": MODEL, "sequence": "abc"}]
+    responses, batchers = run_server(tmp_path, messages, idle_timeout=0.05)
+    assert "path" in responses[0]
+    assert batchers == {}
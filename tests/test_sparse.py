@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from compiled import compile_model
+from prob_path import forward, log_probability
+from viterbi import viterbi_log
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_sparse_kernels_match_dense(seed):
+    rng = np.random.default_rng(seed)
+    n_states = int(rng.integers(2, 40))
+    state_matrix = rng.random((n_states, n_states)) * (rng.random((n_states, n_states)) < 0.15)
+    state_matrix[np.arange(n_states), rng.integers(0, n_states, n_states)] += 0.5
+    state_matrix /= state_matrix.sum(axis=1, keepdims=True)
+    emission_matrix = rng.dirichlet(np.ones(4), n_states)
+    dense = compile_model(state_matrix, emission_matrix, sparse=False)
+    sparse = compile_model(state_matrix, emission_matrix, sparse=True)
+    encoded = rng.integers(0, 4, 300)
+    best_path, score = viterbi_log(encoded, dense.log_start, dense.viterbi_transitions, dense.log_emission_matrix)
+    sparse_path, sparse_score = viterbi_log(encoded, sparse.log_start, sparse.viterbi_transitions,
+                                            sparse.log_emission_matrix, symbol_scores=sparse.symbol_scores)
+    assert np.array_equal(sparse_path, best_path)
+    assert sparse_score == pytest.approx(score, rel=1e-12)
+    dense_scales = forward(encoded, dense.start, dense.forward_transitions, None, dense.emission_cols)[1]
+    sparse_scales = forward(encoded, sparse.start, sparse.forward_transitions, None, sparse.emission_cols)[1]
+    assert log_probability(sparse_scales) == pytest.approx(log_probability(dense_scales), rel=1e-12)
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from prob_path import forward, forward_stream, log_probability
+from streaming import WHITESPACE, EncodedText, read_alignment_rows, read_hmm_input, translate, translation_table
+from viterbi import read_input, viterbi_log, viterbi_stream_log
+
+
+def chunks(encoded, rng):
+    bounds = np.sort(rng.integers(0, len(encoded) + 1, 5))
+    return np.split(encoded, bounds)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_stream_matches_whole_sequence(seed, random_hmm):
+    rng = np.random.default_rng(seed)
+    model, encoded = random_hmm(rng, int(rng.integers(1, 5)), 3, int(rng.integers(1, 400)))
+    best_path, score = viterbi_log(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix)
+    pieces = viterbi_stream_log(chunks(encoded, rng), model.log_start, model.log_state_matrix,
+                                model.log_emission_matrix)
+    assert np.array_equal(np.concatenate(list(pieces)), best_path)
+    # A fixed lag commits columns early, so the path is only required to be complete.
+    lagged = viterbi_stream_log(chunks(encoded, rng), model.log_start, model.log_state_matrix,
+                                model.log_emission_matrix, max_lag=8)
+    assert len(np.concatenate(list(lagged))) == len(encoded)
+    log_prob = forward_stream(chunks(encoded, rng), model.start, model.state_matrix, None, model.emission_cols)
+    scales = forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1]
+    assert log_prob == pytest.approx(log_probability(scales), rel=1e-12)
+
+
+def write_bytes(tmp_path, text, newline):
+    path = tmp_path / "input.txt"
+    path.write_bytes(text.replace("\n", newline).encode("latin-1"))
+    return path
+
+HMM_INPUT = """xyzzyxxyzyzxyxzz
+--------
+x y z
+--------
+A B
+--------
+	A	B
+A	0.641	0.359
+B	0.729	0.271
+--------
+	x	y	z
+A	0.117	0.691	0.192
+B	0.097	0.42	0.483
+"""
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("chunk_size", [1, 3, 5, 1 << 20])
+def test_read_hmm_input_matches_read_input(tmp_path, monkeypatch, newline, chunk_size):
+    path = write_bytes(tmp_path, HMM_INPUT, newline)
+    monkeypatch.chdir(tmp_path)
+    emission_path, *rest = read_hmm_input(str(path), chunk_size)
+    expected_path, *expected_rest = read_input()
+    for value, expected in zip(rest, expected_rest):
+        assert np.array_equal(value, expected) if isinstance(value, np.ndarray) else value == expected
+    codes = emission_path.to_array()
+    assert codes.dtype == np.uint8
+    assert "".join(rest[0][i] for i in codes) == expected_path
+    assert all(len(chunk) <= chunk_size for chunk in emission_path)
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64])
+def test_encoded_text_skips_line_breaks(tmp_path, newline, chunk_size):
+    rng = np.random.default_rng(chunk_size)
+    symbols = rng.choice(list("ACGT"), 200)
+    lines = ["".join(symbols[i:i + 30]) for i in range(0, len(symbols), 30)]
+    path = write_bytes(tmp_path, "\n".join(lines) + "\n\n", newline)
+    text = EncodedText(str(path), {symbol: i for i, symbol in enumerate("ACGT")}, chunk_size=chunk_size)
+    assert np.array_equal(text.to_array(), ["ACGT".index(symbol) for symbol in symbols])
+    # Each pass re-reads the file, as the callable form used by baum_welch does.
+    assert np.array_equal(np.concatenate(list(text())), text.to_array())
+
+def test_encoded_text_rejects_unknown_symbols(tmp_path):
+    path = write_bytes(tmp_path, "ACGTN\n", "\n")
+    text = EncodedText(str(path), {symbol: i for i, symbol in enumerate("ACGT")}, chunk_size=2)
+    with pytest.raises(KeyError, match="N"):
+        text.to_array()
+    # A byte range that stops before the unknown symbol reads fine.
+    assert np.array_equal(EncodedText(str(path), {"A": 0, "C": 1, "G": 2, "T": 3}, 0, 4).to_array(), [0, 1, 2, 3])
+
+def test_translation_table_symbol_limit():
+    symbols = [chr(i) for i in range(256) if i not in WHITESPACE]
+    table = translation_table({symbol: i for i, symbol in enumerate(symbols)})
+    raw = np.frombuffer("".join(symbols).encode("latin-1"), dtype=np.uint8)
+    assert np.array_equal(translate(raw, table), np.arange(len(symbols)))
+    with pytest.raises(ValueError):
+        translation_table({chr(i): i for i in range(255)})
+
+ALIGNMENT_INPUT = """0.35 0.01
+--------
+A C G T
+--------
+AC-GTA-CGT
+
+A--GTACCGT
+   
+-CAGT-ACGT
+ACCGTAAC-T
+
+"""
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("chunk_size", [1, 4, 11, 25, 1 << 20])
+def test_read_alignment_rows(tmp_path, newline, chunk_size):
+    # Chunks of 1 and 4 bytes are shorter than a row; 11 and 25 split rows and blank lines.
+    path = write_bytes(tmp_path, ALIGNMENT_INPUT, newline)
+    rows, alphabet, parameters = read_alignment_rows(str(path), chunk_size)
+    expected = [line for line in ALIGNMENT_INPUT.splitlines()[4:] if line.strip()]
+    assert alphabet == list("ACGT")
+    assert parameters == [0.35, 0.01]
+    assert list(rows) == expected
+    array = rows.to_array()
+    assert array.shape == (4, 10)
+    assert [row.tobytes().decode() for row in array] == expected
+    for block_rows in (1, 3, 4, 10):
+        blocks = list(rows.blocks(block_rows))
+        assert all(len(block) <= block_rows for block in blocks)
+        assert np.array_equal(np.concatenate(blocks), array)
+
+def test_alignment_rows_of_different_lengths(tmp_path):
+    path = write_bytes(tmp_path, "1\n--\nA C\n--\nACA\nAC\n", "\n")
+    rows, _, _ = read_alignment_rows(str(path), 2)
+    with pytest.raises(ValueError):
+        rows.to_array()
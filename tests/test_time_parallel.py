@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from prob_path import forward, log_probability
+from time_parallel import viterbi_scan, forward_scan
+from viterbi import viterbi_log
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_scan_matches_sequential(seed, executor, random_hmm, path_score):
+    rng = np.random.default_rng(seed)
+    model, encoded = random_hmm(rng, int(rng.integers(1, 6)), int(rng.integers(1, 5)), int(rng.integers(1, 400)))
+    n_blocks = int(rng.integers(1, 10))
+    best_path, score = viterbi_log(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix)
+    scan_path, scan_score = viterbi_scan(encoded, model.log_start, model.log_emission_matrix,
+                                         model.symbol_score_array, executor, n_blocks)
+    assert scan_score == pytest.approx(score, rel=1e-9)
+    assert path_score(model, encoded, scan_path) == pytest.approx(score, rel=1e-9)
+    log_prob = log_probability(forward(encoded, model.start, model.state_matrix, None, model.emission_cols)[1])
+    scan_log_prob = forward_scan(encoded, model.start, model.state_matrix, model.emission_cols, executor, n_blocks)
+    assert scan_log_prob == pytest.approx(log_prob, rel=1e-9)
+
+def test_empty_and_single_symbol(executor, random_hmm):
+    model, _ = random_hmm(np.random.default_rng(0), 3, 2, 0)
+    empty_path, _ = viterbi_scan(np.empty(0, dtype=np.intp), model.log_start, model.log_emission_matrix,
+                                 model.symbol_score_array, executor, 4)
+    assert len(empty_path) == 0
+    encoded = np.array([1])
+    path, score = viterbi_scan(encoded, model.log_start, model.log_emission_matrix, model.symbol_score_array,
+                               executor, 4)
+    assert list(path) == list(viterbi_log(encoded, model.log_start, model.log_state_matrix,
+                                          model.log_emission_matrix)[0])
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from prob_path import backward, forward, forward_backward
+from train import baum_welch, accumulate_counts, expected_counts, viterbi_counts
+
+STATES = ["x", "y"]
+EMISSION_TO_INDEX = {"a": 0, "b": 1, "c": 2}
+
+
+def random_sequences(rng, n_sequences, length):
+    return ["".join(rng.choice(list("abc"), length, p=[0.6, 0.3, 0.1])) for _ in range(n_sequences)]
+
+
+@pytest.mark.parametrize("method, expectation", [("baum-welch", expected_counts), ("viterbi", viterbi_counts)])
+def test_likelihood_belongs_to_returned_matrices(method, expectation):
+    rng = np.random.default_rng(3)
+    sequences = random_sequences(rng, 4, 40)
+    state_matrix, emission_matrix, _, _, log_likelihood = baum_welch(
+        sequences, STATES, EMISSION_TO_INDEX, method=method, n_restarts=3, max_iter=5, seed=7)
+    _, _, rescored = accumulate_counts(sequences, EMISSION_TO_INDEX, state_matrix, emission_matrix, expectation)
+    assert log_likelihood == pytest.approx(rescored, rel=1e-12)
+
+def test_viterbi_training_never_returns_a_lower_score():
+    rng = np.random.default_rng(5)
+    sequences = random_sequences(rng, 3, 30)
+    for seed in range(10):
+        initial = rng.dirichlet(np.ones(2), size=2), rng.dirichlet(np.ones(3), size=2)
+        _, _, start_score = accumulate_counts(sequences, EMISSION_TO_INDEX, *initial, viterbi_counts)
+        *_, log_likelihood = baum_welch(sequences, STATES, EMISSION_TO_INDEX, *initial, method="viterbi",
+                                        max_iter=10, seed=seed)
+        assert log_likelihood >= start_score
+
+@pytest.mark.parametrize("block", [1, 2, 7, 1 << 14])
+def test_blocked_expected_counts_match_whole_sequence(block, monkeypatch, random_hmm):
+    rng = np.random.default_rng(block)
+    model, encoded = random_hmm(rng, 3, 4, 50)
+    log_prob, posteriors = forward_backward(encoded, model.start, model.state_matrix, None, model.emission_cols)
+    alpha, scales = forward(encoded, model.start, model.state_matrix, None, model.emission_cols)
+    beta = backward(encoded, scales, model.state_matrix, None, model.emission_cols)
+    expected_transitions = np.zeros((3, 3))
+    for t in range(1, len(encoded)):
+        expected_transitions += np.outer(alpha[t - 1], model.emission_cols[encoded[t]] * beta[t] / scales[t])
+    expected_transitions *= model.state_matrix
+    expected_emissions = np.zeros((3, 4))
+    for t, symbol in enumerate(encoded):
+        expected_emissions[:, symbol] += posteriors[t]
+
+    monkeypatch.setattr("train.BACKWARD_BLOCK", block)
+    transition_counts, emission_counts = np.zeros((3, 3)), np.zeros((3, 4))
+    assert expected_counts(encoded, model, transition_counts, emission_counts) == pytest.approx(log_prob, rel=1e-12)
+    assert np.allclose(transition_counts, expected_transitions, rtol=1e-12, atol=0)
+    assert np.allclose(emission_counts, expected_emissions, rtol=1e-12, atol=0)
+    # Expected counts of a whole sequence add up to its length (minus one for transitions).
+    assert transition_counts.sum() == pytest.approx(len(encoded) - 1, rel=1e-12)
+    assert emission_counts.sum() == pytest.approx(len(encoded), rel=1e-12)
+
+def test_initial_matrices_must_come_together():
+    sequences = random_sequences(np.random.default_rng(0), 2, 10)
+    with pytest.raises(ValueError, match="together"):
+        baum_welch(sequences, STATES, EMISSION_TO_INDEX, state_matrix=np.full((2, 2), 0.5))
+    with pytest.raises(ValueError, match="together"):
+        baum_welch(sequences, STATES, EMISSION_TO_INDEX, emission_matrix=np.full((2, 3), 1 / 3))
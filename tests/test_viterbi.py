@@ -0,0 +1,17 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+from viterbi import viterbi_log, viterbi_checkpointed
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_viterbi_matches_exhaustive_search(seed, random_hmm, path_score):
+    rng = np.random.default_rng(seed)
+    model, encoded = random_hmm(rng, int(rng.integers(1, 4)), 3, int(rng.integers(1, 7)))
+    best = max(path_score(model, encoded, path) for path in product(range(len(model.log_start)), repeat=len(encoded)))
+    for decoder in (viterbi_log, viterbi_checkpointed):
+        best_path, score = decoder(encoded, model.log_start, model.log_state_matrix, model.log_emission_matrix)
+        assert score == pytest.approx(best, rel=1e-12)
+        assert path_score(model, encoded, best_path) == pytest.approx(best, rel=1e-12)
@@ -0,0 +1,211 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from compiled import compile_model
+from viterbi import backpointer_dtype, get_best_path, process_dp_col
+
+
+# One long sequence split in time instead of across records. Column t of Viterbi is
+# v_t = v_t-1 (x) S[x_t] in the (max,+) semiring, and of forward a_t = a_t-1 Q[x_t] with
+# Q[s] = T diag(e_s), so a block of columns acts on the column before it through one
+# K x K transfer matrix, the semiring product of its per-symbol matrices.
+#  1. Every worker folds its block into a transfer matrix (K^3 per column instead of
+#     the sequential K^2, so this pays off for small K).
+#  2. The block entry columns follow in the parent from one vector-matrix product per
+#     block; with one block per worker that is negligible next to the blocks.
+#  3. For Viterbi, every worker reruns its block from its entry column, keeping compact
+#     backpointers in shared memory, and reports the entry state every end state traces
+#     back to. The parent fixes the state at every block boundary from those, and a last
+#     map traces each block back from its end state into a shared path.
+# The entry columns come from a different summation order than the sequential DP, so
+# scores agree to rounding and paths can differ only between near-tied alternatives.
+
+class SharedArrays:
+    # Arrays in shared memory, handed to the workers by spec() instead of being pickled.
+    def __init__(self, layout):
+        self.blocks = {}
+        self.arrays = {}
+        for name, (shape, dtype) in layout.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self.blocks[name] = shared_memory.SharedMemory(create=True, size=size)
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=self.blocks[name].buf)
+
+    def spec(self):
+        return {name: (self.blocks[name].name, array.shape, array.dtype.str) for name, array in self.arrays.items()}
+
+    def close(self):
+        # Views into the blocks must be gone before they can be closed.
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+@contextmanager
+def attached(spec):
+    blocks = {name: shared_memory.SharedMemory(name=block_name) for name, (block_name, _, _) in spec.items()}
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf) 
+              for name, (_, shape, dtype) in spec.items()}
+    try:
+        yield arrays
+    finally:
+        arrays.clear()
+        for block in blocks.values():
+            block.close()
+
+
+def viterbi_block_transfer(task):
+    spec, start, stop, symbol_scores = task
+    with attached(spec) as arrays:
+        return fold_transfer(arrays["encoded"][start:stop], symbol_scores)
+
+def fold_transfer(encoded, symbol_scores):
+    transfer = symbol_scores[encoded[0]]
+    for symbol in encoded[1:].tolist():
+        transfer = (transfer[:, :, None] + symbol_scores[symbol][None, :, :]).max(axis=1)
+    return transfer
+
+def viterbi_block_backpointers(task):
+    # Only the entry state of every end state and the block's last DP column come back;
+    # the backpointers stay in shared memory for viterbi_block_traceback.
+    spec, start, stop, entry_col, symbol_scores = task
+    with attached(spec) as arrays:
+        return block_backpointers(arrays["encoded"][start:stop], arrays["backtrack_graph"][start:stop],
+                                  entry_col, symbol_scores)
+
+def block_backpointers(encoded, backtrack_graph, entry_col, symbol_scores):
+    # Row i maps the states of column i to column i-1, row 0 to the column before the block.
+    dp_col = entry_col[:, None]
+    for i, symbol in enumerate(encoded.tolist()):
+        dp_col = process_dp_col(dp_col, symbol_scores[symbol], backtrack_graph, i)
+    states = np.arange(len(entry_col))
+    for i in range(len(encoded) - 1, -1, -1):
+        states = backtrack_graph[i, states]
+    return states.astype(np.intp), dp_col[:, 0]
+
+def viterbi_block_traceback(task):
+    spec, start, stop, end_state = task
+    with attached(spec) as arrays:
+        arrays["path"][start:stop] = get_best_path(arrays["backtrack_graph"][start:stop], end_state)
+
+def forward_block_transfer(task):
+    # Rescaled by its largest entry after every column; the scales are returned in log.
+    encoded, state_matrix, emission_cols = task
+    transfer = np.eye(len(state_matrix))
+    log_scale = 0.0
+    for symbol in encoded.tolist():
+        transfer = (transfer @ state_matrix) * emission_cols[symbol]
+        scale = transfer.max()
+        if scale <= 0:
+            return transfer, -np.inf
+        transfer /= scale
+        log_scale += np.log(scale)
+    return transfer, log_scale
+
+
+def block_ranges(length, n_blocks):
+    # Columns 1 .. length-1; column 0 is the start column and stays in the parent.
+    bounds = np.linspace(1, length, min(n_blocks, max(length - 1, 1)) + 1).astype(np.intp)
+    return [(start, stop) for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()) if stop > start]
+
+def compact_codes(encoded):
+    # Forward blocks are pickled to the workers and Viterbi copies the whole sequence into
+    # shared memory, so store the symbols as narrow as they fit.
+    return encoded.astype(np.uint8) if len(encoded) and encoded.max() < 256 else encoded
+
+def viterbi_scan(encoded, log_start, log_emission_matrix, symbol_scores, executor, n_blocks):
+    # symbol_scores is the dense (|Sigma|, K, K) CompiledModel.symbol_score_array.
+    if len(encoded) == 0:
+        return np.empty(0, dtype=np.intp), 0.0
+    n_states = len(log_start)
+    first_col = log_start + log_emission_matrix[:, encoded[0]]
+    ranges = block_ranges(len(encoded), n_blocks)
+    if not ranges:
+        best_final_state = int(np.argmax(first_col))
+        return np.array([best_final_state]), float(first_col[best_final_state])
+    codes = compact_codes(encoded)
+    layout = {"encoded": (codes.shape, codes.dtype),
+              "backtrack_graph": ((len(encoded), n_states), backpointer_dtype(n_states)),
+              "path": ((len(encoded),), np.intp)}
+    with SharedArrays(layout) as shared:
+        shared.arrays["encoded"][...] = codes
+        spec = shared.spec()
+        transfers = list(executor.map(viterbi_block_transfer, 
+                                      [(spec, start, stop, symbol_scores) for start, stop in ranges]))
+        entry_cols = [first_col]
+        for transfer in transfers[:-1]:
+            entry_cols.append((entry_cols[-1][:, None] + transfer).max(axis=0))
+        results = list(executor.map(viterbi_block_backpointers,
+                                    [(spec, start, stop, entry_col, symbol_scores) 
+                                     for (start, stop), entry_col in zip(ranges, entry_cols)]))
+        final_col = results[-1][1]
+        end_states = [int(np.argmax(final_col))]
+        for entry_states, _ in results[:0:-1]:
+            end_states.append(int(entry_states[end_states[-1]]))
+        end_states.reverse()
+        list(executor.map(viterbi_block_traceback, 
+                          [(spec, start, stop, end_state) for (start, stop), end_state in zip(ranges, end_states)]))
+        best_path = np.array(shared.arrays["path"])
+    best_path[0] = results[0][0][end_states[0]]
+    return best_path, float(final_col.max())
+
+def forward_scan(encoded, start, state_matrix, emission_cols, executor, n_blocks):
+    if len(encoded) == 0:
+        return 0.0
+    dp_col = start * emission_cols[encoded[0]]
+    blocks = [compact_codes(encoded[start_col:stop]) for start_col, stop in block_ranges(len(encoded), n_blocks)]
+    transfers = list(executor.map(forward_block_transfer, [(block, state_matrix, emission_cols) for block in blocks]))
+    log_prob = 0.0
+    for transfer, log_scale in [(None, 0.0)] + transfers:
+        if transfer is not None:
+            dp_col = dp_col @ transfer
+        scale = dp_col.sum()
+        if scale <= 0 or not np.isfinite(log_scale):
+            return -np.inf
+        log_prob += np.log(scale) + log_scale
+        dp_col = dp_col / scale
+    return float(log_prob)
+
+
+def viterbi_time_parallel(emission_path,
+                          state_matrix,
+                          emission_matrix,
+                          state_to_index,
+                          emission_to_index,
+                          states,
+                          workers=None,
+                          n_blocks=None,
+                          model=None) -> str:
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        best_path, _ = viterbi_scan(model.encode(emission_path), model.log_start, model.log_emission_matrix,
+                                    model.symbol_score_array, executor, n_blocks or workers)
+    return model.decode_states(best_path)
+
+def compute_log_path_probability_time_parallel(emission_path,
+                                               state_matrix,
+                                               emission_matrix,
+                                               state_to_index,
+                                               emission_to_index,
+                                               states,
+                                               workers=None,
+                                               n_blocks=None,
+                                               model=None) -> float:
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return forward_scan(model.encode(emission_path), model.start, model.state_matrix, model.emission_cols,
+                            executor, n_blocks or workers)
@@ -0,0 +1,134 @@
+import sys
+
+import numpy as np
+
+from compiled import CompiledModel
+from instrument import capture
+from model_io import write_matrix
+from prob_path import forward, backward, log_probability
+from viterbi import viterbi_log, read_input
+
+
+# Positions per block of the backward pass in expected_counts.
+BACKWARD_BLOCK = 1 << 14
+
+
+def baum_welch(sequences,
+               states,
+               emission_to_index,
+               state_matrix=None,
+               emission_matrix=None,
+               method="baum-welch",
+               n_restarts=1,
+               max_iter=100,
+               tol=1e-6,
+               seed=None):
+    # sequences is a list, or a zero-argument callable returning a fresh iterator so
+    # every EM pass can stream the data from disk again.
+    if (state_matrix is None) != (emission_matrix is None):
+        raise ValueError("state_matrix and emission_matrix must be given together")
+    rng = np.random.default_rng(seed)
+    state_to_index = {state: i for i, state in enumerate(states)}
+    n_states, n_emissions = len(states), len(emission_to_index)
+    best = None
+    for restart in range(n_restarts):
+        if restart == 0 and state_matrix is not None:
+            initial = (np.asarray(state_matrix, dtype=np.float64), np.asarray(emission_matrix, dtype=np.float64))
+        else:
+            initial = (random_stochastic(n_states, n_states, rng), random_stochastic(n_states, n_emissions, rng))
+        result = train(sequences, emission_to_index, *initial, method, max_iter, tol)
+        if best is None or result[2] > best[2]:
+            best = result
+    trained_state_matrix, trained_emission_matrix, log_likelihood = best
+    return trained_state_matrix, trained_emission_matrix, state_to_index, emission_to_index, log_likelihood
+
+def train(sequences, emission_to_index, state_matrix, emission_matrix, method, max_iter, tol):
+    expectation = {"baum-welch": expected_counts, "viterbi": viterbi_counts}[method]
+    # Every score is kept with the matrices it was computed from, so the last pass only
+    # scores. Viterbi training can score lower than the pass before; the previous
+    # matrices are returned then rather than treating the drop as convergence. (Baum-Welch
+    # never decreases except by rounding, and runs all max_iter passes with tol=-inf.)
+    best = None
+    for iteration in range(max_iter + 1):
+        transition_counts, emission_counts, log_likelihood = accumulate_counts(
+            sequences, emission_to_index, state_matrix, emission_matrix, expectation)
+        if method == "viterbi" and best is not None and log_likelihood < best[2]:
+            break
+        converged = best is not None and log_likelihood - best[2] < tol
+        best = state_matrix, emission_matrix, log_likelihood
+        if converged or iteration == max_iter:
+            break
+        state_matrix = normalize_counts(transition_counts, state_matrix)
+        emission_matrix = normalize_counts(emission_counts, emission_matrix)
+    return best
+
+def accumulate_counts(sequences, emission_to_index, state_matrix, emission_matrix, expectation):
+    # The matrices change every pass, so the model is compiled here rather than cached.
+    model = CompiledModel(state_matrix, emission_matrix, emission_to_index=emission_to_index)
+    n_states, n_emissions = emission_matrix.shape
+    transition_counts = np.zeros((n_states, n_states))
+    emission_counts = np.zeros((n_states, n_emissions))
+    log_likelihood = 0.0
+    for sequence in (sequences() if callable(sequences) else sequences):
+        encoded = model.encode(sequence)
+        if len(encoded) == 0:
+            continue
+        log_likelihood += expectation(encoded, model, transition_counts, emission_counts)
+    return transition_counts, emission_counts, log_likelihood
+
+def expected_counts(encoded, model, transition_counts, emission_counts):
+    # Memory per sequence is the T x K alpha plus BACKWARD_BLOCK x K of beta: the backward
+    # pass runs a block at a time from the end and each block is folded into the counts
+    # before the next, so beta and the posteriors are never held whole.
+    state_matrix, emission_matrix = model.state_matrix, model.emission_matrix
+    alpha, scales = forward(encoded, model.start, model.forward_transitions, emission_matrix, model.emission_cols)
+    stop, end = len(encoded), None
+    while stop > 0:
+        start = max(stop - BACKWARD_BLOCK, 0)
+        if end is None:
+            beta = backward(encoded[start:stop], scales[start:stop], model.forward_transitions, emission_matrix,
+                            model.emission_cols)
+        else:
+            beta = backward(encoded[start:stop + 1], scales[start:stop + 1], model.forward_transitions,
+                            emission_matrix, model.emission_cols, end)[:-1]
+        np.add.at(emission_counts.T, encoded[start:stop], alpha[start:stop] * beta)
+        # Summed over t: alpha[t-1, k] * T[k, l] * e_l(x_t) * beta[t, l] / c_t.
+        first = max(start, 1)
+        weighted_next = model.emission_cols[encoded[first:stop]] * beta[first - start:] / scales[first:stop, None]
+        transition_counts += (alpha[first - 1:stop - 1].T @ weighted_next) * state_matrix
+        stop, end = start, beta[0]
+    return log_probability(scales)
+
+def viterbi_counts(encoded, model, transition_counts, emission_counts):
+    n_states, n_emissions = model.emission_matrix.shape
+    best_path, score = viterbi_log(encoded, model.log_start, model.viterbi_transitions, model.log_emission_matrix,
+                                   symbol_scores=model.symbol_scores)
+    transition_counts += np.bincount(best_path[:-1] * n_states + best_path[1:],
+                                     minlength=n_states * n_states).reshape(n_states, n_states)
+    emission_counts += np.bincount(best_path * n_emissions + encoded,
+                                   minlength=n_states * n_emissions).reshape(n_states, n_emissions)
+    return score
+
+def normalize_counts(counts, previous):
+    # Rows that collected no counts keep their previous distribution.
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, counts / totals, previous)
+
+def random_stochastic(n_rows, n_cols, rng):
+    return rng.dirichlet(np.ones(n_cols), size=n_rows)
+
+
+if __name__ == "__main__":
+    with capture():
+        # Usage: python train.py [iterations] [baum-welch|viterbi]
+        # Reads the viterbi.py input.txt layout and uses its matrices as the starting point.
+        iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+        method = sys.argv[2] if len(sys.argv) > 2 else "baum-welch"
+        emission_path, emissions, states, state_matrix, emission_matrix, state_to_index, emission_to_index = read_input()
+        state_matrix, emission_matrix, _, _, _ = baum_welch([emission_path], states, emission_to_index,
+                                                            state_matrix, emission_matrix, method=method,
+                                                            max_iter=iterations, tol=-np.inf)
+        write_matrix(state_matrix, states, states, sys.stdout)
+        print("--------")
+        write_matrix(emission_matrix, states, emissions, sys.stdout)
@@ -1,5 +1,13 @@
+import os
+from functools import lru_cache, partial
+
 import numpy as np
 
+from compiled import compile_model, transition_cells, SparseTransitions
+from compiled import SymbolScores
+from instrument import capture, phase, phased, tally
+from kernels import use_jit, viterbi_kernel
+
 
 
 def viterbi(emission_path, 
@@ -8,66 +16,333 @@ def viterbi(emission_path,
             state_to_index, 
             emission_to_index,
             states,
-            emissions) -> str:
-    backtrack_graph = {}
-    dp_array = {}
-    equal_prob = 1.0 / len(states)
-    for i, emission in enumerate(emission_path):
-        process_dp_col(state_matrix, emission_matrix, state_to_index, 
-                       emission_to_index, states, backtrack_graph, dp_array, 
-                       equal_prob, i, emission)
-    best_final_state = get_best_final_state(emission_path, states, dp_array)
-    
-    best_path = get_best_path(emission_path, backtrack_graph, best_final_state)
+            emissions,
+            checkpointed=False,
+            model=None) -> str:
+    # model is a compiled.CompiledModel; without one the matrices are compiled (and cached) here.
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    encoded = model.encode(emission_path)
+    decoder = viterbi_checkpointed if checkpointed else viterbi_log
+    best_path, _ = decoder(encoded, model.log_start, 
+                           model.viterbi_transitions, 
+                           model.log_emission_matrix,
+                           symbol_scores=model.symbol_scores)
+    with phase("output"):
+        return model.decode_states(best_path)
 
-    return best_path
+def viterbi_log(encoded, log_start, log_state_matrix, log_emission_matrix, symbol_scores=None):
+    # log_state_matrix is a dense K x K array or a SparseTransitions; see column_kernels.
+    n_states = len(log_start)
+    if len(encoded) == 0:
+        return np.empty(0, dtype=np.intp), 0.0
+    tally("columns", len(encoded))
+    tally("cells", (len(encoded) - 1) * transition_cells(log_state_matrix))
+    backtrack_graph = np.zeros((len(encoded), n_states), dtype=backpointer_dtype(n_states))
+    if symbol_scores is None:
+        symbol_scores = get_symbol_scores(log_state_matrix, log_emission_matrix)
+    if use_jit() and not isinstance(log_state_matrix, SparseTransitions):
+        # The kernel does its own traceback, so it is all timed as columns.
+        with phase("columns"):
+            best_path, score = viterbi_kernel(encoded, log_start, log_emission_matrix, 
+                                              score_stack(symbol_scores), backtrack_graph)
+        return best_path, float(score)
+    # The NumPy loop costs a few array calls per column whatever K is (~8us here), so for
+    # K below ~32 it is only 1-40x faster than the old dict decoder; the 100x target on
+    # long inputs needs HMM_KERNEL_BACKEND=numba. "benchmark.py viterbi" measures both.
+    process, _ = column_kernels(log_state_matrix)
+    dp_col = (log_start + log_emission_matrix[:, encoded[0]])[:, None]
+    with phase("columns"):
+        for i, symbol in enumerate(encoded[1:].tolist(), start=1):
+            dp_col = process(dp_col, symbol_scores[symbol], backtrack_graph, i)
+    dp_col = dp_col[:, 0]
+    best_final_state = get_best_final_state(dp_col)
+    best_path = get_best_path(backtrack_graph, best_final_state)
+    return best_path, float(dp_col[best_final_state])
 
-def get_best_path(emission_path, backtrack_graph, best_final_state):
-    best_path = best_final_state
+def viterbi_checkpointed(encoded, log_start, log_state_matrix, log_emission_matrix, segment_length=None, 
+                         symbol_scores=None):
+    # Keeps only every segment_length-th DP column (sqrt(T) by default) and recomputes
+    # one segment of backpointers at a time during traceback, last segment first.
+    length = len(encoded)
+    n_states = len(log_start)
+    if length == 0:
+        return np.empty(0, dtype=np.intp), 0.0
+    segment_length = segment_length or int(np.ceil(np.sqrt(length)))
+    # The traceback recomputes every column once more; those count under traceback.
+    tally("columns", length)
+    tally("cells", (length - 1) * transition_cells(log_state_matrix))
+    if symbol_scores is None:
+        symbol_scores = get_symbol_scores(log_state_matrix, log_emission_matrix)
+    process, advance = column_kernels(log_state_matrix)
+    checkpoints = []
+    dp_col = (log_start + log_emission_matrix[:, encoded[0]])[:, None]
+    with phase("columns"):
+        for seg_start in range(0, length, segment_length):
+            checkpoints.append(dp_col)
+            seg_end = min(seg_start + segment_length, length)
+            for symbol in encoded[seg_start+1:seg_end].tolist():
+                dp_col = advance(dp_col, symbol_scores[symbol])
+            if seg_end < length:
+                dp_col = advance(dp_col, symbol_scores[encoded[seg_end]])
+    dp_col = dp_col[:, 0]
+    best_final_state = get_best_final_state(dp_col)
+
+    best_path = np.empty(length, dtype=backpointer_dtype(n_states))
     best_prev_state = best_final_state
+    backtrack_graph = np.zeros((segment_length + 1, n_states), dtype=backpointer_dtype(n_states))
+    with phase("traceback"):
+        for segment, seg_start in reversed(list(enumerate(range(0, length, segment_length)))):
+            # Columns seg_start+1 .. last depend only on this segment's checkpoint; the state
+            # at column last is already known from the segment after it.
+            last = min(seg_start + segment_length, length - 1)
+            segment_col = checkpoints[segment]
+            for i, symbol in enumerate(encoded[seg_start+1:last+1].tolist(), start=1):
+                segment_col = process(segment_col, symbol_scores[symbol], backtrack_graph, i)
+            best_path[last] = best_prev_state
+            for i in range(last - seg_start, 0, -1):
+                best_prev_state = backtrack_graph[i, best_prev_state]
+                best_path[seg_start + i - 1] = best_prev_state
+    return best_path, float(dp_col[best_final_state])
+
+def viterbi_nbest(emission_path, 
+                  state_matrix, 
+                  emission_matrix, 
+                  state_to_index, 
+                  emission_to_index,
+                  states,
+                  n_best=5,
+                  model=None):
+    # The n_best highest-scoring state paths, best first, as (path, log score) pairs.
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    encoded = model.encode(emission_path)
+    paths, scores = viterbi_nbest_log(encoded, model.log_start, model.log_emission_matrix, 
+                                      model.symbol_score_array, n_best)
+    with phase("output"):
+        return [(model.decode_states(path), score) for path, score in zip(paths, scores.tolist())]
+
+def viterbi_nbest_log(encoded, log_start, log_emission_matrix, symbol_scores, n_best):
+    # List Viterbi: dp_cols[k, r] is the r-th best score of a path ending in state k, kept
+    # in a fixed (K, N) array. Every column ranks the K*N extended candidates per state
+    # at once, so the cost is K^2 * N per column with no per-cell heaps.
+    n_states = len(log_start)
+    if len(encoded) == 0:
+        return [np.empty(0, dtype=np.intp)], np.zeros(1)
+    tally("columns", len(encoded))
+    tally("cells", (len(encoded) - 1) * n_states * n_states * n_best)
+    backtrack_graph = np.zeros((len(encoded), n_states, n_best), dtype=np.int32)
+    dp_cols = np.full((n_states, n_best), -np.inf)
+    dp_cols[:, 0] = log_start + log_emission_matrix[:, encoded[0]]
+    with phase("columns"):
+        for i, symbol in enumerate(encoded[1:].tolist(), start=1):
+            # candidates[k * N + r, j]: the r-th path into k, extended to j.
+            candidates = (dp_cols[:, :, None] + symbol_scores[symbol][:, None, :]).reshape(n_states * n_best, n_states)
+            ranked = top_rows(candidates, n_best)
+            backtrack_graph[i] = ranked.T
+            dp_cols = np.take_along_axis(candidates, ranked, axis=0).T
+    ranked = np.argsort(-dp_cols.ravel(), kind="stable")[:n_best]
+    scores = dp_cols.ravel()[ranked]
+    # Fewer than n_best paths exist when some candidates are impossible.
+    ranked = ranked[np.isfinite(scores)] if np.isfinite(scores[0]) else ranked[:1]
+    paths = [get_nbest_path(backtrack_graph, entry, n_best) for entry in ranked.tolist()]
+    return paths, dp_cols.ravel()[ranked]
+
+def top_rows(candidates, n_best):
+    # Row indices of the n_best largest entries of every column, largest first and ties
+    # to the lower row. Past a few hundred rows a partial partition beats a full sort.
+    if len(candidates) <= max(n_best, 128):
+        return np.argsort(-candidates, axis=0, kind="stable")[:n_best]
+    top = np.argpartition(-candidates, n_best - 1, axis=0)[:n_best]
+    order = np.lexsort((top, -np.take_along_axis(candidates, top, axis=0)), axis=0)
+    return np.take_along_axis(top, order, axis=0)
 
-    for i in range(len(emission_path) - 1, 0, -1):
-        key = (i, best_prev_state)
-        best_prev_state = backtrack_graph[key]
-        best_path = best_prev_state + best_path
+@phased("traceback")
+def get_nbest_path(backtrack_graph, entry, n_best):
+    # entry is state * n_best + rank; backpointers use the same flat encoding.
+    best_path = np.empty(len(backtrack_graph), dtype=np.intp)
+    for i in range(len(backtrack_graph) - 1, -1, -1):
+        state, rank = divmod(entry, n_best)
+        best_path[i] = state
+        entry = int(backtrack_graph[i, state, rank])
     return best_path
 
-def get_best_final_state(emission_path, states, dp_array):
-    curr_max = 0
-    best_final_state = None
-    last_index = len(emission_path) - 1
-    for state in states:
-        if dp_array[last_index][state] > curr_max:
-            curr_max = dp_array[last_index][state]
-            best_final_state = state
-    return best_final_state
-
-def process_dp_col(state_matrix, emission_matrix, state_to_index, emission_to_index, states, backtrack_graph, dp_array, equal_prob, i, emission):
-    dp_array[i] = {}
-    for state in states:
-        if i == 0:
-            dp_array[i][state] = equal_prob * \
-                emission_matrix[state_to_index[state], emission_to_index[emission]]
-        else:
-            max_prob = 0
-            max_prev_state = None
-            for prev_state in states:
-                prob = dp_array[i-1][prev_state] * \
-                    state_matrix[state_to_index[prev_state], state_to_index[state]] * \
-                    emission_matrix[state_to_index[state], emission_to_index[emission]]
-                if prob > max_prob:
-                    max_prob = prob
-                    max_prev_state = prev_state
-            dp_array[i][state] = max_prob
-            backtrack_graph[(i, state)] = max_prev_state
+def viterbi_stream(source, 
+                   state_matrix, 
+                   emission_matrix, 
+                   state_to_index, 
+                   emission_to_index,
+                   states,
+                   max_lag=None,
+                   chunk_size=1 << 16,
+                   model=None):
+    if model is None:
+        model = compile_model(state_matrix, emission_matrix, state_to_index, emission_to_index)
+    encoded_chunks = (model.encode(chunk) for chunk in iter_emission_chunks(source, chunk_size))
+    for best_path in viterbi_stream_log(encoded_chunks, model.log_start, 
+                                        model.viterbi_transitions, 
+                                        model.log_emission_matrix, 
+                                        max_lag,
+                                        symbol_scores=model.symbol_scores):
+        yield model.decode_states(best_path)
+
+def viterbi_stream_log(encoded_chunks, log_start, log_state_matrix, log_emission_matrix, max_lag=None, 
+                       symbol_scores=None):
+    # Backpointers are kept only for columns whose state is still undecided. Once every
+    # surviving state traces back to the same ancestor, the path up to it is final.
+    n_states = len(log_start)
+    if symbol_scores is None:
+        symbol_scores = get_symbol_scores(log_state_matrix, log_emission_matrix)
+    process, _ = column_kernels(log_state_matrix)
+    backtrack_graph = np.zeros((1024, n_states), dtype=backpointer_dtype(n_states))
+    n_pending = 0
+    dp_col = None
+    for encoded in encoded_chunks:
+        # No phase timers here: the consumer runs between yields.
+        tally("columns", len(encoded))
+        tally("cells", len(encoded) * transition_cells(log_state_matrix))
+        for symbol in encoded.tolist():
+            if dp_col is None:
+                dp_col = (log_start + log_emission_matrix[:, symbol])[:, None]
+                n_pending = 1
+                continue
+            if n_pending == len(backtrack_graph):
+                backtrack_graph = np.concatenate([backtrack_graph, np.zeros_like(backtrack_graph)])
+            dp_col = process(dp_col, symbol_scores[symbol], backtrack_graph, n_pending)
+            n_pending += 1
+            if max_lag is not None and n_pending > 2 * max_lag:
+                best_final_state = get_best_final_state(dp_col[:, 0])
+                n_final = n_pending - max_lag
+                yield trace_pending(backtrack_graph, n_pending, best_final_state)[:n_final]
+                n_pending = drop_pending(backtrack_graph, n_pending, n_final)
+        if n_pending == 0:
+            continue
+        n_final, coalesced_state = find_coalescence(backtrack_graph, n_pending, dp_col[:, 0])
+        if n_final:
+            yield trace_pending(backtrack_graph, n_final, coalesced_state)
+            n_pending = drop_pending(backtrack_graph, n_pending, n_final)
+    if n_pending:
+        yield trace_pending(backtrack_graph, n_pending, get_best_final_state(dp_col[:, 0]))
+
+def find_coalescence(backtrack_graph, n_pending, dp_col):
+    survivors = np.flatnonzero(np.isfinite(dp_col))
+    if len(survivors) == 0:
+        survivors = np.arange(len(dp_col))
+    for i in range(n_pending - 1, 0, -1):
+        if survivors.min() == survivors.max():
+            return i + 1, int(survivors[0])
+        survivors = backtrack_graph[i, survivors]
+    if survivors.min() == survivors.max():
+        return 1, int(survivors[0])
+    return 0, None
+
+def trace_pending(backtrack_graph, n_columns, final_state):
+    return get_best_path(backtrack_graph[:n_columns], final_state)
+
+def drop_pending(backtrack_graph, n_pending, n_final):
+    # Column n_final becomes the first pending column; its backpointers point into
+    # already emitted states and are never followed again.
+    backtrack_graph[:n_pending - n_final] = backtrack_graph[n_final:n_pending]
+    return n_pending - n_final
+
+def iter_emission_chunks(source, chunk_size=1 << 16):
+    if isinstance(source, str):
+        yield "".join(source.split())
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield "".join(chunk.split())
+    else:
+        for chunk in source:
+            yield "".join(chunk.split()) if isinstance(chunk, str) else chunk
+
+@phased("traceback")
+def get_best_path(backtrack_graph, best_final_state):
+    best_path = np.empty(len(backtrack_graph), dtype=np.intp)
+    best_prev_state = best_final_state
+    best_path[-1] = best_final_state
+    for i in range(len(backtrack_graph) - 1, 0, -1):
+        best_prev_state = backtrack_graph[i, best_prev_state]
+        best_path[i - 1] = best_prev_state
+    return best_path
 
+def get_best_final_state(dp_col):
+    return int(np.argmax(dp_col))
 
+def process_dp_col(dp_col, col_scores, backtrack_graph, i):
+    scores = dp_col + col_scores
+    # The column's maxima are read off at the argmax rather than found in a second pass.
+    best_states = scores.argmax(axis=0)
+    backtrack_graph[i] = best_states
+    return scores[best_states, state_range(len(best_states))][:, None]
 
+@lru_cache(maxsize=None)
+def state_range(n_states):
+    return np.arange(n_states)
 
+def advance_dp_col(dp_col, col_scores):
+    return (dp_col + col_scores).max(axis=0)[:, None]
 
+def process_sparse_dp_col(transitions, dp_col, edge_scores, backtrack_graph, i):
+    # O(E) instead of O(K^2): score every edge, then take the best edge per target state.
+    # Predecessors are sorted by index, so ties go to the lowest one, as argmax does.
+    backtrack_graph[i] = 0
+    new_col = np.full((transitions.n_states, 1), -np.inf)
+    if transitions.nnz == 0:
+        return new_col
+    scores = dp_col[transitions.sources, 0] + edge_scores
+    best = np.maximum.reduceat(scores, transitions.segment_starts)
+    candidates = np.flatnonzero(scores == np.repeat(best, transitions.segment_lengths))
+    targets = transitions.targets[candidates]
+    first = np.ones(len(candidates), dtype=bool)
+    first[1:] = targets[1:] != targets[:-1]
+    backtrack_graph[i, transitions.reachable] = transitions.sources[candidates[first]]
+    new_col[transitions.reachable, 0] = best
+    return new_col
+
+def advance_sparse_dp_col(transitions, dp_col, edge_scores):
+    new_col = np.full((transitions.n_states, 1), -np.inf)
+    if transitions.nnz == 0:
+        return new_col
+    new_col[transitions.reachable, 0] = np.maximum.reduceat(dp_col[transitions.sources, 0] + edge_scores, 
+                                                            transitions.segment_starts)
+    return new_col
+
+def column_kernels(log_state_matrix):
+    # (step that records backpointers, step that does not) for the transition structure.
+    if isinstance(log_state_matrix, SparseTransitions):
+        return partial(process_sparse_dp_col, log_state_matrix), partial(advance_sparse_dp_col, log_state_matrix)
+    return process_dp_col, advance_dp_col
+
+def score_stack(symbol_scores):
+    # The (|Sigma|, K, K) array for the JIT kernel; a SymbolScores list already holds it.
+    stack = getattr(symbol_scores, "stack", None)
+    return stack if stack is not None else np.asarray(symbol_scores)
+
+def get_symbol_scores(log_state_matrix, log_emission_matrix):
+    # One K x K matrix per symbol: log transition into a state plus that state's log emission.
+    # For a SparseTransitions, one vector of edge scores per symbol instead.
+    if isinstance(log_state_matrix, SparseTransitions):
+        return log_state_matrix.symbol_scores(log_emission_matrix)
+    return SymbolScores(log_state_matrix[None, :, :] + log_emission_matrix.T[:, None, :])
+
+def backpointer_dtype(n_states):
+    if n_states <= np.iinfo(np.int8).max + 1:
+        return np.int8
+    if n_states <= np.iinfo(np.int16).max + 1:
+        return np.int16
+    return np.int32
+
+
+
+
+@phased("parse")
 def read_input():
     with open("input.txt", "rt") as f:
         data = iter(f.readlines())
+        tally("bytes_parsed", os.fstat(f.fileno()).st_size)
 
     emission_path = next(data).strip()
     assert next(data).startswith("-")
@@ -119,13 +394,14 @@ def debug_input_read(read_input):
     print("Emission to Index Mapping:", emission_to_index)
 
 if __name__ == "__main__":
-    emission_path, emissions, states, state_matrix, emission_matrix, state_to_index, emission_to_index = read_input()
-    best_path = viterbi(emission_path, 
-            state_matrix, 
-            emission_matrix, 
-            state_to_index, 
-            emission_to_index,
-            states,
-            emissions)
+    with capture():
+        emission_path, emissions, states, state_matrix, emission_matrix, state_to_index, emission_to_index = read_input()
+        best_path = viterbi(emission_path, 
+                state_matrix, 
+                emission_matrix, 
+                state_to_index, 
+                emission_to_index,
+                states,
+                emissions)
     
-    print(best_path)
\ No newline at end of file
+        print(best_path)
\ No newline at end of file